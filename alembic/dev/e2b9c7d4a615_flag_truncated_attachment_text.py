@@ -0,0 +1,30 @@
+"""Flag truncated attachment text
+
+Revision ID: e2b9c7d4a615
+Revises: c4e7a1d92b3f
+Create Date: 2026-10-18 21:04:12.551870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e2b9c7d4a615"
+down_revision = "c4e7a1d92b3f"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### Alembic commands ###
+    op.add_column(
+        "attachment",
+        sa.Column("truncated", sa.Boolean(), server_default=sa.text("false"), nullable=True),
+    )
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### Alembic commands ###
+    op.drop_column("attachment", "truncated")
+    # ### end Alembic commands ###
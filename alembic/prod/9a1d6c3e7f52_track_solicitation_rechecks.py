@@ -0,0 +1,37 @@
+"""Track solicitation rechecks
+
+Revision ID: 9a1d6c3e7f52
+Revises: 06c9149baecd
+Create Date: 2026-10-18 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "9a1d6c3e7f52"
+down_revision = "06c9149baecd"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### Alembic commands ###
+    op.add_column("solicitations", sa.Column("last_checked_at", sa.DateTime(), nullable=True))
+    op.add_column(
+        "solicitations",
+        sa.Column("recheck_count", sa.Integer(), server_default=sa.text("0"), nullable=True),
+    )
+    op.add_column(
+        "solicitations",
+        sa.Column("recheck_changes", sa.Integer(), server_default=sa.text("0"), nullable=True),
+    )
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### Alembic commands ###
+    op.drop_column("solicitations", "recheck_changes")
+    op.drop_column("solicitations", "recheck_count")
+    op.drop_column("solicitations", "last_checked_at")
+    # ### end Alembic commands ###
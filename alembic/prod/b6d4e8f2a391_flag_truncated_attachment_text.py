@@ -0,0 +1,30 @@
+"""Flag truncated attachment text
+
+Revision ID: b6d4e8f2a391
+Revises: 9a1d6c3e7f52
+Create Date: 2026-10-18 21:04:12.551870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b6d4e8f2a391"
+down_revision = "9a1d6c3e7f52"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### Alembic commands ###
+    op.add_column(
+        "attachment",
+        sa.Column("truncated", sa.Boolean(), server_default=sa.text("false"), nullable=True),
+    )
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### Alembic commands ###
+    op.drop_column("attachment", "truncated")
+    # ### end Alembic commands ###
@@ -0,0 +1,37 @@
+"""Track solicitation rechecks
+
+Revision ID: 5b8f2e6a0d17
+Revises: b0cbeeb30c9b
+Create Date: 2026-10-18 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5b8f2e6a0d17"
+down_revision = "b0cbeeb30c9b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### Alembic commands ###
+    op.add_column("solicitations", sa.Column("last_checked_at", sa.DateTime(), nullable=True))
+    op.add_column(
+        "solicitations",
+        sa.Column("recheck_count", sa.Integer(), server_default=sa.text("0"), nullable=True),
+    )
+    op.add_column(
+        "solicitations",
+        sa.Column("recheck_changes", sa.Integer(), server_default=sa.text("0"), nullable=True),
+    )
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### Alembic commands ###
+    op.drop_column("solicitations", "recheck_changes")
+    op.drop_column("solicitations", "recheck_count")
+    op.drop_column("solicitations", "last_checked_at")
+    # ### end Alembic commands ###
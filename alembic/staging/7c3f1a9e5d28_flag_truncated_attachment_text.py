@@ -0,0 +1,30 @@
+"""Flag truncated attachment text
+
+Revision ID: 7c3f1a9e5d28
+Revises: 5b8f2e6a0d17
+Create Date: 2026-10-18 21:04:12.551870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7c3f1a9e5d28"
+down_revision = "5b8f2e6a0d17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### Alembic commands ###
+    op.add_column(
+        "attachment",
+        sa.Column("truncated", sa.Boolean(), server_default=sa.text("false"), nullable=True),
+    )
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### Alembic commands ###
+    op.drop_column("attachment", "truncated")
+    # ### end Alembic commands ###
@@ -0,0 +1,14 @@
+BEGIN;
+
+-- Running upgrade 3df0b576624f -> c4e7a1d92b3f
+
+ALTER TABLE solicitations ADD COLUMN last_checked_at TIMESTAMP WITHOUT TIME ZONE;
+
+ALTER TABLE solicitations ADD COLUMN recheck_count INTEGER DEFAULT 0;
+
+ALTER TABLE solicitations ADD COLUMN recheck_changes INTEGER DEFAULT 0;
+
+UPDATE alembic_version SET version_num='c4e7a1d92b3f' WHERE alembic_version.version_num = '3df0b576624f';
+
+COMMIT;
+
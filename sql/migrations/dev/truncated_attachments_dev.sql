@@ -0,0 +1,10 @@
+BEGIN;
+
+-- Running upgrade c4e7a1d92b3f -> e2b9c7d4a615
+
+ALTER TABLE attachment ADD COLUMN truncated BOOLEAN DEFAULT false;
+
+UPDATE alembic_version SET version_num='e2b9c7d4a615' WHERE alembic_version.version_num = 'c4e7a1d92b3f';
+
+COMMIT;
+
@@ -0,0 +1,14 @@
+BEGIN;
+
+-- Running upgrade 06c9149baecd -> 9a1d6c3e7f52
+
+ALTER TABLE solicitations ADD COLUMN last_checked_at TIMESTAMP WITHOUT TIME ZONE;
+
+ALTER TABLE solicitations ADD COLUMN recheck_count INTEGER DEFAULT 0;
+
+ALTER TABLE solicitations ADD COLUMN recheck_changes INTEGER DEFAULT 0;
+
+UPDATE alembic_version SET version_num='9a1d6c3e7f52' WHERE alembic_version.version_num = '06c9149baecd';
+
+COMMIT;
+
@@ -0,0 +1,10 @@
+BEGIN;
+
+-- Running upgrade 9a1d6c3e7f52 -> b6d4e8f2a391
+
+ALTER TABLE attachment ADD COLUMN truncated BOOLEAN DEFAULT false;
+
+UPDATE alembic_version SET version_num='b6d4e8f2a391' WHERE alembic_version.version_num = '9a1d6c3e7f52';
+
+COMMIT;
+
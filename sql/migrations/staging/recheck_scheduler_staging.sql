@@ -0,0 +1,14 @@
+BEGIN;
+
+-- Running upgrade b0cbeeb30c9b -> 5b8f2e6a0d17
+
+ALTER TABLE solicitations ADD COLUMN last_checked_at TIMESTAMP WITHOUT TIME ZONE;
+
+ALTER TABLE solicitations ADD COLUMN recheck_count INTEGER DEFAULT 0;
+
+ALTER TABLE solicitations ADD COLUMN recheck_changes INTEGER DEFAULT 0;
+
+UPDATE alembic_version SET version_num='5b8f2e6a0d17' WHERE alembic_version.version_num = 'b0cbeeb30c9b';
+
+COMMIT;
+
@@ -0,0 +1,10 @@
+BEGIN;
+
+-- Running upgrade 5b8f2e6a0d17 -> 7c3f1a9e5d28
+
+ALTER TABLE attachment ADD COLUMN truncated BOOLEAN DEFAULT false;
+
+UPDATE alembic_version SET version_num='7c3f1a9e5d28' WHERE alembic_version.version_num = '5b8f2e6a0d17';
+
+COMMIT;
+
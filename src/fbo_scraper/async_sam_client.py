@@ -0,0 +1,384 @@
+import asyncio
+import errno
+import hashlib
+import logging
+import os
+import re
+import urllib.parse
+
+try:
+    import httpx
+except ImportError:
+    # httpx is optional, install the async extra to use this module
+    httpx = None
+
+from fbo_scraper import request_utils
+from fbo_scraper.get_doc_text import SNIFF_BYTES, UNSUPPORTED_TYPES, sniff_file_type
+from fbo_scraper.get_opps import (
+    DOWNLOAD_CHUNK_SIZE,
+    MAX_ATTACHMENT_BYTES,
+    MAX_RESULT_DEPTH,
+    SamApiError,
+    date_windows,
+    days_between,
+    filter_opps_page,
+    get_opportunities_search_url,
+    handle_file_too_long,
+    sam_format_date,
+    sam_parse_date,
+)
+from fbo_scraper.request_utils import retry_after_seconds, sam_ssl_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URI = "https://api.sam.gov/opportunities/v2/search"
+
+
+class AsyncSamClient:
+    """
+    asyncio client for the SAM.gov API, built on httpx, so that hundreds of requests
+    can be in flight on a single thread.
+
+    Requests are retried like requests_retry_session: connection errors and the
+    statuses in status_forcelist are retried up to retries times with exponential
+    backoff, and 429 responses after their Retry-After period, unless it is longer
+    than the rate limiter's max_retry_after. Every request goes
+    through the process wide SAM.gov rate limiter and quota tracker in request_utils,
+    and uses the same legacy renegotiation SSL workaround as SAMHttpAdapter.
+
+    Parameters:
+        max_connections (int): connections kept open at the same time
+        retries (int): times a failed request is retried
+        backoff_factor (float): base of the exponential backoff between retries, in seconds
+        status_forcelist (tuple): statuses that are retried
+        timeout (float): seconds to wait for a response
+    """
+
+    def __init__(
+        self,
+        max_connections=100,
+        retries=3,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        timeout=100,
+    ):
+        if httpx is None:
+            raise ImportError(
+                "The async SAM.gov client needs httpx. Install it with pip install fbo-scraper[async]"
+            )
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = status_forcelist
+        self.client = httpx.AsyncClient(
+            verify=sam_ssl_context(),
+            # requests beyond max_connections queue for a connection for as long as it takes
+            timeout=httpx.Timeout(timeout, pool=None),
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+        return False
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def _backoff(self, attempt):
+        # the same schedule urllib3 uses: no wait before the first retry, then doubling
+        if attempt < 1:
+            return 0
+        return self.backoff_factor * (2**attempt)
+
+    async def _wait_for_rate_limit(self):
+        while True:
+            wait = request_utils.rate_limiter.reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def send(self, method, url, headers=None, stream=False):
+        """
+        Make a request, retrying it as described above. With stream=True the
+        response body isn't read, and the caller must close the response.
+        """
+        for attempt in range(self.retries + 1):
+            await self._wait_for_rate_limit()
+            try:
+                r = await self.client.send(
+                    self.client.build_request(method, url, headers=headers), stream=stream
+                )
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Retrying {method} after {type(e).__name__}: {e}")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            # recording may write the quota file, so keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, request_utils.quota_tracker.record, r.headers
+            )
+            if (
+                attempt < self.retries
+                and r.status_code == 429
+                and request_utils.rate_limiter.throttled(retry_after_seconds(r.headers))
+            ):
+                await r.aclose()
+                continue
+            if attempt < self.retries and r.status_code in self.status_forcelist:
+                await r.aclose()
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if r.status_code != 429:
+                request_utils.rate_limiter.succeeded()
+            return r
+
+    async def search_opportunities(self, uri, offset=0):
+        """
+        Fetch a page of search results. The async equivalent of get_opps.get_opps_page.
+
+        Args:
+            uri: search uri returned by get_opportunities_search_url
+            offset: record offset of the page
+
+        Returns:
+            the decoded json response
+        """
+        uri_with_offset = f"{uri}&offset={offset}"
+        r = await self.send("GET", uri_with_offset)
+        data = r.json()
+
+        if r.status_code != 200:
+            api_error = data.get("error", {}).get("message")
+            raise SamApiError(f"Sam.gov API returned error message: {api_error}")
+
+        logger.debug(f"Retrieved json from {uri_with_offset}: {data}")
+        return data
+
+    async def get_opportunity(self, solnum):
+        """
+        Look up a single solicitation. Returns None if SAM.gov doesn't have it.
+        """
+        base_uri = os.getenv("SAM_API_URI") or DEFAULT_BASE_URI
+        uri = base_uri + f"?solnum={solnum}&api_key={os.getenv('SAM_API_KEY')}&limit=1"
+        r = await self.send("GET", uri)
+        data = r.json()
+        if data["totalRecords"] == 0:
+            return None
+        return data["opportunitiesData"][0]
+
+    async def download_attachment(
+        self, url, out_path, headers=None, max_bytes=MAX_ATTACHMENT_BYTES, chunk_size=DOWNLOAD_CHUNK_SIZE
+    ):
+        """
+        Stream an attachment to disk, named by its Content-Disposition header. The async
+        equivalent of the download in get_opps.get_docs: attachments larger than max_bytes,
+        going by their Content-Length or the bytes actually sent, and types we can't extract
+        text from are skipped.
+
+        Returns:
+            the path of the downloaded file, or None if the response wasn't an attachment
+            or was skipped
+        """
+        r = await self.send("GET", url, headers=headers, stream=True)
+        try:
+            content_disposition = r.headers.get("Content-Disposition")
+            match = re.search("filename=(.*)", content_disposition or "")
+            if r.status_code != 200 or not match:
+                return None
+            # have to replace + with space because unquote doesn't do that
+            real_filename = urllib.parse.unquote(match.group(1)).replace("+", " ")
+
+            content_length = request_utils.header_int(r.headers, "Content-Length")
+            if max_bytes and content_length and content_length > max_bytes:
+                logger.warning(f"Skipping {real_filename}, it is {content_length} bytes")
+                return None
+
+            filename = os.path.join(out_path, hashlib.sha1(url.encode("utf-8")).hexdigest())
+            file_type, size, skip_reason = await write_attachment(
+                r, filename, max_bytes=max_bytes, chunk_size=chunk_size
+            )
+        finally:
+            await r.aclose()
+        if skip_reason:
+            logger.warning(f"Skipping {real_filename} ({file_type}, {size} bytes): {skip_reason}")
+            return None
+
+        real_filename_with_path = os.path.join(out_path, real_filename)
+        try:
+            os.rename(filename, real_filename_with_path)
+        except OSError as e:
+            if e.errno != errno.ENAMETOOLONG:
+                raise
+            logger.warning(f"Filename {real_filename_with_path} is too long. Shortening Name.")
+            real_filename_with_path = handle_file_too_long(real_filename_with_path)
+            os.rename(filename, real_filename_with_path)
+        logger.info("Downloaded file {}".format(real_filename_with_path))
+        return real_filename_with_path
+
+
+async def write_attachment(r, filename, max_bytes=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Stream an httpx response to filename. The async equivalent of get_opps.write_attachment.
+
+    Returns:
+        a (file type, bytes read, reason it was skipped or None) tuple
+    """
+    chunks = r.aiter_bytes(chunk_size)
+    head = b""
+    async for chunk in chunks:
+        head += chunk
+        if len(head) >= SNIFF_BYTES:
+            break
+    file_type = sniff_file_type(head[:SNIFF_BYTES])
+    if file_type in UNSUPPORTED_TYPES:
+        return file_type, len(head), "unsupported type"
+
+    size = len(head)
+    if max_bytes and size > max_bytes:
+        return file_type, size, "too large"
+    with open(filename, "wb") as out:
+        out.write(head)
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                break
+            out.write(chunk)
+    if max_bytes and size > max_bytes:
+        os.remove(filename)
+        return file_type, size, "too large"
+    return file_type, size, None
+
+
+async def get_window_opps(
+    client,
+    from_date,
+    to_date,
+    opportunity_filter_function=None,
+    limit=None,
+    target_sol_types="o,k",
+    max_depth=MAX_RESULT_DEPTH,
+):
+    """
+    Fetch every page for a date window at once, splitting the window in half while it
+    has more than max_depth records. The async equivalent of get_opps.iter_window_pages.
+    """
+    uri = get_opportunities_search_url(
+        api_key=os.getenv("SAM_API_KEY"),
+        target_sol_types=target_sol_types,
+        from_date=from_date,
+        to_date=to_date,
+    )
+    data = await client.search_opportunities(uri, 0)
+    total_records = data["totalRecords"]
+    if max_depth and total_records > max_depth:
+        if sam_parse_date(from_date) != sam_parse_date(to_date):
+            days = days_between(from_date, to_date)
+            middle = len(days) // 2
+            logger.info(
+                f"Splitting {days[0]} to {days[-1]} ({total_records} records) at {days[middle]}"
+            )
+            kwargs = dict(
+                opportunity_filter_function=opportunity_filter_function,
+                limit=limit,
+                target_sol_types=target_sol_types,
+                max_depth=max_depth,
+            )
+            halves = await asyncio.gather(
+                get_window_opps(client, days[0], days[middle - 1], **kwargs),
+                get_window_opps(client, days[middle], days[-1], **kwargs),
+            )
+            return halves[0] + halves[1]
+        logger.warning(
+            f"{total_records} records posted on {sam_format_date(from_date)}, "
+            f"only the first {max_depth} can be fetched"
+        )
+        total_records = max_depth
+
+    page_size = len(data["opportunitiesData"])
+    offsets = list(range(page_size, total_records, page_size)) if page_size else []
+    if limit and not opportunity_filter_function:
+        offsets = [offset for offset in offsets if offset < limit]
+    pages = [data] + list(
+        await asyncio.gather(*(client.search_opportunities(uri, offset) for offset in offsets))
+    )
+
+    opps = []
+    for page in pages:
+        opps.extend(filter_opps_page(page, opportunity_filter_function))
+    return opps[:limit] if limit else opps
+
+
+async def get_opps_for_range(
+    opportunity_filter_function=None,
+    limit=None,
+    target_sol_types="o,k",
+    from_date="yesterday",
+    to_date="yesterday",
+    max_in_flight=100,
+    window_days=1,
+    max_depth=MAX_RESULT_DEPTH,
+):
+    """
+    The async equivalent of get_opps.get_opps_for_range. Every page of every window
+    is requested at once, with at most max_in_flight requests open at a time.
+    """
+    async with AsyncSamClient(max_connections=max_in_flight) as client:
+        window_opps = await asyncio.gather(
+            *(
+                get_window_opps(
+                    client,
+                    window[0],
+                    window[1],
+                    opportunity_filter_function=opportunity_filter_function,
+                    limit=limit,
+                    target_sol_types=target_sol_types,
+                    max_depth=max_depth,
+                )
+                for window in date_windows(from_date, to_date, window_days)
+            )
+        )
+
+    opps = []
+    seen = set()
+    for window in window_opps:
+        for opp in window:
+            if opp["solicitationNumber"] in seen:
+                continue
+            seen.add(opp["solicitationNumber"])
+            opps.append(opp)
+
+    if limit and len(opps) > limit:
+        opps = opps[:limit]
+    return opps
+
+
+async def fetch_opps_from_sam(sol_nums, max_in_flight=100):
+    """
+    The async equivalent of sam_utils.fetch_opps_from_sam.
+
+    Returns:
+        a dict of solicitation number to the opportunity data, or None if SAM.gov
+        doesn't have it. Solicitations whose lookup failed are left out.
+    """
+    async with AsyncSamClient(max_connections=max_in_flight) as client:
+        results = await asyncio.gather(
+            *(client.get_opportunity(sol_num) for sol_num in sol_nums),
+            return_exceptions=True,
+        )
+
+    opps = {}
+    for sol_num, result in zip(sol_nums, results):
+        if isinstance(result, Exception):
+            logger.error(f"Unable to look up {sol_num} in the sam.gov API: {result}")
+            continue
+        opps[sol_num] = result
+    return opps
@@ -0,0 +1,349 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attachment_text (
+    content_hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    machine_readable INTEGER NOT NULL,
+    truncated INTEGER NOT NULL DEFAULT 0,
+    extraction_error TEXT,
+    budget_max_pages INTEGER,
+    budget_max_chars INTEGER,
+    budget_max_bytes INTEGER,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attachment_url (
+    url TEXT PRIMARY KEY,
+    filename TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    content_length INTEGER,
+    content_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_attachment_text_last_used_at ON attachment_text (last_used_at);
+"""
+
+
+# the limits of an ExtractionBudget, which text is stored with
+BUDGET_LIMITS = ("max_pages", "max_chars", "max_bytes")
+
+
+def file_content_hash(file_name, chunk_size=1024 * 1024):
+    """
+    Returns the sha256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AttachmentCache:
+    """
+    Persistent cache of extracted attachment text.
+
+    Text is stored by the sha256 of the attachment's content, and each attachment
+    url is mapped to the content hash it last served along with the ETag,
+    Last-Modified and Content-Length of that response. This lets get_docs make
+    conditional requests, skip the download when the response headers match what
+    we saw before, and skip the extraction when a download turns out to have
+    content we've already extracted.
+
+    Text is stored with the extraction budget it was extracted within, and whether
+    it was cut short. Text cut short under a different budget is a miss, and so is
+    complete text extracted under a budget smaller than the current one in any limit.
+
+    Parameters:
+        path (str): location of the SQLite database file
+        max_bytes (int): evict least recently used text once the cache is larger than this
+        max_age_days (int): evict text that hasn't been used in this many days
+        budget (ExtractionBudget): the budget attachments are extracted within
+    """
+
+    def __init__(self, path, max_bytes=2 * 1024**3, max_age_days=90, budget=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.budget_limits = tuple(getattr(budget, limit, None) for limit in BUDGET_LIMITS)
+        self.stats = {
+            "not modified": 0,
+            "url hits": 0,
+            "content hits": 0,
+            "misses": 0,
+            "stored": 0,
+        }
+        self._lock = threading.Lock()
+
+        if self.path.parent and not self.path.parent.exists():
+            os.makedirs(self.path.parent)
+        # downloads run on a thread pool, so share one connection behind a lock
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(attachment_url)")]
+        for column in ("filename", "last_modified"):
+            if column not in columns:
+                # cache files created before conditional requests were supported
+                self._conn.execute(f"ALTER TABLE attachment_url ADD COLUMN {column} TEXT")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(attachment_text)")]
+        if "truncated" not in columns:
+            # cache files created before extraction budgets, whose text is complete
+            self._conn.execute("ALTER TABLE attachment_text ADD COLUMN truncated INTEGER NOT NULL DEFAULT 0")
+            for limit in BUDGET_LIMITS:
+                self._conn.execute(f"ALTER TABLE attachment_text ADD COLUMN budget_{limit} INTEGER")
+        if "extraction_error" not in columns:
+            self._conn.execute("ALTER TABLE attachment_text ADD COLUMN extraction_error TEXT")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def _fits_budget(self, truncated, budget_limits):
+        """
+        Returns whether text extracted within budget_limits is what extracting it
+        within the current budget would give.
+        """
+        if tuple(budget_limits) == self.budget_limits:
+            return True
+        if truncated:
+            return False
+        # complete text is still complete under a budget that is at least as large
+        return all(
+            current is None or (stored is not None and current >= stored)
+            for current, stored in zip(self.budget_limits, budget_limits)
+        )
+
+    def _fetch_text(self, content_hash):
+        row = self._conn.execute(
+            "SELECT text, machine_readable, truncated, extraction_error, budget_max_pages, budget_max_chars, "
+            "budget_max_bytes FROM attachment_text WHERE content_hash = ?",
+            (content_hash,),
+        ).fetchone()
+        if row is None or not self._fits_budget(row[2], row[4:]):
+            return None
+        with self._conn:
+            self._conn.execute(
+                "UPDATE attachment_text SET last_used_at = ? WHERE content_hash = ?",
+                (time.time(), content_hash),
+            )
+        return {
+            "text": row[0],
+            "machine_readable": bool(row[1]),
+            "truncated": bool(row[2]),
+            "extraction_error": row[3],
+        }
+
+    def conditional_headers(self, url):
+        """
+        Returns the If-None-Match/If-Modified-Since headers for a url whose text
+        is in the cache, so the server can answer 304 Not Modified instead of
+        sending the file again.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT u.etag, u.last_modified FROM attachment_url u "
+                "JOIN attachment_text t ON t.content_hash = u.content_hash WHERE u.url = ?",
+                (url,),
+            ).fetchone()
+        headers = {}
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def lookup_not_modified(self, url):
+        """
+        Returns the cached text for a url the server answered 304 Not Modified for.
+        The filename of the earlier response is included, since a 304 doesn't
+        carry a Content-Disposition header.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, filename FROM attachment_url WHERE url = ?", (url,)
+            ).fetchone()
+            cached = self._fetch_text(row[0]) if row else None
+        if cached:
+            cached["filename"] = row[1]
+            self.stats["not modified"] += 1
+        return cached
+
+    def lookup_url(self, url, etag=None, content_length=None, last_modified=None):
+        """
+        Find the cached text for a url whose response headers haven't changed.
+
+        An ETag is required to match when the server sent one. Otherwise both the
+        Last-Modified and the Content-Length have to match, since an amended file
+        can have the same length. Returns None if they aren't available.
+
+        Returns:
+            None or a dict with the cached text, its machine_readable and truncated
+            flags and the reason it wasn't extracted, if it wasn't
+        """
+        if not etag and (not last_modified or content_length is None):
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_length, content_hash FROM attachment_url WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            cached_etag, cached_last_modified, cached_length, content_hash = row
+            if etag:
+                if etag != cached_etag:
+                    return None
+            elif (
+                last_modified != cached_last_modified
+                or cached_length is None
+                or int(content_length) != cached_length
+            ):
+                return None
+
+            cached = self._fetch_text(content_hash)
+        if cached:
+            self.stats["url hits"] += 1
+        return cached
+
+    def lookup_content(
+        self,
+        url,
+        content_hash,
+        etag=None,
+        content_length=None,
+        last_modified=None,
+        filename=None,
+    ):
+        """
+        Record that url served content with content_hash, and return the cached
+        text for that content if we have already extracted it.
+
+        Returns:
+            None or a dict with the cached text, its machine_readable and truncated
+            flags and the reason it wasn't extracted, if it wasn't
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO attachment_url (url, filename, etag, last_modified, content_length, content_hash, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        url,
+                        filename,
+                        etag,
+                        last_modified,
+                        int(content_length) if content_length is not None else None,
+                        content_hash,
+                        time.time(),
+                    ),
+                )
+            cached = self._fetch_text(content_hash)
+        if cached:
+            self.stats["content hits"] += 1
+        else:
+            self.stats["misses"] += 1
+        return cached
+
+    def store(self, url, text, machine_readable, truncated=False, extraction_error=None):
+        """
+        Store the text extracted from the content last downloaded from url, within
+        the current budget. truncated is whether the budget cut it short, and
+        extraction_error why it wasn't extracted, e.g. because it's a scanned PDF.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM attachment_url WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return
+            now = time.time()
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO attachment_text (content_hash, text, machine_readable, truncated, "
+                    "extraction_error, budget_max_pages, budget_max_chars, budget_max_bytes, size, created_at, "
+                    "last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        row[0],
+                        text,
+                        int(bool(machine_readable)),
+                        int(bool(truncated)),
+                        extraction_error,
+                        *self.budget_limits,
+                        len(text.encode("utf-8")),
+                        now,
+                        now,
+                    ),
+                )
+        self.stats["stored"] += 1
+
+    def evict(self):
+        """
+        Remove text that is too old, then the least recently used text until the
+        cache fits in max_bytes. Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock, self._conn:
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 24 * 60 * 60
+                removed += self._conn.execute(
+                    "DELETE FROM attachment_text WHERE last_used_at < ?", (cutoff,)
+                ).rowcount
+
+            if self.max_bytes:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM attachment_text"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute(
+                        "SELECT content_hash, size FROM attachment_text ORDER BY last_used_at"
+                    ).fetchall()
+                    expired = []
+                    for content_hash, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        expired.append((content_hash,))
+                        total -= size
+                    self._conn.executemany(
+                        "DELETE FROM attachment_text WHERE content_hash = ?", expired
+                    )
+                    removed += len(expired)
+
+            self._conn.execute(
+                "DELETE FROM attachment_url WHERE content_hash NOT IN (SELECT content_hash FROM attachment_text) "
+                "AND updated_at < ?",
+                (time.time() - 24 * 60 * 60,),
+            )
+        return removed
+
+    def log_stats(self):
+        logger.info(
+            "Attachment cache: {} not modified, {} url hits, {} content hits, {} misses".format(
+                self.stats["not modified"],
+                self.stats["url hits"],
+                self.stats["content hits"],
+                self.stats["misses"],
+            ),
+            extra={"attachment cache": dict(self.stats)},
+        )
+
+    def close(self):
+        evicted = self.evict()
+        self.stats["evicted"] = evicted
+        self.log_stats()
+        self._conn.close()
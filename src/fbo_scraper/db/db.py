@@ -81,6 +81,8 @@ class Attachment(Base):
     validation = Column(Integer)
     attachment_url = Column(Text)
     trained = Column(Boolean)
+    # the text was cut short by the extraction budget
+    truncated = Column(Boolean, server_default=text("false"))
     createdAt = Column(DateTime, nullable=False, default=func.now())
     updatedAt = Column(DateTime, onupdate=func.now())
     solicitation_id = Column(Integer, ForeignKey("solicitations.id"))
@@ -210,6 +212,9 @@ class Solicitation(Base):
     searchText = Column(String)
     compliant = Column(Integer, server_default=text("0"))
     noticeData = Column(JSONB)
+    last_checked_at = Column(DateTime)
+    recheck_count = Column(Integer, server_default=text("0"))
+    recheck_changes = Column(Integer, server_default=text("0"))
 
     attachments = relationship(
         "Attachment", back_populates="solicitation", cascade="all, delete-orphan"
@@ -1,3 +1,4 @@
+from collections import Counter, OrderedDict
 from contextlib import contextmanager
 from datetime import datetime, timezone
 from typing import Union, List
@@ -9,16 +10,75 @@ from random import random
 from enum import Enum
 
 import dill as pickle
-from sqlalchemy import func, case, inspect
+from sqlalchemy import func, case, inspect, select, update, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.engine import Engine
 from fbo_scraper.db.db import Solicitation
 
 import fbo_scraper.db.db as db
 from fbo_scraper.binaries import Path, binary_path
 from fbo_scraper.db.connection import DataAccessLayer
-import functools
 
 CACHE_SIZE = 256
+SESSION_CACHE_KEY = "db_utils cache"
+BULK_BATCH_SIZE = 500
+
+# Solicitation columns the insert pipeline reads, or only sets some of the time, so
+# bulk mode loads them for solicitations that are already in the database.
+PRELOADED_SOLICITATION_COLUMNS = (
+    "id",
+    "solNum",
+    "active",
+    "na_flag",
+    "agency_id",
+    "history",
+    "action",
+    "actionStatus",
+    "actionDate",
+    "predictions",
+)
+
+# Solicitation columns written by the bulk upsert
+UPSERT_SOLICITATION_COLUMNS = PRELOADED_SOLICITATION_COLUMNS[1:] + (
+    "updatedAt",
+    "title",
+    "url",
+    "agency",
+    "numDocs",
+    "notice_type_id",
+    "noticeType",
+    "date",
+    "office",
+    "category_list",
+    "undetermined",
+    "contactInfo",
+    "parseStatus",
+    "reviewRec",
+    "searchText",
+    "compliant",
+    "noticeData",
+)
+
+# An ORM insert leaves out unset columns and None values for non-JSON columns, so the
+# server defaults apply. The bulk upsert writes every column and uses these instead.
+NEW_SOLICITATION_DEFAULTS = {
+    "history": [],
+    "compliant": 0,
+}
+
+ATTACHMENT_INSERT_COLUMNS = (
+    "notice_type_id",
+    "filename",
+    "machine_readable",
+    "attachment_text",
+    "prediction",
+    "decision_boundary",
+    "validation",
+    "attachment_url",
+    "trained",
+    "truncated",
+    "solicitation_id",
+)
 
 logger = logging.getLogger(__name__)
 
@@ -66,7 +126,70 @@ def session_scope(dal):
         session.close()
 
 
-@functools.lru_cache(CACHE_SIZE)
+class SessionCache:
+    """
+    Bounded LRU cache of the objects looked up by the fetch functions in a single session.
+
+    The cache is kept in session.info, so it goes away with the session and never hands out
+    objects that belong to a different session. The notice_type table is small and loaded in
+    full the first time it's needed.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self.notice_types = None
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns the cached object for key, or None.
+        """
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate_notice_types(self):
+        self.notice_types = None
+
+
+def get_session_cache(session) -> Union[SessionCache, None]:
+    """
+    Returns the SessionCache for a session, creating it if needed. Returns None for objects
+    that aren't SQLAlchemy sessions, e.g. mocks, so that they are always queried.
+    """
+    info = getattr(session, "info", None)
+    if not isinstance(info, dict):
+        return None
+    cache = info.get(SESSION_CACHE_KEY)
+    if cache is None:
+        cache = info[SESSION_CACHE_KEY] = SessionCache()
+    return cache
+
+
+def load_notice_types(session) -> dict:
+    """
+    Load the whole notice_type table.
+
+    Returns:
+        dict mapping each notice_type to its NoticeType object
+    """
+    cache = get_session_cache(session)
+    if cache is not None and cache.notice_types is not None:
+        return cache.notice_types
+
+    notice_types = {nt.notice_type: nt for nt in session.query(db.NoticeType)}
+    if cache is not None:
+        cache.notice_types = notice_types
+    return notice_types
+
+
 def fetch_notice_type_id(notice_type, session):
     """
     Fetch the notice_type_id for a given notice_type.
@@ -81,21 +204,14 @@ def fetch_notice_type_id(notice_type, session):
     Returns:
         None or notice_type_id (int): if notice_type_id, this is the PK for the notice_type
     """
-    try:
-        notice_type_id = (
-            session.query(db.NoticeType.id)
-            .filter(db.NoticeType.notice_type == notice_type)
-            .first()
-            .id
-        )
-    except AttributeError:
+    nt = load_notice_types(session).get(notice_type)
+    if nt is None:
         logger.debug("Requested notice type {} was not found.".format(notice_type))
         return
 
-    return notice_type_id
+    return nt.id
 
 
-@functools.lru_cache(CACHE_SIZE)
 def fetch_notice_type_by_id(notice_type_id, session):
     """
     Fetch the notice_type for a given notice_type_id.
@@ -106,17 +222,12 @@ def fetch_notice_type_by_id(notice_type_id, session):
     Returns:
         None or notice_type object
     """
-    try:
-        notice_type = (
-            session.query(db.NoticeType)
-            .filter(db.NoticeType.id == notice_type_id)
-            .first()
-        )
-    except AttributeError:
-        logger.warn("Requested notice type ID {} was not found.".format(notice_type_id))
-        return
+    for nt in load_notice_types(session).values():
+        if nt.id == notice_type_id:
+            return nt
 
-    return notice_type
+    logger.debug("Requested notice type ID {} was not found.".format(notice_type_id))
+    return
 
 
 def insert_notice_types(
@@ -132,12 +243,16 @@ def insert_notice_types(
     """
     Insert each of the notice types into the notice_type table if it isn't already there.
     """
+    cache = get_session_cache(session)
 
     for notice_type in sam_notice_types:
         notice_type_id = fetch_notice_type_id(notice_type, session)
         if not notice_type_id:
             nt = db.NoticeType(notice_type=notice_type)
             session.add(nt)
+            if cache is not None:
+                # reloaded, and so flushed, by the next lookup
+                cache.invalidate_notice_types()
 
 
 def insert_model(session, results, params, score):
@@ -223,7 +338,8 @@ def create_new_or_existing_attachment(doc: dict, session) -> db.Attachment:
                                     decision_boundary=doc['decision_boundary'],
                                     validation=doc['validation'],
                                     attachment_url=doc['url'],
-                                    trained=doc['trained'])
+                                    trained=doc['trained'],
+                                    truncated=doc.get('truncated', False))
     return attachment
 
 def sol_attributes_from(opportunity, solicitation: Solicitation):
@@ -251,7 +367,79 @@ def sol_attributes_from(opportunity, solicitation: Solicitation):
 
     
 
-def search_for_agency(agency, solicitation, session):
+class AgencyResolver:
+    """
+    Maps agency aliases to their agency_id and canonical agency name.
+
+    The agency_alias table is loaded, joined to Agencies, with a single query when the
+    resolver is created and again whenever refresh is called. Aliases that can't be mapped
+    are counted so they can be reported with one log line per run rather than one per notice.
+    """
+
+    def __init__(self, session=None):
+        self.aliases = {}
+        self.unmapped = Counter()
+        if session is not None:
+            self.refresh(session)
+
+    def refresh(self, session):
+        """
+        Reload the aliases from the database.
+        """
+        query = (
+            session.query(db.AgencyAlias.alias, db.AgencyAlias.agency_id, db.Agencies.agency)
+            .outerjoin(db.Agencies, db.Agencies.id == db.AgencyAlias.agency_id)
+            .order_by(db.AgencyAlias.id)
+        )
+        aliases = {}
+        for alias, agency_id, agency in query:
+            aliases.setdefault(alias, (agency_id, agency))
+        self.aliases = aliases
+        logger.debug("Loaded {} agency aliases".format(len(aliases)))
+
+    def resolve(self, alias):
+        """
+        Returns:
+            None or an (agency_id, agency) tuple. The agency is None if the alias
+            isn't mapped to an agency.
+        """
+        resolved = self.aliases.get(alias)
+        if resolved is None:
+            self.unmapped[alias] += 1
+        return resolved
+
+    def apply(self, agency, solicitation):
+        """
+        Set the agency_id and agency of the solicitation from its agency alias.
+        """
+        resolved = self.resolve(agency)
+        if resolved is None:
+            logger.debug("unable to map agency {} for solnum {}".format(agency, solicitation.solNum))
+            return
+        agency_id, agency_name = resolved
+        solicitation.agency_id = agency_id
+        if agency_id and agency_name is not None:
+            solicitation.agency = agency_name
+            logger.debug("{} mapped to {} for solnum {}".format(agency, solicitation.agency, solicitation.solNum))
+
+    def log_unmapped(self):
+        """
+        Log one summary line for the aliases that couldn't be mapped, then reset the counts.
+        """
+        if self.unmapped:
+            logger.warning(
+                "unable to map {} agencies for {} solicitations".format(
+                    len(self.unmapped), sum(self.unmapped.values())
+                ),
+                extra={"unmapped agencies": dict(self.unmapped)},
+            )
+        self.unmapped = Counter()
+
+def search_for_agency(agency, solicitation, session, resolver: AgencyResolver = None):
+    if resolver is not None:
+        resolver.apply(agency, solicitation)
+        return
+
     agency_alias_query = session.query(db.AgencyAlias).filter(db.AgencyAlias.alias == agency)
     if agency_alias_query.count() > 0:
         agency_alias = agency_alias_query.one()
@@ -290,7 +478,7 @@ def update_solicitation_history(solicitation,
         solicitation.actionStatus = "Solicitation Posted"
         solicitation.predictions = { "value": "red", "508": "red", "estar": "red", "history" : [] }
 
-def handle_attachments(opportunity: dict, solicitation: Solicitation, session=None, now: datetime = datetime.now(timezone.utc)) -> int:
+def handle_attachments(opportunity: dict, solicitation: Solicitation, session=None, now: datetime = datetime.now(timezone.utc), existing_attachments: dict = None) -> int:
     """
     Create Attachment objects from the opportunity data and attach them to the solicitation.
 
@@ -298,6 +486,8 @@ def handle_attachments(opportunity: dict, solicitation: Solicitation, session=No
         opportunity (dict): Opportunity data from the API
         solicitation (Solicitation): SQL Alchemy Solicitation object
         now (datetime, optional): Current datetime. Defaults to datetime.now(timezone.utc).
+        existing_attachments (dict, optional): the solicitation's attachments keyed by filename,
+            used instead of looking each one up in the session
     Returns:
         prediction int: Solicitation prediction returned from attachment value
     """
@@ -315,12 +505,18 @@ def handle_attachments(opportunity: dict, solicitation: Solicitation, session=No
         doc['notice_type_id'] = solicitation.notice_type_id
         doc['sol_id'] = solicitation.id
 
-        attachment = create_new_or_existing_attachment(doc, session)
+        if existing_attachments is not None:
+            attachment = existing_attachments.get(doc['filename']) or create_new_or_existing_attachment(doc, None)
+        else:
+            attachment = create_new_or_existing_attachment(doc, session)
         
         prediction += doc['prediction'] # this should be a 0/1 boolean and if any 1 then it's enough to make the total result true
         sol_attachments.append(attachment)
         parse_status_text = "successfully parsed" if doc['machine_readable'] else "processing error"
-        parseStatus.append({"id": attachment.id, "name": doc['filename'], "status": parse_status_text, "postedDate": now_datetime_string, "attachment_url": doc['url'] })
+        parse_status = {"id": attachment.id, "name": doc['filename'], "status": parse_status_text, "postedDate": now_datetime_string, "attachment_url": doc['url'] }
+        if doc.get('extraction_error'):
+            parse_status["error"] = doc['extraction_error']
+        parseStatus.append(parse_status)
     
     solicitation.attachments = sol_attachments
 
@@ -415,16 +611,56 @@ def determine_prediction_value(solicitation: Solicitation, predicition: int):
             pred = PredictionEnum.non_compliant
     return pred
 
-def insert_data_into_solicitations_table(session, data) -> list[Solicitation]:
+def set_search_text(sol: Solicitation, notice_type: str):
+    """
+    Set the search text column so that we can easily do a full text search in the API.
+    """
+    safe_date = sol.date if sol.date else " "
+
+    safe_action_date = sol.actionDate.strftime("%Y-%m-%dT%H:%M:%SZ") if sol.actionDate else " "
+
+    sol.searchText = " ".join(
+        (
+            sol.solNum,
+            notice_type,
+            sol.title,
+            safe_date,
+            sol.reviewRec,
+            sol.actionStatus or "",
+            safe_action_date,
+            sol.agency,
+            sol.office,
+        )
+    ).lower()
+
+def insert_data_into_solicitations_table(session, data, bulk: bool = False, batch_size: int = BULK_BATCH_SIZE, agency_resolver: AgencyResolver = None) -> list[Solicitation]:
     """
     Insert opportunities data into the database. 
 
     Parameters:
         data (list): a list of dicts, each representing a single opportunity
+        bulk (bool): load existing solicitations a batch at a time and write them with
+            INSERT ... ON CONFLICT instead of querying and flushing each one through the ORM
+        batch_size (int): the number of opportunities in each bulk batch
+        agency_resolver (AgencyResolver): maps agency aliases. If one isn't given, the aliases
+            are loaded for this call and the unmapped ones are logged at the end of it.
 
     Returns:
         List of Solicitation objects that were inserted, if needed.
     """
+    log_unmapped_agencies = agency_resolver is None
+    if agency_resolver is None:
+        agency_resolver = AgencyResolver(session)
+
+    try:
+        if bulk:
+            return bulk_insert_data_into_solicitations_table(session, data, batch_size=batch_size, agency_resolver=agency_resolver)
+        return _insert_data_into_solicitations_table(session, data, agency_resolver)
+    finally:
+        if log_unmapped_agencies:
+            agency_resolver.log_unmapped()
+
+def _insert_data_into_solicitations_table(session, data, agency_resolver: AgencyResolver) -> list[Solicitation]:
     insert_notice_types(session)
     opp_count = 0
     skip_count = 0
@@ -457,7 +693,7 @@ def insert_data_into_solicitations_table(session, data) -> list[Solicitation]:
 
             sol_attributes_from(opp, solicitation=sol)
 
-            search_for_agency(opp['agency'], sol, session)
+            search_for_agency(opp['agency'], sol, session, resolver=agency_resolver)
             update_solicitation_history(sol, 
                                         now_datetime, 
                                         in_database=sol_existed_in_db,
@@ -470,24 +706,7 @@ def insert_data_into_solicitations_table(session, data) -> list[Solicitation]:
             apply_predictions_to(solicitation=sol, predicition=sol_prediction)
             
 
-            # now set the search text column so that we can easily do a full text search in the API
-            safe_date = sol.date if sol.date else " "
-
-            safe_action_date = sol.actionDate.strftime("%Y-%m-%dT%H:%M:%SZ") if sol.actionDate else " "
-
-            sol.searchText = " ".join(
-                (
-                    sol.solNum,
-                    notice_type,
-                    sol.title,
-                    safe_date,
-                    sol.reviewRec,
-                    sol.actionStatus or "",
-                    safe_action_date,
-                    sol.agency,
-                    sol.office,
-                )
-            ).lower()
+            set_search_text(sol, notice_type)
 
             list_of_sols.append(sol)
             insert_data_into(session, sol, sol_existed_in_db)
@@ -511,10 +730,205 @@ def insert_data_into_solicitations_table(session, data) -> list[Solicitation]:
 
     return list_of_sols
 
+def fetch_notice_type_ids(notice_types, session) -> dict:
+    """
+    Fetch the ids of the given notice types, adding any that aren't in the notice_type table.
+
+    Returns:
+        dict mapping notice type to notice_type_id
+    """
+    known = load_notice_types(session)
+    missing = [nt for nt in notice_types if nt is not None and nt not in known]
+    for notice_type in missing:
+        logger.warning("Notice type '{}' was not in the database".format(notice_type),
+                       extra={'notice type': notice_type})
+    if missing:
+        insert_notice_types(session, missing)
+    return {notice_type: nt.id for notice_type, nt in load_notice_types(session).items()}
+
+def preload_solicitations(sol_numbers, session) -> dict:
+    """
+    Load the solicitations with the given solicitation numbers, and their attachments, with
+    one query each.
+
+    The solicitations are returned as Solicitation objects that aren't part of the session,
+    with only PRELOADED_SOLICITATION_COLUMNS set, so that changing them doesn't cause the ORM
+    to flush them.
+
+    Returns:
+        dict mapping solNum to a (Solicitation, {filename: Attachment}) tuple
+    """
+    if not sol_numbers:
+        return {}
+    sol_table = db.Solicitation.__table__
+    rows = session.execute(
+        select(*(sol_table.c[c] for c in PRELOADED_SOLICITATION_COLUMNS))
+        .where(sol_table.c.solNum.in_(list(sol_numbers)))
+    ).mappings()
+    sols_by_id = {row["id"]: Solicitation(**row) for row in rows}
+
+    attachments_by_sol_id = {sol_id: {} for sol_id in sols_by_id}
+    if sols_by_id:
+        attachment_table = db.Attachment.__table__
+        rows = session.execute(
+            select(
+                attachment_table.c.id,
+                attachment_table.c.solicitation_id,
+                attachment_table.c.filename,
+                attachment_table.c.machine_readable,
+            ).where(attachment_table.c.solicitation_id.in_(list(sols_by_id)))
+        ).mappings()
+        for row in rows:
+            # the first match wins, like fetch_sol_attachment_by_name
+            attachments_by_sol_id[row["solicitation_id"]].setdefault(row["filename"], db.Attachment(**row))
+
+    return {sol.solNum: (sol, attachments_by_sol_id[sol.id]) for sol in sols_by_id.values()}
+
+def solicitation_row(sol: Solicitation, existed_in_db: bool) -> dict:
+    """
+    The values of UPSERT_SOLICITATION_COLUMNS for a solicitation built by the bulk insert.
+    """
+    row = {c: getattr(sol, c) for c in UPSERT_SOLICITATION_COLUMNS}
+    if not existed_in_db:
+        for column, default in NEW_SOLICITATION_DEFAULTS.items():
+            if row[column] is None:
+                row[column] = deepcopy(default)
+    return row
+
+def upsert_solicitations_statement():
+    """
+    INSERT ... ON CONFLICT ("solNum") DO UPDATE for UPSERT_SOLICITATION_COLUMNS, returning the id of each row.
+    """
+    sol_table = db.Solicitation.__table__
+    stmt = pg_insert(sol_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[sol_table.c.solNum],
+        set_={c: stmt.excluded[c] for c in UPSERT_SOLICITATION_COLUMNS if c != "solNum"},
+    )
+    return stmt.returning(sol_table.c.id, sol_table.c.solNum)
+
+def write_solicitations(session, sols: list, existing: dict):
+    """
+    Write a batch of solicitations built by the bulk insert, along with their attachments.
+
+    New attachments are inserted with executemany, attachments that are kept have their updatedAt
+    bumped and attachments that are no longer listed are deleted, matching what the ORM's
+    delete-orphan cascade does for the non-bulk path.
+    """
+    if not sols:
+        return
+    rows = [solicitation_row(sol, sol.solNum in existing) for sol in sols]
+    ids = dict((solNum, id) for id, solNum in session.execute(upsert_solicitations_statement(), rows))
+
+    new_attachments = []
+    kept_ids = []
+    removed_ids = []
+    for sol in sols:
+        sol.id = ids[sol.solNum]
+        for attachment in sol.attachments:
+            if attachment.id is None:
+                attachment.solicitation_id = sol.id
+                new_attachments.append({c: getattr(attachment, c) for c in ATTACHMENT_INSERT_COLUMNS})
+            else:
+                kept_ids.append(attachment.id)
+        if sol.solNum in existing:
+            kept = {a.id for a in sol.attachments}
+            removed_ids.extend(a.id for a in existing[sol.solNum][1].values() if a.id not in kept)
+
+    if new_attachments:
+        session.execute(db.Attachment.__table__.insert(), new_attachments)
+    if kept_ids:
+        session.execute(update(db.Attachment.__table__).where(db.Attachment.__table__.c.id.in_(kept_ids)).values(updatedAt=func.now()))
+    if removed_ids:
+        session.execute(delete(db.Attachment.__table__).where(db.Attachment.__table__.c.id.in_(removed_ids)))
+
+def bulk_insert_data_into_solicitations_table(session, data, batch_size: int = BULK_BATCH_SIZE, agency_resolver: AgencyResolver = None) -> list[Solicitation]:
+    """
+    Bulk version of insert_data_into_solicitations_table.
+
+    For each batch of opportunities the existing solicitations and their attachments are
+    loaded with IN queries, the solicitations are built with the same history,
+    action and prediction logic as the non-bulk path, and written with write_solicitations.
+
+    Returns:
+        List of the Solicitation objects that were written. They are not part of the session.
+    """
+    if agency_resolver is None:
+        agency_resolver = AgencyResolver(session)
+    insert_notice_types(session)
+    notice_type_ids = fetch_notice_type_ids({opp.get('notice type') for opp in data}, session)
+    opp_count = 0
+    skip_count = 0
+
+    # one row per solicitation number, since a statement can't upsert the same row twice
+    opps = list({opp.get('solnbr'): opp for opp in data}.values())
+    skip_count += len(data) - len(opps)
+
+    list_of_sols = []
+    for start in range(0, len(opps), batch_size):
+        batch = opps[start:start + batch_size]
+        existing = preload_solicitations({opp['solnbr'] for opp in batch if opp.get('solnbr')}, session)
+
+        sols = []
+        for opp in batch:
+            try:
+                now_datetime = datetime.now(timezone.utc)
+                notice_type = opp['notice type']
+
+                sol_existed_in_db = opp['solnbr'] in existing
+                if sol_existed_in_db:
+                    sol, existing_attachments = existing[opp['solnbr']]
+                    logger.info("Updating {}".format(opp['solnbr']))
+                else:
+                    sol = Solicitation(active=True, na_flag=False)
+                    existing_attachments = {}
+                    logger.info("Inserting {}".format(opp['solnbr']))
+                sol.notice_type_id = notice_type_ids.get(notice_type)
+
+                sol_attributes_from(opp, solicitation=sol)
+
+                search_for_agency(opp['agency'], sol, session, resolver=agency_resolver)
+                update_solicitation_history(sol,
+                                            now_datetime,
+                                            in_database=sol_existed_in_db,
+                                            posted_at=opp.get('postedDate', None))
+
+                sol_prediction = handle_attachments(opp, sol, now=now_datetime, existing_attachments=existing_attachments)
+
+                apply_predictions_to(solicitation=sol, predicition=sol_prediction)
+
+                set_search_text(sol, notice_type)
+
+                sols.append(sol)
+
+            except Exception as e:
+                logger.error(
+                    "Unhandled error. Data for solictation "
+                    + opp.get("solnbr", "")
+                    + " may be lost."
+                )
+                logger.error(f"Exception: {e}", exc_info=True)
+                logger.error("Unexpected error: {}".format(str(sys.exc_info()[0])))
+
+        write_solicitations(session, sols, existing)
+        list_of_sols.extend(sols)
+        opp_count += len(sols)
+
+    logger.info(
+        "Added {} notice records to the database. {} were skipped.".format(
+            opp_count, skip_count
+        )
+    )
+
+    return list_of_sols
+
 def insert_data_into(db_session, from_sol_model, existed_in_db):
     if not existed_in_db:
         logger.info("Inserting {}".format(from_sol_model.solNum))
         db_session.add(from_sol_model)
+        cache = get_session_cache(db_session)
+        if cache is not None:
+            cache.set(("solicitation", from_sol_model.solNum), from_sol_model)
     else:
         #print("Updating {}".format(sol.solNum))
         logger.info("Updating {}".format(from_sol_model.solNum))
@@ -592,7 +1006,6 @@ def fetch_notices_by_solnbr(solnbr, session):
 
     return notice_dicts
 
-@functools.lru_cache(CACHE_SIZE)
 def fetch_solicitations_by_solnbr(solnbr: str, session, as_dict: bool=True) -> Union[dict, Solicitation]:
     """
     Fetch the solicitation by a given solicitation number (solnbr).
@@ -606,7 +1019,14 @@ def fetch_solicitations_by_solnbr(solnbr: str, session, as_dict: bool=True) -> U
         A dictionary representing a solicitation. If the as_dict flag is False, a SQLAlchemy Solicitation model object is returned instead.
     """
     
-    solicitation = session.query(db.Solicitation).filter(db.Solicitation.solNum == solnbr).first()
+    cache = get_session_cache(session)
+    key = ("solicitation", solnbr)
+    solicitation = cache.get(key) if cache is not None else None
+    if solicitation is None:
+        solicitation = session.query(db.Solicitation).filter(db.Solicitation.solNum == solnbr).first()
+        # only found solicitations are cached, so one added later in the session is still found
+        if solicitation is not None and cache is not None:
+            cache.set(key, solicitation)
     
     if as_dict:
         sol_dict = object_as_dict(solicitation) if solicitation else None
@@ -615,7 +1035,6 @@ def fetch_solicitations_by_solnbr(solnbr: str, session, as_dict: bool=True) -> U
 
     return sol_dict
 
-@functools.lru_cache(CACHE_SIZE)
 def fetch_sol_attachment_by_name(solicitation_id, attachment_name:str, session, as_dict:bool=False) -> Union[dict, db.Attachment]:
     """
     Fetch an attachment by its filename.
@@ -631,7 +1050,13 @@ def fetch_sol_attachment_by_name(solicitation_id, attachment_name:str, session,
     
 
 
-    attachment = session.query(db.Attachment).filter(db.Attachment.filename == attachment_name, db.Attachment.solicitation_id == solicitation_id).first()
+    cache = get_session_cache(session)
+    key = ("attachment", solicitation_id, attachment_name)
+    attachment = cache.get(key) if cache is not None else None
+    if attachment is None:
+        attachment = session.query(db.Attachment).filter(db.Attachment.filename == attachment_name, db.Attachment.solicitation_id == solicitation_id).first()
+        if attachment is not None and cache is not None:
+            cache.set(key, attachment)
 
     if as_dict:
         attachment = object_as_dict(attachment) if attachment else None
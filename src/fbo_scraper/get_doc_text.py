@@ -1,75 +1,445 @@
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from itertools import chain, islice
 import logging
+import multiprocessing
 import os
-from zipfile import BadZipfile
+import signal
+import tempfile
+from xml.etree import ElementTree
+from zipfile import BadZipfile, ZipFile
 import re
 
+from bs4 import BeautifulSoup
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import PDFStream, resolve1
+from pdfminer.psparser import LIT
 import textract
 
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where extraction runs without rlimits
+    resource = None
+
 logger = logging.getLogger(__name__)
 
+# bytes needed to tell file types apart by their magic numbers
+SNIFF_BYTES = 2048
+
+MAGIC_NUMBERS = (
+    (b"%PDF-", "pdf"),
+    # OLE2 compound documents: doc, xls, ppt and msg
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "ole"),
+    # zip archives, including docx, xlsx and pptx
+    (b"PK\x03\x04", "zip"),
+    (b"PK\x05\x06", "zip"),
+    (b"{\\rtf", "rtf"),
+    (b"\x89PNG\r\n\x1a\n", "image"),
+    (b"\xff\xd8\xff", "image"),
+    (b"GIF87a", "image"),
+    (b"GIF89a", "image"),
+    (b"II*\x00", "image"),
+    (b"MM\x00*", "image"),
+    (b"\x1a\x45\xdf\xa3", "video"),
+    (b"ID3", "audio"),
+    (b"AC10", "cad"),
+    (b"MZ", "executable"),
+    (b"\x7fELF", "executable"),
+    (b"\x1f\x8b", "gzip"),
+    (b"7z\xbc\xaf\x27\x1c", "7z"),
+    (b"Rar!\x1a\x07", "rar"),
+)
+
+# types we can't get any text out of, so they aren't worth downloading
+UNSUPPORTED_TYPES = frozenset(("video", "audio", "cad", "executable", "gzip", "7z", "rar"))
 
-def get_doc_text(file_name, rm=True):
-    """Textract a doc given its path
+
+def sniff_file_type(head):
+    """
+    Guess a file's type from its first bytes.
+
+    Arguments:
+        head {bytes} -- the start of the file, SNIFF_BYTES is enough
+
+    Returns:
+        one of the types in MAGIC_NUMBERS, "html", "xml" or "text" for text files,
+        or "unknown"
+    """
+    for magic, file_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return file_type
+    if head[4:8] == b"ftyp":
+        return "video"
+    if head.startswith(b"RIFF"):
+        return "audio" if head[8:12] == b"WAVE" else "video"
+
+    if b"\x00" in head:
+        return "unknown"
+    try:
+        # the last character may have been cut in half
+        text = head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:
+            return "unknown"
+        text = head[: e.start].decode("utf-8")
+    start = text.lstrip("\ufeff \t\r\n").lower()
+    if start.startswith("<?xml"):
+        return "xml"
+    if start.startswith("<!doctype html") or "<html" in start:
+        return "html"
+    return "text"
+
+
+@contextmanager
+def open_source(source):
+    """
+    Open source, a path or a binary file object, for reading from the start.
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, "rb") as f:
+            yield f
+    else:
+        source.seek(0)
+        yield source
+
+
+def sniff_file(source):
+    """
+    Returns the sniff_file_type of a file, or "unknown" if it can't be read.
+
+    Arguments:
+        source -- a path or a binary file object
+    """
+    try:
+        with open_source(source) as f:
+            return sniff_file_type(f.read(SNIFF_BYTES))
+    except OSError:
+        return "unknown"
+
+
+class ExtractionBudget:
+    """
+    How much of a file is extracted. Extraction stops as soon as a limit is reached,
+    and truncated is set, so long documents cost a bounded amount of memory and time.
+    A file that isn't worth extracting at all, like a scanned PDF, is skipped and
+    skip_reason says why.
+
+    Parameters:
+        max_pages (int): pages of a PDF that are read
+        max_chars (int): characters of text that are kept
+        max_bytes (int): bytes of a text or HTML file that are read
+    """
+
+    def __init__(self, max_pages=None, max_chars=None, max_bytes=None):
+        self.max_pages = int(max_pages) if max_pages else None
+        self.max_chars = int(max_chars) if max_chars else None
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.truncated = False
+        self.skip_reason = None
+
+    def copy(self):
+        """
+        Returns a budget with the same limits that hasn't been spent.
+        """
+        return ExtractionBudget(self.max_pages, self.max_chars, self.max_bytes)
+
+    def read(self, f):
+        """
+        Read a binary file, up to max_bytes.
+        """
+        if not self.max_bytes:
+            return f.read()
+        data = f.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            self.truncated = True
+            data = data[: self.max_bytes]
+        return data
+
+    def chars_spent(self, length):
+        """
+        Returns True once length characters use up max_chars.
+        """
+        return bool(self.max_chars) and length >= self.max_chars
+
+    def clip(self, text):
+        """
+        Returns text cut to max_chars.
+        """
+        if self.max_chars and len(text) > self.max_chars:
+            self.truncated = True
+            return text[: self.max_chars]
+        return text
+
+
+# sniffed type -> function extracting the text of a file of that type in-process
+EXTRACTORS = {}
+
+# textract parser for sniffed types whose file extension may be wrong
+TEXTRACT_EXTENSIONS = {"pdf": "pdf", "rtf": "rtf"}
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Word writes text boxes twice, for new readers in mc:Choice and old ones in mc:Fallback
+MARKUP_COMPATIBILITY_NAMESPACE = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+
+# pages at the start of a PDF that are checked for text before it's extracted
+SCANNED_CHECK_PAGES = 3
+# how deep form XObjects nested in each other are searched for text and images
+MAX_FORM_DEPTH = 5
+# operators that show text in a PDF content stream, after their string operands
+TEXT_SHOWING_RE = re.compile(rb"(?<=[\s)>\]])(?:Tj|TJ|'|\")(?![^\s\[</(])")
+
+
+def register_extractor(*file_types):
+    """
+    Register the decorated function as the extractor for files sniffed as file_types.
+
+    An extractor is called with the file's path, or a binary file object for files
+    that are only in memory, and an ExtractionBudget to stop at. It returns the text,
+    or None to leave the file to textract.
+    """
+
+    def register(extractor):
+        for file_type in file_types:
+            EXTRACTORS[file_type] = extractor
+        return extractor
+
+    return register
+
+
+def page_content_usage(resources, contents, depth=0):
+    """
+    Returns whether a page, or the forms it draws, shows any text and has any
+    images. Text only counts if there's a font to draw it with.
+
+    Arguments:
+        resources -- the resource dictionary of the page or form
+        contents {list} -- its content streams
+        depth {int} -- how deep the form is nested
+    """
+    resources = resolve1(resources) or {}
+    if not isinstance(resources, dict):
+        return False, False
+    has_text = bool(resolve1(resources.get("Font"))) and any(
+        TEXT_SHOWING_RE.search(resolve1(stream).get_data()) for stream in contents
+    )
+    has_images = False
+    xobjects = resolve1(resources.get("XObject")) or {}
+    if not isinstance(xobjects, dict):
+        return has_text, has_images
+    for xobject in xobjects.values():
+        if has_text:
+            break
+        xobject = resolve1(xobject)
+        if not isinstance(xobject, PDFStream):
+            continue
+        subtype = xobject.get("Subtype")
+        if subtype is LIT("Image"):
+            has_images = True
+        elif subtype is LIT("Form") and depth < MAX_FORM_DEPTH:
+            # a form without resources of its own uses the page's
+            form_text, form_images = page_content_usage(
+                xobject.get("Resources") or resources, [xobject], depth + 1
+            )
+            has_text = has_text or form_text
+            has_images = has_images or form_images
+    return has_text, has_images
+
+
+def scanned_pdf_reason(pages):
+    """
+    Returns why a PDF looks like a scan, going by its first pages, or None.
+
+    A scanned page only draws an image, so there's no text to extract. Checking the
+    resources and content streams of a few pages takes milliseconds, where running
+    every page through pdfminer's layout analysis takes as long as for a PDF with text.
+    """
+    if not pages:
+        return None
+    try:
+        for page in pages:
+            has_text, has_images = page_content_usage(page.resources, page.contents)
+            if has_text or not has_images:
+                return None
+    except Exception as e:
+        # extract anything that can't be checked
+        logger.debug(f"Couldn't check whether a PDF is scanned: {e}")
+        return None
+    return f"scanned document: the first {len(pages)} page(s) are images without any text"
+
+
+@register_extractor("pdf")
+def extract_pdf_text(source, budget):
+    # pdfminer's extract_text only takes a path, so drive its page interpreter directly
+    with open_source(source) as f, StringIO() as output:
+        pages = PDFPage.get_pages(f, check_extractable=True)
+        first_pages = list(islice(pages, SCANNED_CHECK_PAGES))
+        budget.skip_reason = scanned_pdf_reason(first_pages)
+        if budget.skip_reason:
+            return ""
+        resource_manager = PDFResourceManager()
+        device = TextConverter(resource_manager, output, laparams=LAParams())
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        for page_number, page in enumerate(chain(first_pages, pages)):
+            if budget.max_pages and page_number >= budget.max_pages:
+                budget.truncated = True
+                break
+            interpreter.process_page(page)
+            if budget.chars_spent(output.tell()):
+                break
+        device.close()
+        return budget.clip(output.getvalue())
+
+
+def docx_paragraphs(element):
+    """
+    Yields the paragraphs under element in document order, each followed by the
+    paragraphs of the text boxes in it. The mc:Fallback copy of a text box is left out.
+    """
+    for child in element:
+        if child.tag == MARKUP_COMPATIBILITY_NAMESPACE + "Fallback":
+            continue
+        if child.tag == WORD_NAMESPACE + "p":
+            yield child
+        yield from docx_paragraphs(child)
+
+
+def docx_runs(element):
+    """
+    Yields the text of the runs under element, without the text of the paragraphs
+    nested in it, which docx_paragraphs yields separately.
+    """
+    for child in element:
+        if child.tag == WORD_NAMESPACE + "t":
+            yield child.text or ""
+        elif child.tag == WORD_NAMESPACE + "tab":
+            yield "\t"
+        elif child.tag in (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"):
+            yield "\n"
+        elif child.tag not in (WORD_NAMESPACE + "p", MARKUP_COMPATIBILITY_NAMESPACE + "Fallback"):
+            yield from docx_runs(child)
+
+
+@register_extractor("zip")
+def extract_docx_text(source, budget):
+    """
+    Text of the paragraphs of a docx, read from the document XML. Returns None for
+    any other zip, such as an xlsx.
+    """
+    with open_source(source) as f, ZipFile(f) as z:
+        if "word/document.xml" not in z.namelist():
+            return None
+        document = ElementTree.fromstring(z.read("word/document.xml"))
+
+    paragraphs = []
+    length = 0
+    for paragraph in docx_paragraphs(document):
+        if budget.chars_spent(length):
+            break
+        paragraphs.append("".join(docx_runs(paragraph)))
+        length += len(paragraphs[-1]) + 2
+    return budget.clip("\n\n".join(paragraphs))
+
+
+@register_extractor("html")
+def extract_html_text(source, budget):
+    with open_source(source) as f:
+        soup = BeautifulSoup(budget.read(f), "lxml")
+    for element in soup(["script", "style"]):
+        element.decompose()
+    return budget.clip(soup.get_text("\n"))
+
+
+@register_extractor("text")
+def extract_plain_text(source, budget):
+    with open_source(source) as f:
+        return budget.clip(budget.read(f).decode("utf-8", errors="ignore"))
+
+
+def extract_text(source, file_type=None, name=None, budget=None):
+    """
+    Extract the text of a file with the in-process extractor for its sniffed type.
+
+    Arguments:
+        source -- path to a doc, or a binary file object
+        file_type {str} -- its sniff_file_type, sniffed from the file if not given
+        name {str} -- name of the file for log messages, defaults to source
+        budget {ExtractionBudget} -- where to stop, there's no limit by default
+
+    Returns:
+        the text, or None if there's no extractor for the type or it failed, in which
+        case the file should be given to textract
+    """
+    file_type = file_type or sniff_file(source)
+    extractor = EXTRACTORS.get(file_type)
+    if not extractor:
+        return None
+    try:
+        return extractor(source, budget or ExtractionBudget())
+    except MemoryError:
+        raise
+    except Exception as e:
+        logger.warning(
+            f"Couldn't extract the text of {name or source} as {file_type}, falling back to textract: {e}"
+        )
+        return None
+
+
+def extract_bytes(data, name, budget=None):
+    """
+    Extract the text of a file that is only in memory, such as an archive member.
+    Types without an in-process extractor are written to a temporary file for textract.
+
+    Arguments:
+        data {bytes} -- the file's content
+        name {str} -- its name, the extension is used by textract
+        budget {ExtractionBudget} -- where to stop, there's no limit by default
+
+    Returns:
+        the text, or an empty string
+    """
+    budget = budget or ExtractionBudget()
+    file_type = sniff_file_type(data[:SNIFF_BYTES])
+    text = extract_text(BytesIO(data), file_type, name=name, budget=budget)
+    if text is None:
+        fd, temp_name = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            b_text = textract_file(temp_name, file_type)
+        finally:
+            os.remove(temp_name)
+        text = budget.clip(b_text.decode("utf8", errors="ignore")) if b_text else ""
+    return text.strip()
+
+
+def get_doc_text(file_name, rm=True, budget=None):
+    """Extract the text of a doc given its path
+
+    Files are matched to an extractor by their content, not their extension. PDF,
+    DOCX, HTML and plain text files are extracted in-process, and everything else,
+    or anything an extractor fails on, is left to textract.
 
     Arguments:
         file_name {str} -- path to a doc
+        budget {ExtractionBudget} -- where to stop, there's no limit by default. Its
+            truncated flag is set if the text was cut short, and its skip_reason if
+            the file wasn't worth extracting.
     """
     try:
+        budget = budget or ExtractionBudget()
         b_text = None
-        try:
-            b_text = textract.process(file_name, encoding="utf-8", errors="ignore")
-        # ShellError with antiword occurs when an rtf is saved with a doc extension
-        except textract.exceptions.ShellError as e:
-            err_message = str(e)
-            try:
-                if "antiword" in err_message and file_name.endswith(".doc"):
-                    new_name = file_name.replace(".doc", ".rtf")
-                    os.rename(file_name, new_name)
-                    b_text = textract.process(
-                        new_name, encoding="utf-8", errors="ignore"
-                    )
-            except textract.exceptions.ShellError as ex:
-                logger.error(
-                    "Error extracting text from a DOC file. Check that all dependencies of textract are installed.\n{}".format(
-                        ex
-                    )
-                )
-        except textract.exceptions.MissingFileError as e:
-            b_text = None
-            logger.error(
-                f"Couldn't textract {file_name} since the file couldn't be found: {e}",
-                exc_info=True,
-            )
-        # This can be raised when a pdf is incorrectly saved as a .docx (GH183)
-        except BadZipfile as e:
-            if file_name.endswith(".docx"):
-                new_name = file_name.replace(".docx", ".pdf")
-                os.rename(file_name, new_name)
-                b_text = textract.process(
-                    new_name, encoding="utf-8", method="pdftotext", errors="ignore"
-                )
-            else:
-                b_text = None
-                logger.warning(
-                    f"Exception occurred textracting {file_name}: {e}", exc_info=True
-                )
-        # TypeError is raised when None is passed to str.decode()
-        # This happens when textract can't extract text from scanned documents
-        except TypeError:
-            b_text = None
-        except Exception as e:
-            if re.match("^(.*) file; not supported", str(e)):
-                logger.warning(f"'{file_name}' is type {str(e)}")
-            elif re.match("^The filename extension .zip is not yet supported", str(e)):
-                logger.warning(
-                    f"'{file_name}' is type zip and not supported by textract"
-                )
-            else:
-                logger.warning(
-                    f"Exception occurred textracting {file_name}: {e}", exc_info=True
-                )
-            b_text = None
-        text = b_text.decode("utf8", errors="ignore").strip() if b_text else ""
+        file_type = sniff_file(file_name)
+        text = extract_text(file_name, file_type, budget=budget)
+        if text is not None:
+            b_text = text.encode("utf-8")
+        else:
+            b_text = textract_file(file_name, file_type)
+        # textract can't stop early, so its text is only cut to size afterwards
+        text = budget.clip(b_text.decode("utf8", errors="ignore")).strip() if b_text else ""
         if rm:
             try:
                 os.remove(file_name)
@@ -78,6 +448,9 @@ def get_doc_text(file_name, rm=True):
             finally:
                 return text
 
+    except MemoryError:
+        # let the extraction supervisor know the worker ran out of memory
+        raise
     except Exception as e:
         logger.error(
             f"Error uncaught when trying to parse file {file_name}. Giving up and returning an empty string. {e}",
@@ -86,3 +459,367 @@ def get_doc_text(file_name, rm=True):
         text = ""
 
     return text
+
+
+def textract_file(file_name, file_type=None):
+    """Textract a doc given its path
+
+    Arguments:
+        file_name {str} -- path to a doc
+        file_type {str} -- its sniff_file_type. PDF and RTF files are parsed as such
+            whatever their extension.
+
+    Returns:
+        the text as utf-8 bytes, or None
+    """
+    b_text = None
+    # a file whose extension doesn't match its content goes straight to the right parser
+    extension = TEXTRACT_EXTENSIONS.get(file_type)
+    kwargs = {"extension": extension} if extension else {}
+    try:
+        b_text = textract.process(file_name, encoding="utf-8", errors="ignore", **kwargs)
+    # ShellError with antiword occurs when an rtf is saved with a doc extension
+    except textract.exceptions.ShellError as e:
+        err_message = str(e)
+        try:
+            if "antiword" in err_message and file_name.endswith(".doc"):
+                new_name = file_name.replace(".doc", ".rtf")
+                os.rename(file_name, new_name)
+                b_text = textract.process(
+                    new_name, encoding="utf-8", errors="ignore"
+                )
+        except textract.exceptions.ShellError as ex:
+            logger.error(
+                "Error extracting text from a DOC file. Check that all dependencies of textract are installed.\n{}".format(
+                    ex
+                )
+            )
+    except textract.exceptions.MissingFileError as e:
+        b_text = None
+        logger.error(
+            f"Couldn't textract {file_name} since the file couldn't be found: {e}",
+            exc_info=True,
+        )
+    # This can be raised when a pdf is incorrectly saved as a .docx (GH183)
+    except BadZipfile as e:
+        if file_name.endswith(".docx"):
+            new_name = file_name.replace(".docx", ".pdf")
+            os.rename(file_name, new_name)
+            b_text = textract.process(
+                new_name, encoding="utf-8", method="pdftotext", errors="ignore"
+            )
+        else:
+            b_text = None
+            logger.warning(
+                f"Exception occurred textracting {file_name}: {e}", exc_info=True
+            )
+    # TypeError is raised when None is passed to str.decode()
+    # This happens when textract can't extract text from scanned documents
+    except TypeError:
+        b_text = None
+    except MemoryError:
+        raise
+    except Exception as e:
+        if re.match("^(.*) file; not supported", str(e)):
+            logger.warning(f"'{file_name}' is type {str(e)}")
+        elif re.match("^The filename extension .zip is not yet supported", str(e)):
+            logger.warning(
+                f"'{file_name}' is type zip and not supported by textract"
+            )
+        else:
+            logger.warning(
+                f"Exception occurred textracting {file_name}: {e}", exc_info=True
+            )
+        b_text = None
+    return b_text
+
+
+# zip-bomb limits for archive attachments
+MAX_ARCHIVE_MEMBERS = 200
+MAX_MEMBER_BYTES = 100 * 1024 * 1024
+MAX_ARCHIVE_BYTES = 500 * 1024 * 1024
+MAX_COMPRESSION_RATIO = 100
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+# members of a zip that make it a document (docx, xlsx, odt, epub...) rather than an archive
+DOCUMENT_ZIP_MEMBERS = ("[Content_Types].xml", "mimetype")
+
+
+def is_archive(file_name):
+    """
+    Returns True if file_name is a zip archive of other files, rather than a
+    document that happens to be stored as a zip, like a docx.
+    """
+    if sniff_file(file_name) != "zip":
+        return False
+    try:
+        with ZipFile(file_name) as z:
+            names = set(z.namelist())
+    except (BadZipfile, OSError):
+        return False
+    return not any(member in names for member in DOCUMENT_ZIP_MEMBERS)
+
+
+def read_archive_member(z, info, max_bytes):
+    """
+    Read a member of an open ZipFile, a chunk at a time, giving up as soon as it turns
+    out to be an unsupported type or bigger than max_bytes. The sizes in the archive
+    can't be trusted, since they're written by whoever made it.
+
+    Returns:
+        (data, skip_reason) -- the member's content, or why it was skipped
+    """
+    chunks = []
+    size = 0
+    with z.open(info) as member:
+        while True:
+            chunk = member.read(ARCHIVE_CHUNK_SIZE)
+            if not chunk:
+                break
+            if not chunks:
+                file_type = sniff_file_type(chunk[:SNIFF_BYTES])
+                if file_type in UNSUPPORTED_TYPES:
+                    return None, f"unsupported type {file_type}"
+            size += len(chunk)
+            if size > max_bytes:
+                return None, f"larger than {max_bytes} bytes"
+            chunks.append(chunk)
+    return b"".join(chunks), None
+
+
+def iter_archive_members(
+    source,
+    max_members=MAX_ARCHIVE_MEMBERS,
+    max_member_bytes=MAX_MEMBER_BYTES,
+    max_total_bytes=MAX_ARCHIVE_BYTES,
+    max_ratio=MAX_COMPRESSION_RATIO,
+):
+    """
+    Iterate over the files in a zip archive, skipping directories.
+
+    Members that are encrypted, of a type we can't extract text from, or that break
+    one of the zip-bomb limits are yielded without their content. Once the archive
+    has more than max_members files, or max_total_bytes have been read, the rest of
+    it is left alone.
+
+    Arguments:
+        source -- path to the archive, or a binary file object
+        max_members {int} -- the most members that are read
+        max_member_bytes {int} -- members larger than this are skipped
+        max_total_bytes {int} -- the most bytes read from the whole archive
+        max_ratio {float} -- members compressed more than this are skipped
+
+    Yields:
+        (name, data, skip_reason) for each file in the archive
+    """
+    total = 0
+    members = 0
+    with open_source(source) as f, ZipFile(f) as z:
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            members += 1
+            if members > max_members:
+                logger.warning(f"Only the first {max_members} members of the archive were read")
+                return
+
+            if info.flag_bits & 0x1:
+                yield info.filename, None, "encrypted"
+                continue
+            if info.file_size > max_member_bytes:
+                yield info.filename, None, f"larger than {max_member_bytes} bytes"
+                continue
+            if info.file_size > max_ratio * max(info.compress_size, 1):
+                yield info.filename, None, f"compression ratio above {max_ratio}"
+                continue
+
+            remaining = max_total_bytes - total
+            limit = min(max_member_bytes, remaining)
+            data, skip_reason = read_archive_member(z, info, limit)
+            if data is None and limit < max_member_bytes and skip_reason.startswith("larger"):
+                # the member would take the archive over max_total_bytes
+                logger.warning(f"Stopped reading the archive after {total} bytes")
+                yield info.filename, None, f"archive larger than {max_total_bytes} bytes"
+                return
+            if data is not None:
+                total += len(data)
+            yield info.filename, data, skip_reason
+
+
+def get_archive_text(file_name, rm=True, budget=None):
+    """Extract the text of each file in a zip archive, in memory
+
+    Arguments:
+        file_name {str} -- path to the archive
+        rm {bool} -- remove the archive afterwards
+        budget {ExtractionBudget} -- where to stop extracting each file
+
+    Returns:
+        a list with a (member name, text, skip reason, truncated) tuple for each file
+        in the archive
+    """
+    members = []
+    try:
+        for name, data, skip_reason in iter_archive_members(file_name):
+            if skip_reason:
+                logger.info(f"Skipping {name} in {file_name}: {skip_reason}")
+                members.append((name, "", skip_reason, False))
+                continue
+            member_budget = budget.copy() if budget else ExtractionBudget()
+            text = extract_bytes(data, name, budget=member_budget)
+            members.append((name, text, member_budget.skip_reason, member_budget.truncated))
+    except (BadZipfile, OSError, RuntimeError) as e:
+        logger.warning(f"Couldn't read the archive {file_name}: {e}")
+    finally:
+        if rm:
+            try:
+                os.remove(file_name)
+            except Exception as e:
+                logger.error(f"{e}Unable to remove {file_name}", exc_info=True)
+    return members
+
+
+def extraction_context():
+    """
+    Returns the multiprocessing context extraction processes are started with.
+
+    Where it's available that's forkserver, so that they're forked from a server
+    with nothing running but the main thread, and not from a process whose download
+    threads or logging handlers may be holding locks that a forked child would
+    wait on forever. The server imports this module once, up front, so the processes
+    don't each have to import the extraction libraries.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["fbo_scraper.get_doc_text"])
+        return context
+    return multiprocessing.get_context()
+
+
+def virtual_memory_size():
+    """
+    Returns the size of this process's address space in bytes, or 0 if it isn't known.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def set_extraction_limits(max_memory_mb=None, max_cpu_seconds=None):
+    """
+    Limit the memory and CPU time of the current process and the subprocesses it starts.
+    """
+    if resource is None:
+        return
+    if max_memory_mb:
+        # the worker starts out with the libraries already mapped, so the limit is on
+        # how far it can grow from here
+        limit = virtual_memory_size() + int(max_memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if max_cpu_seconds:
+        # SIGXCPU at the soft limit, SIGKILL at the hard one
+        soft = max(int(max_cpu_seconds), 1)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 5))
+
+
+def extraction_worker(
+    conn, file_name, extract=None, budget=None, max_memory_mb=None, max_cpu_seconds=None
+):
+    # its own process group, so textract's subprocesses are killed along with it
+    os.setpgrp()
+    set_extraction_limits(max_memory_mb, max_cpu_seconds)
+    budget = budget or ExtractionBudget()
+    try:
+        result = (extract or get_doc_text)(file_name, rm=False, budget=budget)
+        conn.send((result, None, budget.truncated, budget.skip_reason))
+    except MemoryError:
+        conn.send(("", f"memory limit of {max_memory_mb} MB exceeded", False, None))
+    finally:
+        conn.close()
+
+
+def kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        # the worker didn't get as far as starting its own group, or this isn't posix
+        process.kill()
+
+
+def get_doc_text_supervised(
+    file_name,
+    timeout=None,
+    max_memory_mb=None,
+    max_cpu_seconds=None,
+    rm=True,
+    extract=None,
+    budget=None,
+):
+    """Extract the text of a doc in a worker process, so that a file that takes too
+    long or uses too much memory can't hold up the rest of the run.
+
+    The worker is killed, along with any subprocesses it started, if it hasn't
+    finished after timeout seconds. Its memory and CPU time are limited with rlimits
+    where the platform has them.
+
+    Arguments:
+        file_name {str} -- path to a doc
+        timeout {float} -- seconds to wait for the text
+        max_memory_mb {int} -- megabytes of memory the worker can allocate
+        max_cpu_seconds {int} -- CPU time the worker can use, defaults to timeout
+        rm {bool} -- remove the file afterwards
+        extract {callable} -- what the worker runs, get_doc_text unless it's
+            another module level function taking the file name, rm and budget,
+            like get_archive_text
+        budget {ExtractionBudget} -- where to stop. Its truncated flag and skip_reason
+            are set as the worker set them.
+
+    Returns:
+        (text, error) -- what extract returned, or an empty string and why there
+            isn't any text if extraction failed
+    """
+    if max_cpu_seconds is None and timeout:
+        max_cpu_seconds = timeout
+    context = extraction_context()
+    receiver, sender = context.Pipe(duplex=False)
+    worker = context.Process(
+        target=extraction_worker,
+        args=(sender, file_name, extract, budget, max_memory_mb, max_cpu_seconds),
+    )
+    worker.start()
+    sender.close()
+
+    text, error = "", None
+    try:
+        if receiver.poll(timeout):
+            text, error, truncated, skip_reason = receiver.recv()
+            if budget:
+                budget.truncated = budget.truncated or truncated
+                budget.skip_reason = skip_reason
+        else:
+            error = f"extraction timed out after {timeout} seconds"
+            kill_process_group(worker)
+    except EOFError:
+        # the worker died without sending anything
+        worker.join()
+        if worker.exitcode == -getattr(signal, "SIGXCPU", 0):
+            error = f"CPU time limit of {max_cpu_seconds} seconds exceeded"
+        else:
+            error = f"extraction worker exited with code {worker.exitcode}"
+    finally:
+        receiver.close()
+        worker.join()
+
+    if error:
+        logger.warning(f"Couldn't extract the text of {file_name}: {error}")
+    if rm:
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            # textract renames files saved with the wrong extension
+            pass
+        except Exception as e:
+            logger.error(f"{e}Unable to remove {file_name}", exc_info=True)
+    return text, error
@@ -1,26 +1,63 @@
+import asyncio
 import logging
 import os
 import sys
 import re
 import datetime
-import urllib3
-import shutil
+import time
 import hashlib
 import urllib
 import errno
+import shutil
+import tempfile
+from collections import deque
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
 import pandas as pd
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from fbo_scraper.get_doc_text import get_doc_text
+from fbo_scraper.get_doc_text import (
+    ExtractionBudget,
+    extraction_context,
+    get_archive_text,
+    get_doc_text,
+    get_doc_text_supervised,
+    is_archive,
+    sniff_file_type,
+    SNIFF_BYTES,
+    UNSUPPORTED_TYPES,
+)
+from fbo_scraper.attachment_cache import file_content_hash
 from fbo_scraper.sam_utils import schematize_opp
-from fbo_scraper.request_utils import requests_retry_session
+from fbo_scraper.request_utils import get_http_session, get_pool_manager, sam_get, sam_request
 
 logger = logging.getLogger(__name__)
 
+# Deepest record offset we page through for one search. Longer date ranges are split
+# into smaller windows until each one fits.
+MAX_RESULT_DEPTH = 10000
+# attachments larger than this aren't downloaded
+MAX_ATTACHMENT_BYTES = 250 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
 class SamApiError(Exception):
     pass
 
+
+class ResultWindowTooDeep(SamApiError):
+    """
+    Raised when a search covering more than one day has more records than we can page through.
+    """
+
+    def __init__(self, total_records, max_depth):
+        self.total_records = total_records
+        self.max_depth = max_depth
+        super().__init__(
+            f"Search has {total_records} records, more than the maximum depth of {max_depth}"
+        )
+
 def get_opportunities_search_url(
     api_key=None,
     page_size=500,
@@ -71,12 +108,10 @@ def get_opportunities_search_url(
 def get_opp_from_sam(solNum):
     base_uri = os.getenv("SAM_API_URI") or "https://api.sam.gov/opportunities/v2/search"
     uri = base_uri + f"?solnum={solNum}&api_key={os.getenv('SAM_API_KEY')}&limit=1"
-    session = requests_retry_session()
-    r = session.get(uri, timeout=100)
+    r = sam_get(get_http_session(), uri)
     data = r.json()
     if data["totalRecords"] == 0:
         return None
-    session.close()
     return data["opportunitiesData"][0]
 
 
@@ -103,6 +138,39 @@ def sam_format_date(input_date):
     return input_date
 
 
+def sam_parse_date(input_date):
+    """
+    Returns input_date as a datetime.date. Accepts the formats sam_format_date does, or "yesterday".
+    """
+    if input_date == "yesterday":
+        return datetime.date.today() - datetime.timedelta(days=1)
+    return datetime.datetime.strptime(sam_format_date(input_date), "%m/%d/%Y").date()
+
+
+def days_between(from_date, to_date):
+    """
+    Returns the list of days from from_date to to_date, inclusive.
+
+    Args:
+        from_date: a datetime.date, a string formatted mm/dd/yyyy or mm-dd-yyyy, or "yesterday"
+        to_date: same formats as from_date
+    """
+    first, last = sam_parse_date(from_date), sam_parse_date(to_date)
+    return [first + datetime.timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+def date_windows(from_date, to_date, window_days=1):
+    """
+    Split a date range into (first day, last day) windows of at most window_days days.
+    """
+    days = days_between(from_date, to_date)
+    window_days = max(int(window_days or 1), 1)
+    return [
+        (days[i], days[min(i + window_days, len(days)) - 1])
+        for i in range(0, len(days), window_days)
+    ]
+
+
 def get_opps_for_day(
     opportunity_filter_function=None,
     limit=None,
@@ -110,6 +178,7 @@ def get_opps_for_day(
     from_date="yesterday",
     to_date="yesterday",
     filter=None,
+    max_workers=1,
 ):
     """
 
@@ -120,9 +189,126 @@ def get_opps_for_day(
         from_date: formatted mm/dd/yyyy or the default string "yesterday" if you want the function to use yesterday
         to_date: formatted mm/dd/yyyy or the default string "yesterday" if you want the function to use yesterday
         filter: Additional query string arguments for the SAM.gov api call
+        max_workers: Maximum number of result pages requested from SAM.gov at the same time
 
     Returns:
 
+    """
+    opps = []
+    for page in iter_opps_pages(
+        opportunity_filter_function=opportunity_filter_function,
+        limit=limit,
+        target_sol_types=target_sol_types,
+        from_date=from_date,
+        to_date=to_date,
+        filter=filter,
+        max_workers=max_workers,
+    ):
+        opps.extend(page)
+
+    return opps
+
+
+def iter_window_pages(from_date, to_date, max_depth=MAX_RESULT_DEPTH, **kwargs):
+    """
+    iter_opps_pages for a date window, splitting the window in half, and the halves
+    again, while it has more than max_depth records. Yields the pages of each part
+    of the window in date order. kwargs are passed to iter_opps_pages.
+    """
+    try:
+        yield from iter_opps_pages(
+            from_date=from_date, to_date=to_date, max_depth=max_depth, **kwargs
+        )
+    except ResultWindowTooDeep as e:
+        days = days_between(from_date, to_date)
+        middle = len(days) // 2
+        logger.info(
+            f"Splitting {days[0]} to {days[-1]} ({e.total_records} records) at {days[middle]}"
+        )
+        yield from iter_window_pages(days[0], days[middle - 1], max_depth=max_depth, **kwargs)
+        yield from iter_window_pages(days[middle], days[-1], max_depth=max_depth, **kwargs)
+
+
+def get_opps_for_range(
+    opportunity_filter_function=None,
+    limit=None,
+    target_sol_types="o,k",
+    from_date="yesterday",
+    to_date="yesterday",
+    max_workers=1,
+    window_days=1,
+    max_depth=MAX_RESULT_DEPTH,
+):
+    """
+    Fetch the opportunities posted in a date range, window_days at a time.
+
+    The windows are fetched concurrently, up to max_workers at once, and any window
+    with more than max_depth records is split further. The results are merged in date
+    order, keeping the first opportunity for each solicitation number.
+
+    Takes the same arguments as get_opps_for_day, plus:
+        window_days: number of days in each window
+        max_depth: the most records we page through in a single search
+    """
+    windows = date_windows(from_date, to_date, window_days)
+    if len(windows) == 1:
+        # nothing to fetch concurrently, so request the pages of the window concurrently instead
+        window_workers, page_workers = 1, max_workers
+    else:
+        window_workers, page_workers = max_workers, 1
+
+    def get_window(window):
+        opps = []
+        for page in iter_window_pages(
+            window[0],
+            window[1],
+            max_depth=max_depth,
+            opportunity_filter_function=opportunity_filter_function,
+            limit=limit,
+            target_sol_types=target_sol_types,
+            max_workers=page_workers,
+        ):
+            opps.extend(page)
+        return opps
+
+    with stage_executor(ThreadPoolExecutor, window_workers) as executor:
+        window_opps = [executor.submit(get_window, window) for window in windows]
+
+        opps = []
+        seen = set()
+        for future in window_opps:
+            for opp in future.result():
+                if opp["solicitationNumber"] in seen:
+                    continue
+                seen.add(opp["solicitationNumber"])
+                opps.append(opp)
+
+    if limit and len(opps) > limit:
+        opps = opps[:limit]
+
+    return opps
+
+
+def iter_opps_pages(
+    opportunity_filter_function=None,
+    limit=None,
+    target_sol_types="o,k",
+    from_date="yesterday",
+    to_date="yesterday",
+    filter=None,
+    max_workers=1,
+    max_depth=None,
+):
+    """
+    Generator version of get_opps_for_day that yields the filtered opportunities
+    one page of search results at a time, in the order SAM.gov returns them.
+
+    Up to max_workers pages are requested ahead of the one being yielded, so
+    only a handful of pages are held in memory however many records there are.
+
+    If the search has more than max_depth records, ResultWindowTooDeep is raised
+    before anything is yielded so that the caller can split the date range. A
+    single day can't be split, so it's paged through to max_depth with a warning.
     """
     api_key = os.getenv("SAM_API_KEY")
     if not api_key:
@@ -140,60 +326,176 @@ def get_opps_for_day(
         uri += "&" + filter
     logger.debug("Fetching yesterday's opps from {}".format(uri))
 
-    totalRecords = 9999999
-    offset = 0
-    opps = []
+    max_workers = max(int(max_workers or 1), 1)
+    session = get_http_session()
+    # The first page tells us how many records there are, which lets us
+    # request the remaining pages concurrently.
+    data = get_opps_page(session, uri, 0)
+    total_records = data["totalRecords"]
+    if max_depth and total_records > max_depth:
+        if sam_parse_date(from_date) != sam_parse_date(to_date):
+            raise ResultWindowTooDeep(total_records, max_depth)
+        logger.warning(
+            f"{total_records} records posted on {sam_format_date(from_date)}, "
+            f"only the first {max_depth} can be fetched"
+        )
+        total_records = max_depth
+    page_size = len(data["opportunitiesData"])
+    page = filter_opps_page(data, opportunity_filter_function)
+    if limit:
+        page = page[:limit]
+    count = len(page)
+    yield page
 
-    session = requests_retry_session()
-    while offset < totalRecords and (not limit or len(opps) < limit):
-        uri_with_offset = f"{uri}&offset={offset}"
-        r = session.get(uri_with_offset, timeout=100)
-        data = r.json()
-
-        if r.status_code != 200:
-            api_error = data.get("error", {}).get("message")
-            raise SamApiError(f"Sam.gov API returned error message: {api_error}")
-
-        logger.debug(f"Retrieved json from {uri_with_offset}: {data}")
-        totalRecords = data['totalRecords']
-        offset += len(data['opportunitiesData'])
-
-        opportunities_data = data["opportunitiesData"]
-
-        for o in opportunities_data:
-            logger.debug(
-                o["postedDate"]
-                + " "
-                + o["solicitationNumber"]
-                + " "
-                + o["title"]
-                + " "
-                + o["active"]
-            )
+    offsets = list(range(page_size, total_records, page_size)) if page_size else []
+    if limit and not opportunity_filter_function:
+        offsets = [offset for offset in offsets if offset < limit]
+    offsets = iter(offsets)
 
-        if opportunity_filter_function:
-            opportunities_data = [
-                o for o in opportunities_data if opportunity_filter_function(o)
-            ]
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while not limit or count < limit:
+                # keep max_workers requests in flight, and yield the pages in order
+                for offset in offsets:
+                    pending.append(executor.submit(get_opps_page, session, uri, offset))
+                    if len(pending) >= max_workers:
+                        break
+                if not pending:
+                    break
+                page = filter_opps_page(
+                    pending.popleft().result(), opportunity_filter_function
+                )
+                if limit:
+                    page = page[: limit - count]
+                count += len(page)
+                yield page
+        finally:
+            # don't wait on pages nobody will read if we stop early
+            for future in pending:
+                future.cancel()
 
-        opps.extend(opportunities_data)
 
-        logger.info(
-            f"{len(opportunities_data)} opportunities matched the filter out of {len(data['opportunitiesData'])} total opps in this round"
+def get_opps_page(session, uri, offset):
+    """
+    Fetch a single page of search results from the SAM.gov API.
+
+    Args:
+        session: requests session to make the call with
+        uri: search uri returned by get_opportunities_search_url
+        offset: record offset of the page
+
+    Returns:
+        the decoded json response
+    """
+    uri_with_offset = f"{uri}&offset={offset}"
+    r = sam_get(session, uri_with_offset)
+    data = r.json()
+
+    if r.status_code != 200:
+        api_error = data.get("error", {}).get("message")
+        raise SamApiError(f"Sam.gov API returned error message: {api_error}")
+
+    logger.debug(f"Retrieved json from {uri_with_offset}: {data}")
+    return data
+
+
+def filter_opps_page(data, opportunity_filter_function=None):
+    """
+    Apply the opportunity filter to a page of search results.
+
+    Args:
+        data: a decoded search response from get_opps_page
+        opportunity_filter_function: function that returns true for opportunites we want to process
+
+    Returns:
+        list of the opportunities on the page that matched the filter
+    """
+    opportunities_data = data["opportunitiesData"]
+
+    for o in opportunities_data:
+        logger.debug(
+            o["postedDate"]
+            + " "
+            + o["solicitationNumber"]
+            + " "
+            + o["title"]
+            + " "
+            + o["active"]
         )
 
-    session.close()
+    if opportunity_filter_function:
+        opportunities_data = [
+            o for o in opportunities_data if opportunity_filter_function(o)
+        ]
 
-    if limit and len(opps) > limit:
-        opps = opps[:limit]
+    logger.info(
+        f"{len(opportunities_data)} opportunities matched the filter out of {len(data['opportunitiesData'])} total opps in this round"
+    )
 
-    return opps
+    return opportunities_data
+
+
+def write_attachment(r, filename, max_bytes=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Stream an attachment response to filename, a chunk at a time.
+
+    The type is sniffed from the first bytes, and nothing is written for types we
+    can't extract text from. The download is abandoned, and the partial file
+    removed, once it is larger than max_bytes.
+
+    Returns:
+        a (file type, bytes read, reason it was skipped or None) tuple
+    """
+    head = r.read(SNIFF_BYTES)
+    file_type = sniff_file_type(head)
+    if file_type in UNSUPPORTED_TYPES:
+        return file_type, len(head), "unsupported type"
+
+    size = len(head)
+    with open(filename, "wb") as out:
+        out.write(head)
+        for chunk in r.stream(chunk_size):
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                break
+            out.write(chunk)
+    if max_bytes and size > max_bytes:
+        os.remove(filename)
+        return file_type, size, "too large"
+    r.release_conn()
+    return file_type, size, None
+
+
+def discard_response(r):
+    """
+    Give up on a response without reading its body. The connection is closed
+    rather than returned to the pool, since the unread body is still on it.
+    """
+    r.close()
+    r.release_conn()
+
+
+def log_attachment_download(url, outcome, started, size=0, file_type=None, reason=None):
+    logger.info(
+        f"Attachment {outcome}: {url}",
+        extra={
+            "attachment download": {
+                "url": url,
+                "outcome": outcome,
+                "bytes": size,
+                "seconds": round(time.monotonic() - started, 3),
+                "type": file_type,
+                "reason": reason,
+            }
+        },
+    )
 
 
 def make_attachment_request(file_url, http, headers: dict = None):
     r = None
     try:
-        r = http.request("GET", file_url, preload_content=False, headers=headers)
+        r = sam_request(http.request, "GET", file_url, preload_content=False, headers=headers)
     except Exception as e:
         logger.error(
             f"{type(e)} encountered when trying to download an attachement from {file_url}"
@@ -202,46 +504,150 @@ def make_attachment_request(file_url, http, headers: dict = None):
         if re.search("beta.sam.gov", file_url):
             new_file_url = file_url.replace("beta.sam.gov", "sam.gov")
             logger.info(f"rewriting attachment url from {file_url} to {new_file_url} ")
-            return make_attachment_request(new_file_url, http)
+            return make_attachment_request(new_file_url, http, headers=headers)
     return r
 
 
-def get_docs(opp, out_path, headers: dict = None):
+def get_docs(
+    opp, out_path, headers: dict = None, cache=None, max_bytes=MAX_ATTACHMENT_BYTES
+):
+    """
+    Download the attachments for an opportunity.
+
+    Returns a list with a (file path, url) tuple for each downloaded attachment.
+    When an AttachmentCache is given, attachments whose text is already in the
+    cache aren't kept for extraction; their attachment data dict is returned in
+    place of the tuple. Requests for cached urls are made conditional on the
+    ETag/Last-Modified we saw last time.
+
+    Attachments larger than max_bytes, and those whose first bytes show a type we
+    can't extract text from, are skipped without downloading the rest of them.
+    """
     filelist = []
-    http = urllib3.PoolManager()
+    http = get_pool_manager()
     for file_url in opp["resourceLinks"] or []:
+        started = time.monotonic()
+        conditional_headers = cache.conditional_headers(file_url) if cache else {}
+        r = make_attachment_request(
+            file_url, http, headers={**(headers or {}), **conditional_headers} or None
+        )
+        if cache and r and r.status == 304:
+            r.release_conn()
+            cached = cache.lookup_not_modified(file_url)
+            if cached:
+                logger.info("{} has not been modified, using cached text".format(file_url))
+                log_attachment_download(file_url, "not modified", started)
+                filelist.append(
+                    make_attachment_data(
+                        cached["text"],
+                        file_url,
+                        cached["filename"],
+                        cached["machine_readable"],
+                        truncated=cached["truncated"],
+                        extraction_error=cached["extraction_error"],
+                    )
+                )
+                continue
+            # the cached text was evicted after we sent the request, so ask again
+            r = make_attachment_request(file_url, http, headers=headers)
+        if not r:
+            continue
+        if r.status != 200 or "Content-Disposition" not in r.headers:
+            discard_response(r)
+            log_attachment_download(file_url, "skipped", started, reason=f"status {r.status}")
+            continue
+        content_disposition = r.headers[
+            "Content-Disposition"
+        ]  # should be in the form "attachment; filename=Attachment+5+Non-Disclosure+Agreement.docx"
+        match = re.search("filename=(.*)", content_disposition)
+        if not (match and len(match.groups()) > 0):
+            r.release_conn()
+            continue
+        real_filename = urllib.parse.unquote(match.group(1)).replace(
+            "+", " "
+        )  # have to replace + with space because parse doesn't do that
+
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        content_length = r.headers.get("Content-Length")
+        if cache:
+            cached = cache.lookup_url(file_url, etag, content_length, last_modified)
+            if cached:
+                # the headers match a response we've already extracted, so don't download the body
+                r.release_conn()
+                logger.info("Using cached text for {}".format(real_filename))
+                log_attachment_download(file_url, "cached", started)
+                filelist.append(
+                    make_attachment_data(
+                        cached["text"],
+                        file_url,
+                        real_filename,
+                        cached["machine_readable"],
+                        truncated=cached["truncated"],
+                        extraction_error=cached["extraction_error"],
+                    )
+                )
+                continue
+
+        if max_bytes and content_length and int(content_length) > max_bytes:
+            logger.warning(f"Skipping {real_filename}, it is {content_length} bytes")
+            discard_response(r)
+            log_attachment_download(file_url, "skipped", started, reason="too large")
+            continue
+
         filename = os.path.join(
             out_path, hashlib.sha1(file_url.encode("utf-8")).hexdigest()
         )
-        with open(filename, "wb") as out:
-            r = make_attachment_request(file_url, http, headers=headers)
-            if r and "Content-Disposition" in r.headers:
-                shutil.copyfileobj(r, out)
-                content_disposition = r.headers[
-                    "Content-Disposition"
-                ]  # should be in the form "attachment; filename=Attachment+5+Non-Disclosure+Agreement.docx"
-                match = re.search("filename=(.*)", content_disposition)
-                if match and len(match.groups()) > 0:
-                    real_filename = urllib.parse.unquote(match.group(1)).replace(
-                        "+", " "
-                    )  # have to replace + with space because parse doesn't do that
-                    real_filename_with_path = os.path.join(out_path, real_filename)
-                    try:
-                        os.rename(filename, real_filename_with_path)
-                    except OSError as e:
-                        if e.errno == errno.ENAMETOOLONG:
-                            logger.warning(
-                                f"Filename {real_filename_with_path} is too long. Shortening Name."
-                            )
-                            real_filename_with_path = handle_file_too_long(
-                                real_filename_with_path
-                            )
-                            os.rename(filename, real_filename_with_path)
-                        else:
-                            raise
-                    logger.info("Downloaded file {}".format(real_filename_with_path))
-                    filelist.append((real_filename_with_path, file_url))
-    http.clear()
+        file_type, size, skip_reason = write_attachment(r, filename, max_bytes=max_bytes)
+        if skip_reason:
+            logger.warning(f"Skipping {real_filename}: {skip_reason} ({file_type})")
+            discard_response(r)
+            log_attachment_download(
+                file_url, "skipped", started, size=size, file_type=file_type, reason=skip_reason
+            )
+            continue
+        real_filename_with_path = os.path.join(out_path, real_filename)
+        try:
+            os.rename(filename, real_filename_with_path)
+        except OSError as e:
+            if e.errno == errno.ENAMETOOLONG:
+                logger.warning(
+                    f"Filename {real_filename_with_path} is too long. Shortening Name."
+                )
+                real_filename_with_path = handle_file_too_long(
+                    real_filename_with_path
+                )
+                os.rename(filename, real_filename_with_path)
+            else:
+                raise
+        logger.info("Downloaded file {}".format(real_filename_with_path))
+        log_attachment_download(file_url, "downloaded", started, size=size, file_type=file_type)
+
+        if cache:
+            cached = cache.lookup_content(
+                file_url,
+                file_content_hash(real_filename_with_path),
+                etag=etag,
+                content_length=content_length,
+                last_modified=last_modified,
+                filename=os.path.basename(real_filename_with_path),
+            )
+            if cached:
+                logger.info("Using cached text for {}".format(real_filename))
+                os.remove(real_filename_with_path)
+                filelist.append(
+                    make_attachment_data(
+                        cached["text"],
+                        file_url,
+                        os.path.basename(real_filename_with_path),
+                        cached["machine_readable"],
+                        truncated=cached["truncated"],
+                        extraction_error=cached["extraction_error"],
+                    )
+                )
+                continue
+
+        filelist.append((real_filename_with_path, file_url))
     return filelist
 
 
@@ -262,10 +668,15 @@ def handle_file_too_long(filepath: os.path) -> Path:
     return Path(path, new_filename)
 
 
-def get_attachment_data(file_name, url):
-    text = get_doc_text(file_name)
-    fn = os.path.basename(file_name)
-    machine_readable = True if text else False
+def make_attachment_data(
+    text,
+    url,
+    filename,
+    machine_readable,
+    extraction_error=None,
+    truncated=False,
+    extraction_failed=False,
+):
     attachment_data = {
         "text": text,
         "url": url,
@@ -274,32 +685,291 @@ def get_attachment_data(file_name, url):
         "validation": None,
         "trained": False,
         "machine_readable": machine_readable,
-        "filename": fn,
+        "filename": filename,
     }
+    if extraction_error:
+        # why there's no text, e.g. the extraction timed out
+        attachment_data["extraction_error"] = extraction_error
+    if extraction_failed:
+        # the error was the extraction's, not the file's, so it's worth trying again
+        attachment_data["extraction_failed"] = True
+    if truncated:
+        # the text stops where the extraction budget ran out
+        attachment_data["truncated"] = True
 
     return attachment_data
 
 
-def transform_opps(opps, out_path, skip_attachments=False):
+def split_extract_limits(extract_limits):
+    """
+    Split extract_limits into an ExtractionBudget, from its max_pages, max_chars and
+    max_bytes, and the rest, which are the arguments of get_doc_text_supervised.
+    The file only needs to be extracted in a supervised worker if there are any.
+    """
+    limits = dict(extract_limits or {})
+    budget = ExtractionBudget(
+        max_pages=limits.pop("max_pages", None),
+        max_chars=limits.pop("max_chars", None),
+        max_bytes=limits.pop("max_bytes", None),
+    )
+    return budget, {name: value for name, value in limits.items() if value}
+
+
+def get_attachment_data(file_name, url, extract_limits=None):
+    """
+    Extract the text of a downloaded attachment, within the max_pages, max_chars and
+    max_bytes of extract_limits. If it also has any of the timeout, max_memory_mb
+    and max_cpu_seconds arguments of get_doc_text_supervised, the attachment is
+    extracted in a supervised worker process. A file skipped without extracting it,
+    like a scanned PDF, is recorded as unreadable with the reason.
+    """
+    error = None
+    budget, limits = split_extract_limits(extract_limits)
+    if limits:
+        text, error = get_doc_text_supervised(file_name, budget=budget, **limits)
+    else:
+        text = get_doc_text(file_name, budget=budget)
+    fn = os.path.basename(file_name)
+    machine_readable = True if text else False
+    return make_attachment_data(
+        text,
+        url,
+        fn,
+        machine_readable,
+        extraction_error=error or budget.skip_reason,
+        truncated=budget.truncated,
+        extraction_failed=bool(error),
+    )
+
+
+def get_archive_attachment_data(file_name, url, extract_limits=None):
+    """
+    Extract the text of each file in a zip archive attachment. Every member becomes
+    an attachment of its own, named after the archive and its path in the archive,
+    with the member's path as the fragment of its url. If the archive can't be read
+    there's a single, unreadable, attachment for it instead.
+    """
+    error = None
+    budget, limits = split_extract_limits(extract_limits)
+    if limits:
+        members, error = get_doc_text_supervised(
+            file_name, extract=get_archive_text, budget=budget, **limits
+        )
+    else:
+        members = get_archive_text(file_name, budget=budget)
+    fn = os.path.basename(file_name)
+    if error or not members:
+        return [
+            make_attachment_data(
+                "", url, fn, False, extraction_error=error or "empty archive", extraction_failed=bool(error)
+            )
+        ]
+    return [
+        make_attachment_data(
+            text,
+            f"{url}#{urllib.parse.quote(name)}",
+            f"{fn}/{name}",
+            True if text else False,
+            extraction_error=skip_reason,
+            truncated=truncated,
+        )
+        for name, text, skip_reason, truncated in members
+    ]
+
+
+def extract_attachment(file_name, url, extract_limits=None):
+    """
+    Returns a list with the attachment data for a downloaded attachment, or for each
+    file in it if it's a zip archive.
+    """
+    if is_archive(file_name):
+        return get_archive_attachment_data(file_name, url, extract_limits)
+    return [get_attachment_data(file_name, url, extract_limits)]
+
+
+class SerialExecutor:
+    """
+    Stand-in for a concurrent.futures executor that runs each task as soon as it
+    is submitted. Used when a pipeline stage is configured with a single worker,
+    so that small runs don't pay for starting a pool.
+    """
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def stage_executor(executor_class, workers, **kwargs):
+    workers = int(workers or 1)
+    if workers <= 1:
+        return SerialExecutor()
+    return executor_class(max_workers=workers, **kwargs)
+
+
+def store_attachment_data(attachment_cache, attachments):
+    """
+    Store the text of freshly extracted attachments in the cache. Attachments whose
+    extraction failed, e.g. because it timed out on a busy host, aren't stored, so
+    that they're extracted again on the next run.
+    """
+    for attachment in attachments:
+        if attachment.get("extraction_failed"):
+            continue
+        # archive members have urls of their own, which the cache doesn't store
+        attachment_cache.store(
+            attachment["url"],
+            attachment["text"],
+            attachment["machine_readable"],
+            truncated=attachment.get("truncated", False),
+            extraction_error=attachment.get("extraction_error"),
+        )
+
+
+def add_attachment_data(
+    opps,
+    out_path,
+    download_workers=1,
+    extract_workers=1,
+    attachment_cache=None,
+    max_attachment_bytes=MAX_ATTACHMENT_BYTES,
+    extract_limits=None,
+):
+    """
+    Download and textract the attachments for each opportunity.
+
+    Downloads run on a thread pool and feed a process pool that does the text
+    extraction. With more than one extract worker, an opportunity's files are
+    extracted while the next ones are still downloading. At most
+    download_workers + extract_workers opportunities are downloading or waiting
+    to be extracted at once, so downloads can't run far ahead of extraction.
+    Attachments are added to each opp in resourceLinks order.
+
+    Each opportunity's files are downloaded to a directory of their own, which is
+    removed once they've been extracted, so attachments with the same name on
+    different opportunities don't overwrite each other.
+
+    Arguments:
+        opps {list} -- schematized opportunities
+        out_path {str} -- directory the attachments are downloaded to
+        download_workers {int} -- number of concurrent downloads
+        extract_workers {int} -- number of processes extracting text
+        attachment_cache {AttachmentCache} -- cache of previously extracted text
+        max_attachment_bytes {int} -- attachments larger than this are skipped
+        extract_limits {dict} -- budget, timeout and resource limits for extracting each attachment
+    """
+    max_in_flight = max(int(download_workers or 1), 1) + max(int(extract_workers or 1), 1)
+    # opportunities in the order they were submitted, each a dict with its opp, its
+    # download directory, the download future and, once downloaded, its extractions
+    in_flight = deque()
+
+    def start_extractions():
+        for item in in_flight:
+            if item["entries"] is None and item["download"].done():
+                item["entries"] = [
+                    # cached attachments come back from get_docs already extracted
+                    entry
+                    if isinstance(entry, dict)
+                    else extractor.submit(extract_attachment, entry[0], entry[1], extract_limits)
+                    for entry in item["download"].result() or []
+                ]
+
+    def finish_oldest():
+        item = in_flight[0]
+        while item["entries"] is None:
+            wait(
+                [other["download"] for other in in_flight if other["entries"] is None],
+                return_when=FIRST_COMPLETED,
+            )
+            start_extractions()
+        for entry in item["entries"]:
+            if not isinstance(entry, Future):
+                item["opp"]["attachments"].append(entry)
+                continue
+            extracted = entry.result()
+            if attachment_cache:
+                store_attachment_data(attachment_cache, extracted)
+            item["opp"]["attachments"].extend(extracted)
+        in_flight.popleft()
+        shutil.rmtree(item["directory"], ignore_errors=True)
+
+    try:
+        # the extract processes are started while downloads are running on other threads
+        with stage_executor(ThreadPoolExecutor, download_workers) as downloader, stage_executor(
+            ProcessPoolExecutor, extract_workers, mp_context=extraction_context()
+        ) as extractor:
+            for opp in opps:
+                while len(in_flight) >= max_in_flight:
+                    finish_oldest()
+                directory = tempfile.mkdtemp(dir=out_path)
+                download = downloader.submit(
+                    get_docs,
+                    opp,
+                    out_path=directory,
+                    cache=attachment_cache,
+                    max_bytes=max_attachment_bytes,
+                )
+                in_flight.append({"opp": opp, "directory": directory, "download": download, "entries": None})
+                start_extractions()
+            while in_flight:
+                finish_oldest()
+    finally:
+        # the executors have finished with them by now, if anything went wrong
+        for item in in_flight:
+            shutil.rmtree(item["directory"], ignore_errors=True)
+
+    return opps
+
+
+def transform_opps(
+    opps,
+    out_path,
+    skip_attachments=False,
+    download_workers=1,
+    extract_workers=1,
+    attachment_cache=None,
+    max_attachment_bytes=MAX_ATTACHMENT_BYTES,
+    extract_limits=None,
+):
     """Transform the opportunity data to fit the SRT's schema
 
     Arguments:
         opps {dict} -- a dictionary containing the JSON response of get_opps()
+        download_workers {int} -- number of concurrent attachment downloads
+        extract_workers {int} -- number of processes extracting attachment text
+        attachment_cache {AttachmentCache} -- cache of previously extracted text
+        max_attachment_bytes {int} -- attachments larger than this are skipped
+        extract_limits {dict} -- budget, timeout and resource limits for extracting each attachment
     """
     transformed_opps = []
     for opp in opps:
         schematized_opp = schematize_opp(opp)
         if not schematized_opp:
             continue
-        if not skip_attachments:
-            file_list = get_docs(schematized_opp, out_path=out_path)
-            if file_list:
-                attachment_data = [
-                    get_attachment_data(file_and_url_tuple[0], file_and_url_tuple[1])
-                    for file_and_url_tuple in file_list
-                ]
-                schematized_opp["attachments"].extend(attachment_data)
         transformed_opps.append(schematized_opp)
+
+    if not skip_attachments:
+        add_attachment_data(
+            transformed_opps,
+            out_path,
+            download_workers=download_workers,
+            extract_workers=extract_workers,
+            attachment_cache=attachment_cache,
+            max_attachment_bytes=max_attachment_bytes,
+            extract_limits=extract_limits,
+        )
     
     # Removing duplicate solicitation numbers resulting in a unique solNum constraint violation
     df = pd.DataFrame(transformed_opps)
@@ -319,6 +989,16 @@ def main(
     skip_attachments=False,
     from_date="yesterday",
     to_date="yesterday",
+    max_workers=1,
+    download_workers=1,
+    extract_workers=1,
+    attachment_cache=None,
+    window_days=1,
+    max_depth=MAX_RESULT_DEPTH,
+    async_mode=False,
+    max_in_flight=100,
+    max_attachment_bytes=MAX_ATTACHMENT_BYTES,
+    extract_limits=None,
 ):
     """
 
@@ -329,6 +1009,16 @@ def main(
         skip_attachments: Will skip downloading attachments if true. Default to false.
         from_date: formatted mm/dd/yyyy or the default string "yesterday" if you want the function to use yesterday
         to_date: formatted mm/dd/yyyy or the default string "yesterday" if you want the function to use yesterday
+        max_workers: Maximum number of concurrent requests to the SAM.gov search API
+        download_workers: Number of attachments downloaded at the same time
+        extract_workers: Number of processes used to extract attachment text
+        attachment_cache: AttachmentCache used to skip attachments we've already extracted
+        window_days: The date range is searched this many days at a time, with the windows fetched concurrently
+        max_depth: Windows with more records than this are split into smaller ones
+        async_mode: Search with the asyncio client, requesting every page at once. Needs httpx.
+        max_in_flight: Maximum number of concurrent requests to the SAM.gov search API in async_mode
+        max_attachment_bytes: Attachments larger than this aren't downloaded
+        extract_limits: Budget, timeout and resource limits for extracting the text of each attachment
 
     Returns:
 
@@ -338,17 +1028,44 @@ def main(
         if not os.path.exists(out_path):
             os.makedirs(out_path)
         # opps = get_yesterdays_opps(limit=limit, filter_naics=filter_naics, target_sol_types=target_sol_types)
-        opps = get_opps_for_day(
-            limit=limit,
-            opportunity_filter_function=opportunity_filter_function,
-            target_sol_types=target_sol_types,
-            from_date=from_date,
-            to_date=to_date,
-        )
+        if async_mode:
+            # imported here since it needs httpx, and imports this module
+            from fbo_scraper import async_sam_client
+
+            opps = asyncio.run(
+                async_sam_client.get_opps_for_range(
+                    limit=limit,
+                    opportunity_filter_function=opportunity_filter_function,
+                    target_sol_types=target_sol_types,
+                    from_date=from_date,
+                    to_date=to_date,
+                    max_in_flight=max_in_flight,
+                    window_days=window_days,
+                    max_depth=max_depth,
+                )
+            )
+        else:
+            opps = get_opps_for_range(
+                limit=limit,
+                opportunity_filter_function=opportunity_filter_function,
+                target_sol_types=target_sol_types,
+                from_date=from_date,
+                to_date=to_date,
+                max_workers=max_workers,
+                window_days=window_days,
+                max_depth=max_depth,
+            )
         if not opps:
             return []
         transformed_opps = transform_opps(
-            opps, out_path, skip_attachments=skip_attachments
+            opps,
+            out_path,
+            skip_attachments=skip_attachments,
+            download_workers=download_workers,
+            extract_workers=extract_workers,
+            attachment_cache=attachment_cache,
+            max_attachment_bytes=max_attachment_bytes,
+            extract_limits=extract_limits,
         )
     
     except SamApiError:
@@ -360,6 +1077,84 @@ def main(
     return transformed_opps
 
 
+def iter_transformed_opps(
+    chunk_size=100,
+    limit=None,
+    opportunity_filter_function=None,
+    target_sol_types=("k", "o"),
+    skip_attachments=False,
+    from_date="yesterday",
+    to_date="yesterday",
+    max_workers=1,
+    download_workers=1,
+    extract_workers=1,
+    attachment_cache=None,
+    window_days=1,
+    max_depth=MAX_RESULT_DEPTH,
+    max_attachment_bytes=MAX_ATTACHMENT_BYTES,
+    extract_limits=None,
+    skip_solicitations=None,
+):
+    """
+    Streaming version of main that yields the transformed opportunities in chunks
+    of at most chunk_size, fetching the next search pages only when they're needed.
+    The date range is searched as a whole, and split only if it's deeper than
+    max_depth, so window_days is ignored. Takes the same arguments as main, plus:
+
+        skip_solicitations: solicitation numbers to leave out, e.g. ones already
+            committed by an earlier attempt at the same run
+
+    Opportunities whose solicitation number was already in an earlier chunk are
+    dropped, like the duplicates transform_opps drops within a chunk. limit applies
+    to the whole date range, however many windows it is split into.
+    """
+    out_path = os.path.join(os.getcwd(), "attachments")
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+
+    chunk_size = max(int(chunk_size or 1), 1)
+    seen = set(skip_solicitations or ())
+    chunk = []
+
+    def transform(chunk):
+        return transform_opps(
+            chunk,
+            out_path,
+            skip_attachments=skip_attachments,
+            download_workers=download_workers,
+            extract_workers=extract_workers,
+            attachment_cache=attachment_cache,
+            max_attachment_bytes=max_attachment_bytes,
+            extract_limits=extract_limits,
+        )
+
+    def new_opps():
+        for page in iter_window_pages(
+            from_date,
+            to_date,
+            max_depth=max_depth,
+            opportunity_filter_function=opportunity_filter_function,
+            limit=limit,
+            target_sol_types=target_sol_types,
+            max_workers=max_workers,
+        ):
+            for opp in page:
+                if opp["solicitationNumber"] in seen:
+                    continue
+                seen.add(opp["solicitationNumber"])
+                yield opp
+
+    # iter_window_pages applies limit to each window, so stop once limit opportunities are taken
+    for opp in islice(new_opps(), limit or None):
+        chunk.append(opp)
+        if len(chunk) >= chunk_size:
+            yield transform(chunk)
+            chunk = []
+
+    if chunk:
+        yield transform(chunk)
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
@@ -8,8 +8,12 @@ from fbo_scraper.db.db_utils import (
     session_scope,
     insert_data_into_solicitations_table,
     insert_notice_types,
+    AgencyResolver,
 )
 from fbo_scraper.json_log_formatter import configureLogger
+from fbo_scraper.attachment_cache import AttachmentCache
+from fbo_scraper.run_ledger import RunLedger
+from fbo_scraper.request_utils import configure_sam_limits, configure_http_clients, close_http_clients, get_quota_tracker
 from fbo_scraper.sam_utils import update_old_solicitations, opportunity_filter_function
 import sys
 import os
@@ -28,6 +32,69 @@ def setup_db():
     dal.connect()
     return dal
 
+def setup_attachment_cache(options):
+    """
+    Returns an AttachmentCache if one is configured in the cache section of the options.
+    """
+    cache_options = options.cache if options else None
+    if not cache_options or not cache_options.path:
+        return None
+    budget, _ = get_opps.split_extract_limits(setup_extract_limits(options))
+    return AttachmentCache(
+        cache_options.path,
+        max_bytes=int(cache_options.max_mb or 0) * 1024 * 1024,
+        max_age_days=cache_options.max_age_days or None,
+        budget=budget,
+    )
+
+def setup_sam_limits(options):
+    """
+    Configure the SAM.gov rate limiter and quota tracker from the sam section of the options.
+    """
+    sam_options = options.sam if options else None
+    if not sam_options:
+        return
+    configure_sam_limits(
+        requests_per_second=sam_options.requests_per_second or None,
+        burst=sam_options.burst or 1,
+        daily_quota=sam_options.daily_quota or None,
+        quota_path=sam_options.quota_path or None,
+        max_retry_after=sam_options.max_retry_after,
+    )
+
+def setup_extract_limits(options):
+    """
+    Returns the budget, timeout and resource limits for extracting attachment text
+    from the client section of the options, or None if none are configured.
+    """
+    client_options = options.client if options else None
+    if not client_options:
+        return None
+    limits = dict(
+        max_pages=client_options.extract_max_pages or None,
+        max_chars=client_options.extract_max_chars or None,
+        max_bytes=int(client_options.extract_max_mb or 0) * 1024 * 1024 or None,
+        timeout=client_options.extract_timeout or None,
+        max_memory_mb=client_options.extract_max_memory_mb or None,
+        max_cpu_seconds=client_options.extract_max_cpu_seconds or None,
+    )
+    if not any(limits.values()):
+        return None
+    return limits
+
+def setup_run_ledger(options, target_sol_types):
+    """
+    Returns a RunLedger if one is configured in the ledger section of the options.
+    """
+    ledger_options = options.ledger if options else None
+    if not ledger_options or not ledger_options.path:
+        return None
+    return RunLedger(
+        ledger_options.path,
+        target_sol_types=target_sol_types,
+        resume=bool(ledger_options.resume),
+    )
+
 def scraper_parser():
     """
     Allows to accept command line arguments for the scraper.
@@ -72,6 +139,70 @@ def scraper_parser():
         help="Define the limit for the number of opportunities to be fetched from SAM.",
     )
 
+    client.add_argument(
+        "--max-workers",
+        dest="client.max_workers",
+        type=int,
+        required=False,
+        help="Define the maximum number of concurrent requests to the SAM search API.",
+    )
+
+    client.add_argument(
+        "--download-workers",
+        dest="client.download_workers",
+        type=int,
+        required=False,
+        help="Define the number of attachments downloaded at the same time.",
+    )
+
+    client.add_argument(
+        "--extract-workers",
+        dest="client.extract_workers",
+        type=int,
+        required=False,
+        help="Define the number of processes used to extract attachment text.",
+    )
+
+    client.add_argument(
+        "--window-days",
+        dest="client.window_days",
+        type=int,
+        required=False,
+        help="Define the number of days searched at a time. Windows are fetched concurrently.",
+    )
+
+    client.add_argument(
+        "--stream",
+        dest="client.stream",
+        action=BooleanOptionalAction,
+        required=False,
+        help="Define whether to fetch, predict and insert opportunities a chunk at a time.",
+    )
+
+    client.add_argument(
+        "--chunk-size",
+        dest="client.chunk_size",
+        type=int,
+        required=False,
+        help="Define the number of opportunities in each chunk when streaming.",
+    )
+
+    client.add_argument(
+        "--async",
+        dest="client.async_mode",
+        action=BooleanOptionalAction,
+        required=False,
+        help="Define whether to call the SAM.gov API from an asyncio client, with many requests in flight. Needs httpx.",
+    )
+
+    client.add_argument(
+        "--resume",
+        dest="ledger.resume",
+        action=BooleanOptionalAction,
+        required=False,
+        help="Define whether to skip the work recorded in the run ledger by an earlier, interrupted run.",
+    )
+
     database = parser.add_argument_group("Database Options")
 
     database.add_argument(
@@ -82,6 +213,14 @@ def scraper_parser():
         help="Define whether to update old solicitations.",
     )
 
+    database.add_argument(
+        "--bulk-insert",
+        dest="database.bulk_insert",
+        action=BooleanOptionalAction,
+        required=False,
+        help="Define whether to write solicitations in batches with INSERT ... ON CONFLICT.",
+    )
+
     prediction_model = parser.add_argument_group("Prediction Model Options")
     prediction_model.add_argument(
         "--model-name",
@@ -98,6 +237,14 @@ def scraper_parser():
         help="Define the absolute path to the prediction model.",
     )
 
+    prediction_model.add_argument(
+        "--prediction-workers",
+        dest="prediction.workers",
+        type=int,
+        required=False,
+        help="Define the number of processes used to normalize attachment text.",
+    )
+
     return parser
 
 def grab_model_path(options):
@@ -114,6 +261,100 @@ def grab_model_path(options):
         model_path = Path(binary_path, "atc_estimator.pkl")
     return model_path
 
+def stream_opportunities(dal, predict, options, ledger=None, **kwargs):
+    """
+    Fetch, predict and insert the opportunities a chunk at a time, committing each
+    chunk before the next one is fetched. Memory use doesn't grow with the number of
+    opportunities, and a failure only loses the chunk that was being processed.
+
+    With a RunLedger the date range is processed one day at a time, and each committed
+    chunk is recorded in the ledger. Days the ledger has as complete are skipped, as are
+    the solicitations it has as committed for a day that was interrupted. Only the
+    solicitations that were written are recorded, and a day is only recorded as complete
+    if all of its opportunities were. A limit applies to the whole date range, and
+    since it can cut a day short, days aren't recorded as complete when one is given.
+
+    kwargs are passed to get_opps.iter_transformed_opps.
+
+    Returns:
+        the number of opportunities inserted
+    """
+    agency_resolver = None
+    inserted = 0
+    limit = kwargs.get("limit")
+    taken = 0
+
+    if ledger:
+        days = get_opps.days_between(kwargs["from_date"], kwargs["to_date"])
+    else:
+        days = [None]
+
+    for day in days:
+        if limit and taken >= limit:
+            break
+        day_kwargs = dict(kwargs)
+        if limit:
+            day_kwargs["limit"] = limit - taken
+        if day:
+            if ledger.is_complete(day):
+                logger.info("Skipping {}, it was completed by an earlier run".format(day.isoformat()))
+                continue
+            day_kwargs.update(
+                from_date=day, to_date=day, skip_solicitations=ledger.committed(day)
+            )
+
+        # the day is only complete if every opportunity in it was written
+        day_committed = not limit
+        for chunk_number, opps_chunk in enumerate(get_opps.iter_transformed_opps(**day_kwargs), 1):
+            if not opps_chunk:
+                continue
+            taken += len(opps_chunk)
+
+            predict_data = predict.insert_predictions(opps_chunk)
+            if not predict_data:
+                logger.error("No predicition data to insert for chunk {}. Something went wrong.".format(chunk_number))
+                day_committed = False
+                continue
+            # inserting consumes the attachments, so count them first
+            attachments = {opp["solnbr"]: len(opp.get("attachments") or []) for opp in predict_data}
+
+            with dal.Session.begin() as session:
+                if agency_resolver is None:
+                    agency_resolver = AgencyResolver(session)
+                sols = insert_data_into_solicitations_table(
+                    session,
+                    predict_data,
+                    bulk=options.database.bulk_insert,
+                    batch_size=options.database.batch_size,
+                    agency_resolver=agency_resolver,
+                )
+            # solicitations that failed to insert are left out, so --resume retries them
+            sol_nums = list(dict.fromkeys(sol.solNum for sol in sols))
+            if len(sol_nums) < len(attachments):
+                day_committed = False
+            if ledger:
+                ledger.record_chunk(
+                    day, sol_nums, attachments=sum(attachments.get(sol_num, 0) for sol_num in sol_nums)
+                )
+            inserted += len(sol_nums)
+            logger.info(
+                "Smartie committed chunk {} with {} opportunities ({} so far)".format(
+                    chunk_number, len(sol_nums), inserted
+                )
+            )
+
+        if ledger:
+            if day_committed:
+                ledger.complete_day(day)
+            elif not limit:
+                logger.warning(
+                    "Not all opportunities for {} were committed, it will be retried by --resume".format(day.isoformat())
+                )
+
+    if agency_resolver:
+        agency_resolver.log_unmapped()
+    return inserted
+
 def main(
     limit=None,
     updateOld=True,
@@ -122,17 +363,31 @@ def main(
     skip_attachments=False,
     from_date="yesterday",
     to_date="yesterday",
+    max_workers=1,
+    download_workers=1,
+    extract_workers=1,
+    stream=False,
+    chunk_size=100,
     options=None,
 ):
     opps_data = None
     predict_data = None
+    attachment_cache = None
 
     try:
 
         dal = setup_db()
+        setup_sam_limits(options)
+        # one connection pool per host for the whole run, big enough for every worker thread
+        configure_http_clients(pool_maxsize=max(int(max_workers or 1), int(download_workers or 1), 10))
+        attachment_cache = setup_attachment_cache(options)
 
         model_path = grab_model_path(options)
-        predict = Predict(best_model_path=model_path)
+        predict = Predict(
+            best_model_path=model_path,
+            workers=options.prediction.workers,
+            min_pool_chars=options.prediction.min_pool_chars,
+        )
 
         if limit:
             logger.error(
@@ -146,37 +401,78 @@ def main(
                 "Set to NOT update old solicitations. Should not happen in production.".format()
             )
 
+        if options and options.ledger.resume and not stream:
+            logger.warning("Runs can only be resumed in streaming mode, --resume is ignored.")
+
+        async_mode = bool(options and options.client.async_mode)
+        if async_mode and stream:
+            logger.warning("The search API is only called asynchronously in batch mode, --async is ignored while streaming.")
+
         with dal.Session.begin() as session:
             # make sure that the notice types are configured and committed before going further
             insert_notice_types(session)
 
         logger.info("Smartie is fetching opportunties from SAM...")
 
-        opps_data = get_opps.main(
-            limit,
+        get_opps_args = dict(
             opportunity_filter_function=opportunity_filter_function,
             target_sol_types=target_sol_types,
             skip_attachments=skip_attachments,
             from_date=from_date,
             to_date=to_date,
+            max_workers=max_workers,
+            download_workers=download_workers,
+            extract_workers=extract_workers,
+            attachment_cache=attachment_cache,
+            window_days=options.client.window_days,
+            max_depth=options.client.max_result_depth,
+            max_attachment_bytes=int(options.client.max_attachment_mb or 0) * 1024 * 1024 or None,
+            extract_limits=setup_extract_limits(options),
         )
-        if not opps_data:
-            logger.info("Smartie didn't find any opportunities!")
+
+        if stream:
+            inserted = stream_opportunities(
+                dal,
+                predict,
+                options,
+                ledger=setup_run_ledger(options, target_sol_types),
+                chunk_size=chunk_size,
+                limit=limit,
+                **get_opps_args,
+            )
+            if not inserted:
+                logger.info("Smartie didn't find any opportunities!")
+            else:
+                logger.info("Smartie is done inserting {} opportunities into the database!".format(inserted))
         else:
-            logger.info("Smartie is done fetching opportunties from SAM!")
+            opps_data = get_opps.main(
+                limit,
+                async_mode=async_mode,
+                max_in_flight=options.client.max_in_flight,
+                **get_opps_args,
+            )
+            if not opps_data:
+                logger.info("Smartie didn't find any opportunities!")
+            else:
+                logger.info("Smartie is done fetching opportunties from SAM!")
 
-            logger.info("Smartie is making predictions for each notice attachment...")
+                logger.info("Smartie is making predictions for each notice attachment...")
 
-            predict_data = predict.insert_predictions(opps_data)
-            logger.info(
-                "Smartie is done making predictions for each notice attachment!"
-            )
+                predict_data = predict.insert_predictions(opps_data)
+                logger.info(
+                    "Smartie is done making predictions for each notice attachment!"
+                )
 
         with dal.Session.begin() as session:
             if predict_data:
                 # insert_data(session, data)
                 logger.info("Smartie is inserting data into the database...")
-                insert_data_into_solicitations_table(session, predict_data)
+                insert_data_into_solicitations_table(
+                    session,
+                    predict_data,
+                    bulk=options.database.bulk_insert,
+                    batch_size=options.database.batch_size,
+                )
                 logger.info("Smartie is done inserting data into database!")
             else:
                 if opps_data and not predict_data:
@@ -184,7 +480,13 @@ def main(
                     logger.error("No predicition data to insert. Something went wrong.")
 
             if updateOld:
-                update_old_solicitations(session, max_tests=10)
+                update_old_solicitations(
+                    session,
+                    max_tests=options.database.max_rechecks,
+                    quota_reserve=options.sam.quota_reserve or 0,
+                    max_workers=options.client.max_in_flight if async_mode else max_workers,
+                    async_mode=async_mode,
+                )
 
         logger.info("Run complete without major errors.")
     
@@ -198,6 +500,11 @@ def main(
         logger.error("Unhandled error. Data for the day may be lost.")
         logger.error(f"Exception: {e}", exc_info=True)
         logger.error("Unexpected error: {}".format(str(sys.exc_info()[0])))
+    finally:
+        if attachment_cache:
+            attachment_cache.close()
+        close_http_clients()
+        get_quota_tracker().save()
 
 def check_environment():
     """
@@ -264,6 +571,11 @@ def actual_main():
         skip_attachments=options.client.skip_attachments,
         from_date=options.client.from_date,
         to_date=options.client.to_date,
+        max_workers=options.client.max_workers,
+        download_workers=options.client.download_workers,
+        extract_workers=options.client.extract_workers,
+        stream=options.client.stream,
+        chunk_size=options.client.chunk_size,
         options=options,
     )
     
@@ -307,6 +619,11 @@ if __name__ == "__main__":
         skip_attachments=options.client.skip_attachments,
         from_date=options.client.from_date,
         to_date=options.client.to_date,
+        max_workers=options.client.max_workers,
+        download_workers=options.client.download_workers,
+        extract_workers=options.client.extract_workers,
+        stream=options.client.stream,
+        chunk_size=options.client.chunk_size,
         options=options,
     )
     
@@ -7,8 +7,41 @@ import sys
 from pathlib import Path
 
 config_defaults = """
+client:
+    max_workers: 1
+    download_workers: 1
+    extract_workers: 1
+    window_days: 1
+    max_result_depth: 10000
+    stream: False
+    chunk_size: 100
+    async_mode: False
+    max_in_flight: 100
+    max_attachment_mb: 250
+    extract_timeout: null
+    extract_max_memory_mb: null
+    extract_max_cpu_seconds: null
+    extract_max_pages: null
+    extract_max_chars: null
+    extract_max_mb: null
+ledger:
+    path: null
+    resume: False
+sam:
+    requests_per_second: null
+    burst: 1
+    daily_quota: null
+    quota_path: null
+    quota_reserve: 0
+    max_retry_after: 300
+database:
+    bulk_insert: False
+    batch_size: 500
+    max_rechecks: 10
 prediction: 
     model_name: estimator.pkl
+    workers: 1
+    min_pool_chars: 5000000
 """
 
 config = DotDict()
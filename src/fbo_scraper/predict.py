@@ -2,29 +2,98 @@
 import os
 import dill as pickle
 import re
+import functools
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from nltk.stem.porter import PorterStemmer
 import logging
 from pathlib import Path
 from fbo_scraper.binaries import binary_path
+from fbo_scraper.get_doc_text import extraction_context
 
 logger = logging.getLogger(__name__)
 
+# manually define stop_words to avoid nltk.download('stopwords')
+STOP_WORDS = frozenset({
+    "a", "about", "above", "after", "again", "against", "ain", "all", "am", "an", "and", "any", "are", "aren", 
+    "aren't", "as", "at", "be", "because", "been", "before", "being", "below", "between", "both", "but", "by", 
+    "can", "couldn", "couldn't", "d", "did", "didn", "didn't", "do", "does", "doesn", "doesn't", "doing", "don", 
+    "don't", "down", "during", "each", "few", "for", "from", "further", "had", "hadn", "hadn't", "has", "hasn", 
+    "hasn't", "have", "haven", "haven't", "having", "he", "her", "here", "hers", "herself", "him", "himself", 
+    "his", "how", "i", "if", "in", "into", "is", "isn", "isn't", "it", "it's", "its", "itself", "just", "ll", 
+    "m", "ma", "me", "mightn", "mightn't", "more", "most", "mustn", "mustn't", "my", "myself", "needn", "needn't", 
+    "no", "nor", "not", "now", "o", "of", "off", "on", "once", "only", "or", "other", "our", "ours", "ourselves", 
+    "out", "over", "own", "re", "s", "same", "shan", "shan't", "she", "she's", "should", "should've", "shouldn", 
+    "shouldn't", "so", "some", "such", "t", "than", "that", "that'll", "the", "their", "theirs", "them", 
+    "themselves", "then", "there", "these", "they", "this", "those", "through", "to", "too", "until", "up", 
+    "ve", "very", "was", "wasn", "wasn't", "we", "were", "weren", "weren't", "what", "when", "where", "which", 
+    "while", "who", "whom", "why", "will", "with", "won", "won't", "wouldn", "wouldn't", "y", "you", "you'd", 
+    "you'll", "you're", "you've", "your", "yours", "yourself", "yourselves",
+})
+NO_NONSENSE_RE = re.compile(r"^[a-zA-Z^508]+$")
+STEM_CACHE_SIZE = 2**16
+
+_porter = PorterStemmer()
+
+
+@functools.lru_cache(STEM_CACHE_SIZE)
+def stem(word):
+    """
+    Porter stem a word. Procurement documents reuse a small vocabulary, so the
+    stems are memoized.
+    """
+    return _porter.stem(word)
+
 
 class PredictException(Exception):
     pass
 
 
+def transform_texts(texts):
+    """
+    Normalize a list of texts. Runs in the worker processes of Predict.normalize_texts.
+    """
+    return [Predict.transform_text(text) for text in texts]
+
+
+def shard_by_size(texts, shards):
+    """
+    Split the indexes of texts into at most `shards` groups of roughly equal total length.
+    The longest texts are placed first, each into the group with the least text so far.
+
+    Returns:
+        list of lists of indexes into texts
+    """
+    sizes = [len(text) if isinstance(text, str) else 0 for text in texts]
+    heap = [(0, shard) for shard in range(min(shards, len(texts)))]
+    groups = [[] for _ in heap]
+    for i in sorted(range(len(texts)), key=lambda i: sizes[i], reverse=True):
+        total, shard = heapq.heappop(heap)
+        groups[shard].append(i)
+        heapq.heappush(heap, (total + sizes[i], shard))
+    return [group for group in groups if group]
+
+
 class Predict:
     """
     Make 508 accessibility predictions solicitation document text.
 
     Parameters:
         data (list): a list of dicts, with each dict representing an opportunity.
+        workers (int): number of processes used to normalize attachment text.
+        min_pool_chars (int): batches with less text than this are normalized in-process.
     """
 
     _predict_model = None
 
-    def __init__(self, best_model_path=Path(binary_path, "atc_estimator.pkl"), data=None):
+    def __init__(
+        self,
+        best_model_path=Path(binary_path, "atc_estimator.pkl"),
+        data=None,
+        workers=1,
+        min_pool_chars=5_000_000,
+    ):
         cwd = os.getcwd()
         if "fbo-scraper" in cwd:
             i = cwd.find("fbo-scraper")
@@ -35,6 +104,8 @@ class Predict:
         self.best_model_path = os.path.join(root_path, best_model_path)
         self.predict_model = self.load_predict_model()
         self.data = data
+        self.workers = int(workers or 1)
+        self.min_pool_chars = int(min_pool_chars or 0)
 
     def load_predict_model(self):
         """
@@ -69,44 +140,72 @@ class Predict:
             words (str): a string of space-delimited lower-case alpha-only words (except for `508`)
         """
 
-        # manually define stop_words to avoid nltk.download('stopwords')
-        stop_words = {
-            "a", "about", "above", "after", "again", "against", "ain", "all", "am", "an", "and", "any", "are", "aren", 
-            "aren't", "as", "at", "be", "because", "been", "before", "being", "below", "between", "both", "but", "by", 
-            "can", "couldn", "couldn't", "d", "did", "didn", "didn't", "do", "does", "doesn", "doesn't", "doing", "don", 
-            "don't", "down", "during", "each", "few", "for", "from", "further", "had", "hadn", "hadn't", "has", "hasn", 
-            "hasn't", "have", "haven", "haven't", "having", "he", "her", "here", "hers", "herself", "him", "himself", 
-            "his", "how", "i", "if", "in", "into", "is", "isn", "isn't", "it", "it's", "its", "itself", "just", "ll", 
-            "m", "ma", "me", "mightn", "mightn't", "more", "most", "mustn", "mustn't", "my", "myself", "needn", "needn't", 
-            "no", "nor", "not", "now", "o", "of", "off", "on", "once", "only", "or", "other", "our", "ours", "ourselves", 
-            "out", "over", "own", "re", "s", "same", "shan", "shan't", "she", "she's", "should", "should've", "shouldn", 
-            "shouldn't", "so", "some", "such", "t", "than", "that", "that'll", "the", "their", "theirs", "them", 
-            "themselves", "then", "there", "these", "they", "this", "those", "through", "to", "too", "until", "up", 
-            "ve", "very", "was", "wasn", "wasn't", "we", "were", "weren", "weren't", "what", "when", "where", "which", 
-            "while", "who", "whom", "why", "will", "with", "won", "won't", "wouldn", "wouldn't", "y", "you", "you'd", 
-            "you'll", "you're", "you've", "your", "yours", "yourself", "yourselves",
-        }
-        no_nonsense_re = re.compile(r"^[a-zA-Z^508]+$")
         if not isinstance(doc, str):
             return str(doc).lower()
-        doc = doc.lower()
-        doc = doc.split()
-        words = ""
-        for word in doc:
-            m = re.match(no_nonsense_re, word)
-            if m:
-                match = m.group()
-                if match in stop_words:
-                    continue
-                else:
-                    match_len = len(match)
-                    if match_len <= 17 and match_len >= 3:
-                        porter = PorterStemmer()
-                        stemmed = porter.stem(match)
-                        words += stemmed + " "
-        words = words.strip()
+        words = []
+        for word in doc.lower().split():
+            if not NO_NONSENSE_RE.match(word) or word in STOP_WORDS:
+                continue
+            if 3 <= len(word) <= 17:
+                words.append(stem(word))
 
-        return words
+        return " ".join(words).strip()
+
+    def normalize_texts(self, texts):
+        """
+        Returns transform_text applied to each of texts, in order.
+
+        When more than one worker is configured and there is enough text to be worth
+        starting a pool, the texts are split into shards of similar size and each shard
+        is normalized in its own process.
+
+        Parameters:
+            texts (list): the text of each attachment
+
+        Returns:
+            normalized_texts (list): the normalized strings, in the same order as texts
+        """
+        total_chars = sum(len(text) for text in texts if isinstance(text, str))
+        if self.workers <= 1 or len(texts) < 2 or total_chars < self.min_pool_chars:
+            return transform_texts(texts)
+
+        shards = shard_by_size(texts, self.workers)
+        logger.info(
+            "Normalizing {} attachments ({} chars) with {} processes".format(
+                len(texts), total_chars, len(shards)
+            )
+        )
+        normalized_texts = [None] * len(texts)
+        # started from the same fork server as the extraction processes, since this
+        # process has HTTP and download threads running
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=extraction_context()) as executor:
+            results = executor.map(
+                transform_texts, [[texts[i] for i in shard] for shard in shards]
+            )
+            for shard, normalized_shard in zip(shards, results):
+                for i, normalized_text in zip(shard, normalized_shard):
+                    normalized_texts[i] = normalized_text
+        return normalized_texts
+
+    def predict_batch(self, normalized_texts):
+        """
+        Returns the predictions and decision function margins for a batch of normalized texts.
+
+        The texts are vectorized together and the decision function is computed once for
+        the whole batch. For a binary linear model the prediction is the class on the
+        positive side of the margin, which is what the model's predict() does.
+
+        Parameters:
+            normalized_texts (list): strings returned by transform_text
+
+        Returns:
+            raw_predictions (numpy.ndarray): the predicted class for each text
+            margins (numpy.ndarray): the signed decision function value for each text
+        """
+        pickled_model = self.predict_model
+        margins = np.asarray(pickled_model.decision_function(normalized_texts))
+        raw_predictions = pickled_model.classes_[(margins > 0).astype(int)]
+        return raw_predictions, margins
 
     def insert_predictions(self, opps_data=None):
         """
@@ -116,11 +215,40 @@ class Predict:
             json_data (dict): a Python dict representing the updated json data
         """
 
-        pickled_model = self.predict_model
-        
         data = opps_data if opps_data else self.data
+
+        # gather every attachment so the whole night is vectorized and scored in one go
+        attachments = []
         for opp in data:
             opp["compliant"] = 0  # noncompliant until proven otherwise
+            for attachment in opp.get("attachments", []):
+                text = attachment["text"]
+                if re.match(r"^.?This notice contains link\(s\)", text):
+                    logger.warning(
+                        "Notice {} - {} has suspicious attachment text.".format(
+                            opp["solnbr"], opp.get("agency", "")
+                        ),
+                        extra={
+                            "text": text[:1024],
+                            "solNum": opp.get("solnbr", ""),
+                            "agency": opp.get("agency", ""),
+                            "notice type": opp.get("notice type", ""),
+                        },
+                    )
+                attachments.append(attachment)
+
+        if attachments:
+            normalized_texts = self.normalize_texts(
+                [attachment["text"] for attachment in attachments]
+            )
+            raw_predictions, margins = self.predict_batch(normalized_texts)
+            for attachment, raw_prediction, dec_func in zip(
+                attachments, raw_predictions, margins
+            ):
+                attachment["prediction"] = int(raw_prediction)
+                attachment["decision_boundary"] = float(abs(dec_func))
+
+        for opp in data:
             if "attachments" in opp:
                 attachments = opp["attachments"]
                 compliant_counter = 0
@@ -131,31 +259,12 @@ class Predict:
                     "raw prediction": [],
                 }
                 for attachment in attachments:
-                    text = attachment["text"]
-                    if re.match("^.?This notice contains link\(s\)", text):
-                        logger.warning(
-                            "Notice {} - {} has suspicious attachment text.".format(
-                                opp["solnbr"], opp.get("agency", "")
-                            ),
-                            extra={
-                                "text": text[:1024],
-                                "solNum": opp.get("solnbr", ""),
-                                "agency": opp.get("agency", ""),
-                                "notice type": opp.get("notice type", ""),
-                            },
-                        )
-                    normalized_text = [self.transform_text(text)]
-                    raw_prediction = pickled_model.predict(normalized_text)[0]
-                    pred = int(raw_prediction)
+                    pred = attachment["prediction"]
                     compliant_counter += 1 if pred == 1 else 0
-                    dec_func = pickled_model.decision_function(normalized_text)[0]
-                    decision_boundary = float(abs(dec_func))
-                    attachment["prediction"] = pred
-                    attachment["decision_boundary"] = decision_boundary
                     stats["chars"].append(len(attachment["text"]))
                     stats["prediction"].append(pred)
-                    stats["decision boundry"].append(decision_boundary)
-                    stats["raw prediction"].append(int(raw_prediction))
+                    stats["decision boundry"].append(attachment["decision_boundary"])
+                    stats["raw prediction"].append(pred)
                 opp["compliant"] = 0 if compliant_counter == 0 else 1
 
                 logger.log(
@@ -1,6 +1,12 @@
+import datetime
 import json
 import logging
+import os
 import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
 
 
 import requests
@@ -27,11 +33,25 @@ class SAMHttpAdapter(HTTPAdapter):
 
 
 
+def sam_ssl_context():
+    ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    # Work around for https://bugs.python.org/issue44888
+    ctx.options |= 0x4
+    return ctx
+
+
 def requests_retry_session(
-    retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504), session=None
+    retries=3,
+    backoff_factor=0.3,
+    status_forcelist=(500, 502, 503, 504),
+    session=None,
+    pool_maxsize=10,
 ):
     """
     Use to create an http(s) requests session that will retry a request.
+
+    pool_maxsize is the number of connections kept open per host. Raise it when
+    the session is shared between threads so connections aren't thrown away.
     """
 
     session = session or requests.Session()
@@ -43,16 +63,449 @@ def requests_retry_session(
         status_forcelist=status_forcelist,
     )
     
-    ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-    # Work around for https://bugs.python.org/issue44888
-    ctx.options |= 0x4
-    adapter = SAMHttpAdapter(ctx, max_retries=retry)
+    ctx = sam_ssl_context()
+    adapter = SAMHttpAdapter(ctx, max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount("http://", adapter)
     session.mount('https://', adapter)
 
     return session
 
 
+class HttpClients:
+    """
+    Long lived HTTP clients shared by every SAM.gov call in the process, so that
+    connections (and their TLS sessions) are reused for the whole run instead of
+    being set up again for each search, lookup and opportunity.
+
+    session() is a requests session for the search API, and pool_manager() a urllib3
+    PoolManager for attachment downloads. Both are created on first use, keep
+    pool_maxsize connections alive per host and are safe to share between threads.
+
+    Parameters:
+        pool_maxsize (int): connections kept open per host
+        num_pools (int): hosts to keep connection pools for
+    """
+
+    def __init__(self, pool_maxsize=10, num_pools=10):
+        self.pool_maxsize = pool_maxsize
+        self.num_pools = num_pools
+        self._session = None
+        self._pool_manager = None
+        self._lock = threading.Lock()
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = requests_retry_session(pool_maxsize=self.pool_maxsize)
+            return self._session
+
+    def pool_manager(self):
+        with self._lock:
+            if self._pool_manager is None:
+                self._pool_manager = PoolManager(
+                    num_pools=self.num_pools,
+                    maxsize=self.pool_maxsize,
+                    ssl_context=sam_ssl_context(),
+                )
+            return self._pool_manager
+
+    def _pool_managers(self):
+        managers = []
+        if self._session is not None:
+            for adapter in self._session.adapters.values():
+                manager = getattr(adapter, "poolmanager", None)
+                if manager is not None and manager not in managers:
+                    managers.append(manager)
+        if self._pool_manager is not None:
+            managers.append(self._pool_manager)
+        return managers
+
+    def stats(self):
+        """
+        Returns the number of requests made and connections opened by the pools
+        that are still open.
+        """
+        stats = {"requests": 0, "connections": 0, "pools": 0}
+        for manager in self._pool_managers():
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                stats["pools"] += 1
+                stats["requests"] += pool.num_requests
+                stats["connections"] += pool.num_connections
+        stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+        return stats
+
+    def log_stats(self):
+        stats = self.stats()
+        if not stats["requests"]:
+            return
+        logger.info(
+            "HTTP clients: {} requests over {} connections, {:.0%} reused".format(
+                stats["requests"],
+                stats["connections"],
+                stats["reused"] / stats["requests"],
+            ),
+            extra={"http clients": stats},
+        )
+
+    def close(self):
+        self.log_stats()
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._pool_manager is not None:
+                self._pool_manager.clear()
+                self._pool_manager = None
+
+
+http_clients = HttpClients()
+
+
+def configure_http_clients(pool_maxsize=10, num_pools=10):
+    """
+    Replace the process wide HTTP clients, closing the current ones.
+    """
+    global http_clients
+    http_clients.close()
+    http_clients = HttpClients(pool_maxsize=pool_maxsize, num_pools=num_pools)
+    return http_clients
+
+
+def get_http_session():
+    return http_clients.session()
+
+
+def get_pool_manager():
+    return http_clients.pool_manager()
+
+
+def close_http_clients():
+    """
+    Close the process wide HTTP clients and log how well their connections were reused.
+    They are created again if they are used after this.
+    """
+    http_clients.close()
+
+
+# how many times a request that got a 429 Too Many Requests is retried
+MAX_THROTTLED_RETRIES = 3
+# the longest Retry-After period we wait for before retrying, in seconds
+MAX_RETRY_AFTER = 300
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread that calls the SAM.gov API.
+
+    Tokens are added at requests_per_second, up to burst. When SAM.gov answers
+    429 Too Many Requests the rate is halved and all callers wait for the
+    Retry-After period; each successful request then adds back a tenth of the
+    configured rate until it is restored. With no requests_per_second the
+    limiter only enforces Retry-After pauses.
+
+    A Retry-After longer than max_retry_after, such as the one sent once the
+    daily quota is spent, isn't waited for, so that callers fail fast instead
+    of stalling every thread for hours.
+    """
+
+    def __init__(self, requests_per_second=None, burst=1, min_rate=0.1, max_retry_after=MAX_RETRY_AFTER):
+        self.max_rate = requests_per_second
+        self.max_retry_after = max_retry_after
+        self.rate = requests_per_second
+        self.min_rate = min_rate
+        self.capacity = max(burst or 1, 1)
+        self.tokens = self.capacity
+        self.paused_until = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """
+        Take a token if one is available. Returns 0 if it was, otherwise the
+        number of seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.paused_until > now:
+                return self.paused_until - now
+            if not self.rate:
+                return 0
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        Block until a request may be made.
+        """
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def throttled(self, retry_after=None):
+        """
+        Slow down after a 429 Too Many Requests response.
+
+        Args:
+            retry_after: seconds to wait before the next request, if the server said
+
+        Returns:
+            True if the request can be retried after the pause, False if retry_after
+            is longer than max_retry_after, in which case there is no pause
+        """
+        if retry_after is not None and self.max_retry_after is not None and retry_after > self.max_retry_after:
+            logger.warning(
+                "SAM.gov asked us to wait {:.0f}s, longer than the {}s we wait for. Not retrying.".format(
+                    retry_after, self.max_retry_after
+                )
+            )
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if self.rate:
+                self.rate = max(self.rate / 2, self.min_rate)
+            self.tokens = 0
+            wait = retry_after if retry_after is not None else (1 / self.rate if self.rate else 1)
+            self.paused_until = max(self.paused_until, now + wait)
+        logger.warning(
+            "SAM.gov is throttling requests, pausing for {:.1f}s".format(wait),
+            extra={"requests per second": self.rate},
+        )
+        return True
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class QuotaTracker:
+    """
+    Counts the SAM.gov API calls made today, so that runs can see how much of the
+    daily quota is left.
+
+    The count is persisted to a JSON file, when a path is given, so that it carries
+    over between runs on the same (UTC) day. The file is written at most every
+    save_interval seconds while calls are being counted, outside the lock the
+    counting threads share, and again by save() when the run finishes. When
+    SAM.gov reports the remaining quota in the X-RateLimit-Remaining header, that
+    takes precedence over our own count.
+
+    Parameters:
+        path (str): location of the JSON file
+        daily_limit (int): the API key's daily quota, if known
+        save_interval (float): seconds between writes of the file
+    """
+
+    def __init__(self, path=None, daily_limit=None, save_interval=10):
+        self.path = Path(path) if path else None
+        self.daily_limit = daily_limit
+        self.save_interval = save_interval
+        self.day = self._today()
+        self.used = 0
+        self.server_remaining = None
+        self._lock = threading.Lock()
+        # held while the file is written, so writes don't overtake each other
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_saved = time.monotonic()
+
+        if self.path and self.path.exists():
+            try:
+                with self.path.open("r") as f:
+                    saved = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Unable to read the SAM.gov quota file {}: {}".format(self.path, e))
+                saved = {}
+            if saved.get("day") == self.day:
+                self.used = saved.get("used", 0)
+                self.server_remaining = saved.get("server_remaining")
+
+    @staticmethod
+    def _today():
+        return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.used = 0
+            self.server_remaining = None
+
+    def record(self, headers=None):
+        """
+        Count one API call, and read the rate limit headers of its response.
+        """
+        with self._lock:
+            self._roll_over()
+            self.used += 1
+            remaining = header_int(headers, "X-RateLimit-Remaining")
+            if remaining is not None:
+                self.server_remaining = remaining
+            limit = header_int(headers, "X-RateLimit-Limit")
+            if limit is not None:
+                self.daily_limit = limit
+            self._dirty = True
+            due = self.path and time.monotonic() - self._last_saved >= self.save_interval
+        # a thread that finds another one saving leaves it to that one
+        if due and self._save_lock.acquire(blocking=False):
+            try:
+                self._write()
+            finally:
+                self._save_lock.release()
+
+    def remaining(self):
+        """
+        Returns the number of calls left today, or None if the quota isn't known.
+        """
+        with self._lock:
+            self._roll_over()
+            counted = max(self.daily_limit - self.used, 0) if self.daily_limit else None
+            if self.server_remaining is None:
+                return counted
+            if counted is None:
+                return self.server_remaining
+            return min(counted, self.server_remaining)
+
+    def save(self):
+        """
+        Write the count to the JSON file, if it has changed since it was last written.
+        """
+        with self._save_lock:
+            self._write()
+
+    def _write(self):
+        # called holding _save_lock
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            state = {
+                "day": self.day,
+                "used": self.used,
+                "server_remaining": self.server_remaining,
+                "daily_limit": self.daily_limit,
+            }
+            self._dirty = False
+            self._last_saved = time.monotonic()
+        if self.path.parent and not self.path.parent.exists():
+            os.makedirs(self.path.parent)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+rate_limiter = RateLimiter()
+quota_tracker = QuotaTracker()
+
+
+def configure_sam_limits(
+    requests_per_second=None, burst=1, daily_quota=None, quota_path=None, max_retry_after=MAX_RETRY_AFTER
+):
+    """
+    Replace the process wide rate limiter and quota tracker used for SAM.gov calls.
+    """
+    global rate_limiter, quota_tracker
+    # keep the calls counted by the tracker being replaced
+    quota_tracker.save()
+    rate_limiter = RateLimiter(
+        requests_per_second=requests_per_second, burst=burst, max_retry_after=max_retry_after
+    )
+    quota_tracker = QuotaTracker(path=quota_path, daily_limit=daily_quota)
+    return rate_limiter, quota_tracker
+
+
+def get_quota_tracker():
+    return quota_tracker
+
+
+def header_int(headers, name):
+    """
+    Returns the integer value of a response header, or None.
+    """
+    try:
+        value = headers.get(name) if headers is not None else None
+    except AttributeError:
+        return None
+    if isinstance(value, (str, int)):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def retry_after_seconds(headers):
+    """
+    Returns the number of seconds a Retry-After header asks us to wait, or None.
+    The header can be a number of seconds or an HTTP date.
+    """
+    seconds = header_int(headers, "Retry-After")
+    if seconds is not None:
+        return max(seconds, 0)
+    value = headers.get("Retry-After") if headers is not None else None
+    if isinstance(value, str):
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+    return None
+
+
+def response_status(response):
+    """
+    Returns the status code of a requests or urllib3 response.
+    """
+    status = getattr(response, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(response, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def sam_request(send, *args, **kwargs):
+    """
+    Make a SAM.gov API call with send(*args, **kwargs), e.g. session.get or
+    PoolManager.request, through the shared rate limiter and quota tracker.
+    Responses with status 429 are retried after the Retry-After period, unless
+    it is longer than the rate limiter's max_retry_after, in which case the 429
+    response is returned.
+    """
+    for attempt in range(MAX_THROTTLED_RETRIES + 1):
+        rate_limiter.acquire()
+        r = send(*args, **kwargs)
+        quota_tracker.record(getattr(r, "headers", None))
+        if response_status(r) != 429:
+            rate_limiter.succeeded()
+            return r
+        if not rate_limiter.throttled(retry_after_seconds(r.headers)):
+            return r
+        if attempt < MAX_THROTTLED_RETRIES and hasattr(r, "release_conn"):
+            r.release_conn()
+    return r
+
+
+def sam_get(session, url, timeout=100, **kwargs):
+    """
+    session.get for SAM.gov API urls. See sam_request.
+    """
+    return sam_request(session.get, url, timeout=timeout, **kwargs)
+
+
 def get_opps(uri, params, headers, session=None):
     try:
         logger.info(
@@ -0,0 +1,104 @@
+import datetime
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class RunLedger:
+    """
+    JSON file recording how far a run has got, one posted date at a time, so that an
+    interrupted backfill can be resumed instead of starting over.
+
+    Each day records the solicitation numbers that have been committed, and how many
+    opportunities and attachments they had. It is marked complete once every chunk for
+    the day has been committed. The file is rewritten after every chunk.
+
+    Parameters:
+        path (str): location of the ledger file
+        target_sol_types (str): the notice types being fetched. A ledger written for
+            other notice types isn't resumed.
+        resume (bool): continue from the existing ledger file rather than starting a new one
+    """
+
+    def __init__(self, path, target_sol_types=None, resume=False):
+        self.path = Path(path)
+        self.target_sol_types = str(target_sol_types)
+        self.days = {}
+
+        if resume and self.path.exists():
+            with self.path.open("r") as f:
+                ledger = json.load(f)
+            if ledger.get("target_sol_types") == self.target_sol_types:
+                self.days = ledger.get("days", {})
+                logger.info(
+                    "Resuming run from {}: {} days complete".format(
+                        self.path, sum(1 for day in self.days.values() if day["complete"])
+                    )
+                )
+            else:
+                logger.warning(
+                    "Not resuming from {}, it was written for notice types {}".format(
+                        self.path, ledger.get("target_sol_types")
+                    )
+                )
+        elif resume:
+            logger.warning("No run ledger found at {}, starting from the beginning".format(self.path))
+
+    def _day(self, day):
+        key = day.isoformat()
+        if key not in self.days:
+            self.days[key] = {
+                "complete": False,
+                "opportunities": 0,
+                "attachments": 0,
+                "solNums": [],
+            }
+        return self.days[key]
+
+    def is_complete(self, day):
+        return self.days.get(day.isoformat(), {}).get("complete", False)
+
+    def committed(self, day):
+        """
+        Returns the set of solicitation numbers already committed for day.
+        """
+        return set(self.days.get(day.isoformat(), {}).get("solNums", []))
+
+    def record_chunk(self, day, sol_nums, attachments=0):
+        """
+        Record a committed chunk of opportunities posted on day.
+        """
+        entry = self._day(day)
+        entry["solNums"].extend(sol_nums)
+        entry["opportunities"] += len(sol_nums)
+        entry["attachments"] += attachments
+        self.save()
+
+    def complete_day(self, day):
+        entry = self._day(day)
+        entry["complete"] = True
+        self.save()
+        logger.info(
+            "Finished {}: {} opportunities, {} attachments".format(
+                day.isoformat(), entry["opportunities"], entry["attachments"]
+            )
+        )
+
+    def save(self):
+        if self.path.parent and not self.path.parent.exists():
+            os.makedirs(self.path.parent)
+        # write to a temporary file first so a crash can't leave a truncated ledger
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(
+                {
+                    "target_sol_types": self.target_sol_types,
+                    "updated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "days": self.days,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime as dt
 from datetime import timedelta
 from io import BytesIO
@@ -7,11 +9,17 @@ import zipfile
 import fbo_scraper.db.db as db
 
 import copy
+from sqlalchemy import DateTime, Float, case, cast, func, literal, not_, select, update
+from sqlalchemy.dialects.postgresql import TIMESTAMP
 from fbo_scraper.db.db_utils import fetch_notice_type_id
+from fbo_scraper.request_utils import get_http_session, get_quota_tracker, sam_get
 
 
 logger = logging.getLogger(__name__)
 
+# old solicitations to recheck when the API quota isn't known
+DEFAULT_MAX_TESTS = 100
+
 naics_code_prefixes = (
     "334111",
     "334118",
@@ -144,15 +152,13 @@ def get_notice_type(notice_type_code):
     return sam_notice_type
 
 
-def get_opp_from_sam(solNum):
+def get_opp_from_sam(solNum, session=None):
     base_uri = os.getenv('SAM_API_URI') or "https://api.sam.gov/opportunities/v2/search"
     uri = base_uri + f"?solnum={solNum}&api_key={os.getenv('SAM_API_KEY')}&limit=1"
-    session = requests_retry_session()
-    r = session.get(uri, timeout = 100)
+    r = sam_get(session or get_http_session(), uri)
     data = r.json()
     if data['totalRecords'] == 0:
         return None
-    session.close()
     return data['opportunitiesData'][0]
 
 def schematize_opp(opp):
@@ -384,68 +390,229 @@ def update_notice_type_if_necessary(sol, sam_data, session):
     return 0
 
 
+def recheck_budget(quota_reserve=0, default=DEFAULT_MAX_TESTS):
+    """
+    Returns how many old solicitations can be rechecked with what is left of
+    today's SAM.gov API quota, or default if the quota isn't known.
+    """
+    remaining = get_quota_tracker().remaining()
+    if remaining is None:
+        return default
+    budget = max(remaining - quota_reserve, 0)
+    logger.info(
+        "{} SAM.gov API calls left today, rechecking up to {} old solicitations".format(
+            remaining, budget
+        )
+    )
+    return budget
+
+
+# responseDeadLine values that are safe to cast to a timestamp. A cast that fails would
+# fail the whole query, so anything else, including February 29th, counts as no deadline.
+RESPONSE_DEADLINE_PATTERN = (
+    r"^\d{4}-((0[13578]|1[02])-(0[1-9]|[12]\d|3[01])|(0[469]|11)-(0[1-9]|[12]\d|30)|02-(0[1-9]|1\d|2[0-8]))"
+    r"(T([01]\d|2[0-3]):[0-5]\d(:[0-5]\d(\.\d+)?)?)?(Z|[+-]([01]\d|2[0-3]):?[0-5]\d)?$"
+)
+
+
+def days_since(now, timestamp):
+    return func.extract("epoch", literal(now, DateTime) - timestamp) / (24 * 60 * 60)
+
+
+def recheck_priority(now, recheck_interval=14):
+    """
+    SQL expression scoring how likely a solicitation is to have changed in sam.gov
+    since we last looked, so that the highest scoring ones can be picked in the database.
+
+    The score is the time since the last check (or since it was posted, if it has
+    never been checked) in units of recheck_interval days, scaled up for notices
+    close to their response deadline, when amendments and cancellations happen, and
+    for notices that rechecks have often found changed before.
+    """
+    sol = db.Solicitation
+    last_checked = func.coalesce(sol.last_checked_at, sol.date, literal(now, DateTime))
+    staleness = func.greatest(days_since(now, last_checked), 0) / recheck_interval
+
+    deadline_text = func.coalesce(sol.noticeData["responseDeadLine"].astext, "")
+    # the deadline as a UTC timestamp, like last_checked_at and date
+    deadline = func.timezone("UTC", cast(deadline_text, TIMESTAMP(timezone=True)))
+    days_left = -days_since(now, deadline)
+    urgency = case(
+        (not_(deadline_text.op("~")(RESPONSE_DEADLINE_PATTERN)), 0),
+        (days_left >= 0, 1 / (1 + days_left / 7)),
+        # notices past their deadline matter less, but are about to become inactive
+        else_=0.5 / (1 - days_left / 7),
+    )
+
+    # smoothed so that never checked notices start in the middle
+    change_rate = cast(func.coalesce(sol.recheck_changes, 0) + 1, Float) / (
+        func.coalesce(sol.recheck_count, 0) + 2
+    )
+
+    return staleness * (1 + urgency) * (0.5 + change_rate)
+
+
+def select_recheck_candidates(
+    session,
+    age_cutoff=365,
+    max_tests=None,
+    fraction=14,
+    noticeTypes=("Solicitation", "Combined Synopsis/Solicitation"),
+):
+    """
+    Select the active solicitations newer than the age cutoff that are most likely
+    to be out of date, by recheck_priority, with fraction as the recheck interval.
+    They are ranked and limited in the database, so only the rows to recheck are loaded.
+
+    Returns:
+        a list of at most max_tests rows with the columns needed for the recheck,
+        highest priority first
+    """
+    priority = recheck_priority(dt.utcnow(), recheck_interval=fraction)
+    stmt = (
+        select(
+            db.Solicitation.id,
+            db.Solicitation.solNum,
+            db.Solicitation.active,
+            db.Solicitation.noticeType,
+            db.Solicitation.notice_type_id,
+            db.Solicitation.recheck_count,
+            db.Solicitation.recheck_changes,
+        )
+        .where(db.Solicitation.active.is_(True))
+        .where(db.Solicitation.date > dt.today() - timedelta(age_cutoff))
+        .where(db.Solicitation.noticeType.in_(noticeTypes))
+        .order_by(priority.desc(), db.Solicitation.id)
+    )
+    if max_tests is not None:
+        stmt = stmt.limit(max_tests)
+    return session.execute(stmt).all()
+
+
+def fetch_opps_from_sam(sol_nums, max_workers=1):
+    """
+    Look up solicitations in the SAM.gov API concurrently, on the shared HTTP session.
+    The calls are paced by the shared SAM.gov rate limiter.
+
+    Returns:
+        a dict of solicitation number to the opportunity data, or None if SAM.gov
+        doesn't have it. Solicitations whose lookup failed are left out.
+    """
+    results = {}
+    session = get_http_session()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(get_opp_from_sam, sol_num, session): sol_num
+            for sol_num in sol_nums
+        }
+        for future in as_completed(futures):
+            sol_num = futures[future]
+            try:
+                results[sol_num] = future.result()
+            except Exception as e:
+                logger.error(f"Unable to look up {sol_num} in the sam.gov API: {e}")
+    return results
+
+
 def update_old_solicitations(
     session,
     age_cutoff=365,
-    max_tests=100,
+    max_tests=None,
     fraction=14,
     noticeTypes=("Solicitation", "Combined Synopsis/Solicitation"),
+    quota_reserve=0,
+    max_workers=1,
+    async_mode=False,
 ):
     """
-    Examines a fraction of the existing solicitations newer than the age cutoff to see if there
-    are any changes in sam.gov. If you call this function every day and you don't hit the max_tests
-    limit, you will re-check each solicitiaton every $fraction days.
+    Examines the existing solicitations newer than the age cutoff that are most likely to have
+    changed in sam.gov, see recheck_priority. If you call this function every day and you don't hit
+    the max_tests limit, you will re-check each solicitiaton about every $fraction days.
 
     Args:
         session: open db session
         age_cutoff: how many days to look back
-        max_tests: at most test this many solicitaitons so we don't go over our api call limit
+        max_tests: at most test this many solicitaitons so we don't go over our api call limit.
+            If None, spend whatever is left of today's SAM.gov API quota, less quota_reserve.
+        quota_reserve: API calls to leave unspent when max_tests is taken from the quota
+        max_workers: concurrent lookups in the sam.gov API
+        async_mode: make the lookups with the asyncio client, max_workers at a time. Needs httpx.
 
     Returns:
 
     """
+    stats = {"examined": 0, "updated": 0, "total": 0}
     try:
-        stats = {"examined": 0, "updated": 0, "total": 0}
-
-        solicitations = (
-            session.query(db.Solicitation)
-            .filter(db.Solicitation.active is True)
-            .filter(db.Solicitation.date > dt.today() - timedelta(age_cutoff))
-            .order_by(db.Solicitation.date.desc())
+        if max_tests is None:
+            max_tests = recheck_budget(quota_reserve)
+
+        candidates = select_recheck_candidates(
+            session,
+            age_cutoff=age_cutoff,
+            max_tests=max_tests,
+            fraction=fraction,
+            noticeTypes=noticeTypes,
         )
-        candidate_solicitations = []
-        for sol in solicitations:
-            if sol.id % fraction == 0:
-                if sol.noticeType in noticeTypes:
-                    candidate_solicitations.append(sol)
-
-        for sol in candidate_solicitations:
-            stats['examined'] += 1
-            if stats['examined'] > max_tests:
-                logger.warning("Max test count hit when trying to examine old solicitations")
-                break
+        stats["total"] = len(candidates)
+        if len(candidates) == max_tests:
+            logger.warning("Max test count hit when trying to examine old solicitations")
 
-            sam_sol_data = get_opp_from_sam(sol.solNum)
-            if sam_sol_data == None:
-                logger.info(f"could not find {sol.solNum} in the sam.gov API - I will assume that means it is inactive")
-                sol.active = False
-                stats["updated"] += 1
-                continue
+        sol_nums = [sol.solNum for sol in candidates]
+        if async_mode:
+            # imported here since it needs httpx, and imports this module through get_opps
+            from fbo_scraper import async_sam_client
 
-            if sol.active != (sam_sol_data["active"].lower() == "yes"):
-                sol.active = sam_sol_data["active"]
+            sam_data = asyncio.run(
+                async_sam_client.fetch_opps_from_sam(sol_nums, max_in_flight=max_workers)
+            )
+        else:
+            sam_data = fetch_opps_from_sam(sol_nums, max_workers=max_workers)
+
+        checked_at = dt.utcnow()
+        updates = []
+        for sol in candidates:
+            if sol.solNum not in sam_data:
+                continue
+            stats["examined"] += 1
+            sam_sol_data = sam_data[sol.solNum]
+            values = {
+                "id": sol.id,
+                "active": sol.active,
+                "noticeType": sol.noticeType,
+                "notice_type_id": sol.notice_type_id,
+                "last_checked_at": checked_at,
+                "recheck_count": (sol.recheck_count or 0) + 1,
+                "recheck_changes": sol.recheck_changes or 0,
+            }
+
+            if sam_sol_data is None:
+                logger.info(f"could not find {sol.solNum} in the sam.gov API - I will assume that means it is inactive")
+                values["active"] = False
+            elif sam_sol_data.get("active", "yes").lower() != "yes":
                 logger.info(
                     f"Updating the active state for {sol.solNum} - setting it inactive"
                 )
-                stats["updated"] += 1
+                values["active"] = False
             else:
                 logger.debug(
                     f"Performed check on {sam_sol_data['solicitationNumber']} but no updates were necessary"
                 )
 
-            stats["updated"] += update_notice_type_if_necessary(
-                sol, sam_sol_data, session
-            )
+            if sam_sol_data is not None and sol.noticeType != sam_sol_data["type"]:
+                logger.info(
+                    f"Updating the notice type for {sol.solNum} to be {sam_sol_data['type']}"
+                )
+                values["noticeType"] = sam_sol_data["type"]
+                values["notice_type_id"] = fetch_notice_type_id(sam_sol_data["type"], session)
+
+            if values["active"] != sol.active or values["noticeType"] != sol.noticeType:
+                values["recheck_changes"] += 1
+                stats["updated"] += 1
+            updates.append(values)
+
+        # every examined solicitation gets its check recorded, changed or not
+        if updates:
+            session.execute(update(db.Solicitation), updates)
 
         logger.info(
             "Recheck of old solicitations complete. {} solicitations examined and {} updated ".format(
@@ -0,0 +1,244 @@
+"""
+Load test the scraper against the mock SAM.gov server in tests/mock_sam_server.py.
+
+Runs fbo_scraper.main.main end to end, with the SAM.gov API replaced by the mock
+server and the database by a throwaway PostgreSQL database (the models use JSONB,
+so SQLite won't do), and reports the throughput of each stage:
+
+    python -m tests.benchmark --records-per-day 500 --days 2 --latency 0.05 -- --max-workers 8
+
+Arguments after -- are passed on to the scraper, as if it was run from the command
+line. SAM.gov rate limits, the attachment cache and the run ledger are turned off so
+that repeated runs measure the same thing.
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.mock_sam_server import MockSamServer, SEARCH_PATH, serve
+from fbo_scraper import get_opps
+from fbo_scraper import main as scraper
+from fbo_scraper.db.connection import TestDAL
+from fbo_scraper.options import pre_main
+from fbo_scraper.predict import Predict
+from fbo_scraper.sam_utils import opportunity_filter_function
+
+
+class StageTimer:
+    """
+    Wall clock time and items processed by each stage of a run. A stage is busy
+    while any call to one of its functions is running, so calls made concurrently
+    by worker threads aren't counted twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {"calls": 0, "items": 0, "seconds": 0.0, "_active": 0, "_since": 0.0})
+
+    def wrap(self, name, func, count):
+        """
+        Returns func timed as part of stage name. count is called with the result
+        and the positional arguments to get the number of items processed.
+        """
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with self._lock:
+                stage = self._stage(name)
+                if not stage["_active"]:
+                    stage["_since"] = time.monotonic()
+                stage["_active"] += 1
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    stage["_active"] -= 1
+                    stage["calls"] += 1
+                    if not stage["_active"]:
+                        stage["seconds"] += time.monotonic() - stage["_since"]
+            items = count(result, args)
+            with self._lock:
+                stage["items"] += items
+            return result
+
+        return timed
+
+    def report(self):
+        return {
+            name: {
+                "calls": stage["calls"],
+                "items": stage["items"],
+                "seconds": round(stage["seconds"], 3),
+                "items_per_second": round(stage["items"] / stage["seconds"], 1) if stage["seconds"] else None,
+            }
+            for name, stage in self.stages.items()
+        }
+
+
+class BenchmarkDAL(TestDAL):
+    """
+    TestDAL for the given database, which is created if it doesn't exist.
+    """
+
+    def __init__(self, conn_string=None):
+        super().__init__()
+        if conn_string:
+            self._conn_string = conn_string
+
+
+def count_results(result, args):
+    return len(result or ())
+
+
+def count_page(data, args):
+    return len(data["opportunitiesData"])
+
+
+def count_attachments(opps, args):
+    return sum(len(opp["attachments"]) for opp in opps or ())
+
+
+def count_inserted(result, args):
+    # returns nothing, so count the opportunities it was given
+    return len(args[1])
+
+
+def count_examined(stats, args):
+    return stats.get("examined", 0) if isinstance(stats, dict) else 0
+
+
+# (object, attribute, stage, count) for each function that is timed
+TIMED = (
+    (get_opps, "get_opps_page", "search", count_page),
+    (get_opps, "get_docs", "download", count_results),
+    (get_opps, "add_attachment_data", "attachments", count_attachments),
+    (Predict, "insert_predictions", "predict", count_results),
+    (scraper, "insert_data_into_solicitations_table", "insert", count_inserted),
+    (scraper, "update_old_solicitations", "recheck", count_examined),
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records-per-day", type=int, default=200)
+    parser.add_argument("--days", type=int, default=1, help="Days of opportunities to fetch")
+    parser.add_argument("--attachments-per-opp", type=int, default=1)
+    parser.add_argument("--attachment-kb", type=int, default=16, help="Size of each attachment")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds every response is delayed by")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of urls that fail once with a 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--db-url", help="PostgreSQL database to use instead of the test database. It isn't dropped afterwards."
+    )
+    parser.add_argument("--keep-db", action="store_true", help="Don't drop the test database afterwards")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    parser.add_argument("scraper_args", nargs="*", help="Arguments for the scraper, after --")
+    return parser.parse_args(argv)
+
+
+def run(args):
+    # fixed dates, so that every run fetches the same opportunities
+    from_date = datetime.date(2023, 1, 2)
+    to_date = from_date + datetime.timedelta(days=max(args.days, 1) - 1)
+    options = pre_main(
+        app_name="srt-fbo-scraper-benchmark",
+        app_version="",
+        args=["--from-date", f"{from_date:%m/%d/%Y}", "--to-date", f"{to_date:%m/%d/%Y}", *args.scraper_args],
+        _make_parser=scraper.scraper_parser,
+    )
+    options.sam.requests_per_second = None
+    options.sam.daily_quota = None
+    options.sam.quota_path = None
+    options.cache.path = None
+    options.ledger.path = None
+
+    server = MockSamServer(
+        records_per_day=args.records_per_day,
+        attachments_per_opp=args.attachments_per_opp,
+        attachment_bytes=args.attachment_kb * 1024,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    timer = StageTimer()
+    dal = BenchmarkDAL(args.db_url)
+    dal.connect()
+    work_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+
+    try:
+        with serve(server) as base_url, ExitStack() as stack:
+            stack.enter_context(
+                patch.dict(os.environ, {"SAM_API_URI": base_url + SEARCH_PATH, "SAM_API_KEY": "benchmark"})
+            )
+            stack.enter_context(patch.object(scraper, "setup_db", return_value=dal))
+            for target, name, stage, count in TIMED:
+                stack.enter_context(patch.object(target, name, timer.wrap(stage, getattr(target, name), count)))
+            # attachments are written to the working directory
+            os.chdir(work_dir)
+            started = time.monotonic()
+            scraper.main(
+                limit=options.client.limit,
+                updateOld=options.database.update_old,
+                opportunity_filter_function=opportunity_filter_function,
+                target_sol_types=options.client.target_sol_types,
+                skip_attachments=options.client.skip_attachments,
+                from_date=options.client.from_date,
+                to_date=options.client.to_date,
+                max_workers=options.client.max_workers,
+                download_workers=options.client.download_workers,
+                extract_workers=options.client.extract_workers,
+                stream=options.client.stream,
+                chunk_size=options.client.chunk_size,
+                options=options,
+            )
+            elapsed = time.monotonic() - started
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+        dal.disconnect()
+        if not (args.keep_db or args.db_url):
+            dal.drop_test_postgres_db()
+
+    return {
+        "seconds": round(elapsed, 3),
+        "stages": timer.report(),
+        "server": server.stats,
+    }
+
+
+def print_report(report):
+    print(f"Run took {report['seconds']}s")
+    print(f"{'stage':<12}{'calls':>8}{'items':>10}{'seconds':>10}{'items/s':>10}")
+    for name, stage in report["stages"].items():
+        print(
+            f"{name:<12}{stage['calls']:>8}{stage['items']:>10}{stage['seconds']:>10}"
+            f"{stage['items_per_second'] if stage['items_per_second'] is not None else '-':>10}"
+        )
+    print("Mock SAM.gov server: " + ", ".join(f"{k} {v}" for k, v in report["server"].items()))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Measure what the extraction budget saves, and what it costs the prediction model:
+
+    python -m tests.benchmark_budget --max-pages 200 --max-chars 2000000 --max-mb 20
+    python -m tests.benchmark_budget --docs-dir ~/attachments --max-pages 50
+
+Every document is extracted twice, once in full and once within the budget, each time
+in its own process so the peak RSS it needs can be reported (read from /proc, so this
+only runs on Linux). Both texts are then classified with the model in
+fbo_scraper/binaries and the predictions compared. Without --docs-dir, long PDF and
+text documents are generated.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen.canvas import Canvas
+
+from tests.benchmark_extraction import paragraphs
+from fbo_scraper.get_doc_text import ExtractionBudget, get_doc_text
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def extract(path, budget):
+    """
+    Runs in its own process. Returns the text, whether it was truncated, the seconds
+    it took and the peak RSS of the process while extracting, in MB.
+    """
+    # reset the peak, so it isn't the one reached by importing or by an earlier document
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    started = time.monotonic()
+    text = get_doc_text(path, rm=False, budget=budget)
+    elapsed = time.monotonic() - started
+    return text or "", bool(budget and budget.truncated), elapsed, peak_rss_mb()
+
+
+def generate_docs(out_path, pages):
+    """
+    Writes a PDF with pages full pages of text, and a text file with the same text.
+    """
+    lines = [line[:100] for line in paragraphs(50)]
+    pdf_path = os.path.join(out_path, "long.pdf")
+    canvas = Canvas(pdf_path, pagesize=letter)
+    for page in range(pages):
+        text = canvas.beginText(40, 750)
+        for line in lines[page % 7:] + lines[: page % 7]:
+            text.textLine(line)
+        canvas.drawText(text)
+        canvas.showPage()
+    canvas.save()
+
+    txt_path = os.path.join(out_path, "long.txt")
+    with open(txt_path, "w") as f:
+        for page in range(pages):
+            f.write("\n".join(lines) + "\n\n")
+    return [pdf_path, txt_path]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs-dir", help="Directory of attachments to extract, instead of generated documents")
+    parser.add_argument("--pages", type=int, default=500, help="Pages in each generated document")
+    parser.add_argument("--max-pages", type=int)
+    parser.add_argument("--max-chars", type=int)
+    parser.add_argument("--max-mb", type=int)
+    args = parser.parse_args(argv)
+
+    budget = ExtractionBudget(args.max_pages, args.max_chars, args.max_mb * 1024 * 1024 if args.max_mb else None)
+    out_path = tempfile.mkdtemp()
+    if args.docs_dir:
+        docs = sorted(
+            os.path.join(args.docs_dir, name)
+            for name in os.listdir(args.docs_dir)
+            if os.path.isfile(os.path.join(args.docs_dir, name))
+        )
+    else:
+        docs = generate_docs(out_path, args.pages)
+
+    # imported here, so the extraction processes don't load the model's dependencies
+    from fbo_scraper.predict import Predict
+
+    predict = Predict()
+    agree = 0
+    print(f"{'document':<30}{'full MB':>9}{'full s':>8}{'budget MB':>11}{'budget s':>10}{'truncated':>11}{'same':>6}")
+    # spawn, so that each extraction starts from a process without the model loaded
+    context = multiprocessing.get_context("spawn")
+    try:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for path in docs:
+                full_text, _, full_seconds, full_mb = pool.apply(extract, (path, None))
+                text, truncated, seconds, peak_mb = pool.apply(extract, (path, budget.copy()))
+                predictions, _ = predict.predict_batch(predict.normalize_texts([full_text, text]))
+                same = predictions[0] == predictions[1]
+                agree += same
+                print(
+                    f"{os.path.basename(path)[:29]:<30}{full_mb:>9.1f}{full_seconds:>8.2f}"
+                    f"{peak_mb:>11.1f}{seconds:>10.2f}{str(truncated):>11}{str(same):>6}"
+                )
+    finally:
+        shutil.rmtree(out_path)
+    print(f"Predictions agree for {agree} of {len(docs)} documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare how many documents a second the in-process extractors in get_doc_text get
+through against textract, one format at a time:
+
+    python -m tests.benchmark_extraction --docs 50 --paragraphs 40
+
+Formats without an in-process extractor, like RTF, go to textract either way. Documents
+textract fails on, e.g. because pdftotext or unrtf isn't installed, are counted as errors.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from docx import Document
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen.canvas import Canvas
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.mock_sam_server import WORDS
+from fbo_scraper.get_doc_text import extract_text, sniff_file, textract_file
+
+
+def paragraphs(count):
+    return [" ".join(WORDS[(i + j) % len(WORDS)] for j in range(40)) for i in range(count)]
+
+
+def write_pdf(path, text):
+    canvas = Canvas(path, pagesize=letter)
+    lines = canvas.beginText(40, 750)
+    for i, paragraph in enumerate(text):
+        if i and i % 10 == 0:
+            canvas.drawText(lines)
+            canvas.showPage()
+            lines = canvas.beginText(40, 750)
+        lines.textLine(paragraph[:100])
+    canvas.drawText(lines)
+    canvas.save()
+
+
+def write_docx(path, text):
+    document = Document()
+    for paragraph in text:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_html(path, text):
+    with open(path, "w") as f:
+        f.write("<html><body>" + "".join(f"<p>{p}</p>" for p in text) + "</body></html>")
+
+
+def write_txt(path, text):
+    with open(path, "w") as f:
+        f.write("\n\n".join(text))
+
+
+def write_rtf(path, text):
+    with open(path, "w") as f:
+        f.write(r"{\rtf1\ansi{\fonttbl{\f0 Times New Roman;}}\f0 " + r"\par ".join(text) + "}")
+
+
+FORMATS = {
+    "pdf": write_pdf,
+    "docx": write_docx,
+    "html": write_html,
+    "txt": write_txt,
+    "rtf": write_rtf,
+}
+
+
+def in_process(path, file_type):
+    text = extract_text(path, file_type)
+    return text if text is not None else textract_file(path, file_type)
+
+
+def with_textract(path, file_type):
+    return textract_file(path)
+
+
+def time_docs(extract, path, docs):
+    errors = 0
+    file_type = sniff_file(path)
+    started = time.monotonic()
+    for _ in range(docs):
+        if not extract(path, file_type):
+            errors += 1
+    elapsed = time.monotonic() - started
+    return docs / elapsed if elapsed else None, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20, help="Documents extracted per format and method")
+    parser.add_argument("--paragraphs", type=int, default=20, help="Paragraphs in each document")
+    args = parser.parse_args(argv)
+
+    out_path = tempfile.mkdtemp()
+    text = paragraphs(args.paragraphs)
+    print(f"{'format':<8}{'in-process docs/s':>20}{'errors':>8}{'textract docs/s':>18}{'errors':>8}")
+    try:
+        for name, write in FORMATS.items():
+            path = os.path.join(out_path, f"benchmark.{name}")
+            write(path, text)
+            fast, fast_errors = time_docs(in_process, path, args.docs)
+            slow, slow_errors = time_docs(with_textract, path, args.docs)
+            print(f"{name:<8}{fast:>20.1f}{fast_errors:>8}{slow:>18.1f}{slow_errors:>8}")
+    finally:
+        shutil.rmtree(out_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+A local stand-in for the SAM.gov opportunities API, for load testing the scraper.
+
+The server is a plain WSGI app, so it can be served with wsgiref, which is all the
+tests and the benchmark in tests/benchmark.py need:
+
+    server = MockSamServer(records_per_day=500, attachments_per_opp=2)
+    with serve(server) as base_url:
+        os.environ["SAM_API_URI"] = base_url + "/opportunities/v2/search"
+        ...
+
+Every response is generated from the seed, so two servers built with the same
+arguments serve exactly the same opportunities and attachments.
+"""
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+SEARCH_PATH = "/opportunities/v2/search"
+ATTACHMENT_PATH = "/attachments/"
+
+# words the attachment text is made from, so the prediction model sees something like a solicitation
+WORDS = (
+    "section 508 accessibility information communication technology ict software "
+    "hardware vendor shall provide conformance report vpat wcag standards "
+    "contract offeror requirements statement of work deliverables agency system "
+    "support maintenance license electronic documents accessible users disabilities"
+).split()
+
+NAICS_CODES = ("541511", "541512", "518210", "334111", "236220", "561720")
+PSC_CODES = ("7030", "D302", "DA01", "R408", "Z1AA")
+
+
+class MockSamServer:
+    """
+    WSGI app serving paginated search results, single solicitation lookups and
+    attachment downloads in the shape the SAM.gov API does.
+
+    Parameters:
+        records_per_day (int): opportunities posted on each day that is searched
+        attachments_per_opp (int): resourceLinks on each opportunity
+        attachment_bytes (int): size of each attachment
+        latency (float): seconds every response is delayed by
+        error_rate (float): fraction of urls whose first request fails with a 503.
+            Retrying the url succeeds, so a client that retries still gets every record.
+        seed (int): seed the opportunities and attachments are generated from
+    """
+
+    def __init__(
+        self,
+        records_per_day=100,
+        attachments_per_opp=1,
+        attachment_bytes=16 * 1024,
+        latency=0,
+        error_rate=0,
+        seed=0,
+    ):
+        self.records_per_day = records_per_day
+        self.attachments_per_opp = attachments_per_opp
+        self.attachment_bytes = attachment_bytes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._failed = set()
+        self.stats = {
+            "searches": 0,
+            "lookups": 0,
+            "attachments": 0,
+            "errors": 0,
+            "bytes_sent": 0,
+        }
+
+    def __call__(self, environ, start_response):
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = environ.get("PATH_INFO", "")
+        params = dict(urllib.parse.parse_qsl(environ.get("QUERY_STRING", "")))
+        base_url = "{}://{}".format(environ["wsgi.url_scheme"], environ["HTTP_HOST"])
+        url = path + "?" + environ.get("QUERY_STRING", "")
+
+        if self._should_fail(url):
+            return self._respond(start_response, "503 Service Unavailable", b"", "errors")
+
+        if path == SEARCH_PATH and "solnum" in params:
+            body = json.dumps(self.lookup(params["solnum"], base_url)).encode("utf-8")
+            return self._respond(start_response, "200 OK", body, "lookups")
+        if path == SEARCH_PATH:
+            try:
+                data = self.search(params, base_url)
+            except (KeyError, ValueError) as e:
+                body = json.dumps({"error": {"message": f"Invalid search: {e}"}}).encode("utf-8")
+                return self._respond(start_response, "400 Bad Request", body, "errors")
+            return self._respond(start_response, "200 OK", json.dumps(data).encode("utf-8"), "searches")
+        if path.startswith(ATTACHMENT_PATH):
+            sol_num, _, number = path[len(ATTACHMENT_PATH):].partition("/")
+            filename = urllib.parse.quote_plus(f"{sol_num} Attachment {number}.txt")
+            return self._respond(
+                start_response,
+                "200 OK",
+                self.attachment_content(path),
+                "attachments",
+                content_type="text/plain",
+                headers=[("Content-Disposition", f"attachment; filename={filename}")],
+            )
+        return self._respond(start_response, "404 Not Found", b"", "errors")
+
+    def _should_fail(self, url):
+        if not self.error_rate:
+            return False
+        digest = hashlib.sha1(f"{self.seed}:{url}".encode("utf-8")).digest()
+        if int.from_bytes(digest[:4], "big") / 2**32 >= self.error_rate:
+            return False
+        with self._lock:
+            if url in self._failed:
+                return False
+            self._failed.add(url)
+        return True
+
+    def _respond(self, start_response, status, body, stat, content_type="application/json", headers=()):
+        with self._lock:
+            self.stats[stat] += 1
+            self.stats["bytes_sent"] += len(body)
+        start_response(
+            status,
+            [("Content-Type", content_type), ("Content-Length", str(len(body))), *headers],
+        )
+        return [body]
+
+    def opportunity(self, posted, number, base_url):
+        """
+        The opportunity posted on day posted with the given number.
+        """
+        rng = random.Random(f"{self.seed}:{posted.isoformat()}:{number}")
+        sol_num = f"MOCK-{posted:%Y%m%d}-{number:05d}"
+        return {
+            "noticeId": hashlib.sha1(sol_num.encode("utf-8")).hexdigest(),
+            "title": " ".join(rng.choice(WORDS) for _ in range(6)),
+            "solicitationNumber": sol_num,
+            "fullParentPathName": "MOCK AGENCY.MOCK OFFICE.MOCK CONTRACTING OFFICE",
+            "postedDate": posted.isoformat(),
+            "type": rng.choice(("Solicitation", "Combined Synopsis/Solicitation")),
+            "active": "Yes",
+            "classificationCode": rng.choice(PSC_CODES),
+            "naicsCode": rng.choice(NAICS_CODES),
+            "typeOfSetAside": rng.choice(("", "SBA", "8A")),
+            "responseDeadLine": (posted + datetime.timedelta(days=rng.randint(7, 60))).isoformat()
+            + "T17:00:00-04:00",
+            "pointOfContact": [{"email": f"contracting.officer{rng.randint(1, 50)}@example.gov"}],
+            "uiLink": f"https://sam.gov/opp/{sol_num}/view",
+            "resourceLinks": [
+                f"{base_url}{ATTACHMENT_PATH}{sol_num}/{i}" for i in range(self.attachments_per_opp)
+            ]
+            or None,
+        }
+
+    def search(self, params, base_url):
+        posted_from = datetime.datetime.strptime(params["postedFrom"], "%m/%d/%Y").date()
+        posted_to = datetime.datetime.strptime(params["postedTo"], "%m/%d/%Y").date()
+        limit = int(params.get("limit", 1))
+        offset = int(params.get("offset", 0))
+
+        days = (posted_to - posted_from).days + 1
+        total_records = max(days, 0) * self.records_per_day
+        opps = []
+        for index in range(offset, min(offset + limit, total_records)):
+            posted = posted_from + datetime.timedelta(days=index // self.records_per_day)
+            opps.append(self.opportunity(posted, index % self.records_per_day, base_url))
+        return {"totalRecords": total_records, "limit": limit, "offset": offset, "opportunitiesData": opps}
+
+    def lookup(self, sol_num, base_url):
+        try:
+            _, posted, number = sol_num.split("-")
+            posted = datetime.datetime.strptime(posted, "%Y%m%d").date()
+            number = int(number)
+        except ValueError:
+            return {"totalRecords": 0, "opportunitiesData": []}
+        if number >= self.records_per_day:
+            return {"totalRecords": 0, "opportunitiesData": []}
+        return {"totalRecords": 1, "opportunitiesData": [self.opportunity(posted, number, base_url)]}
+
+    def attachment_content(self, path):
+        rng = random.Random(f"{self.seed}:{path}")
+        words = []
+        size = 0
+        while size < self.attachment_bytes:
+            word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return " ".join(words).encode("utf-8")[: self.attachment_bytes]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(app, host="127.0.0.1", port=0):
+    """
+    Serve app on a background thread, yielding its base url. Port 0 picks a free port.
+    """
+    server = make_server(host, port, app, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://{}:{}".format(host, server.server_port)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
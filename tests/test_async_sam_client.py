@@ -0,0 +1,137 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fbo_scraper import request_utils
+from fbo_scraper.async_sam_client import AsyncSamClient, get_window_opps, httpx
+
+
+def search_page(offset, total_records=6, page_size=2):
+    return {
+        "totalRecords": total_records,
+        "opportunitiesData": [
+            {
+                "postedDate": "2022-01-01",
+                "solicitationNumber": f"SOL{i}",
+                "title": f"Test Opportunity {i}",
+                "active": "Yes",
+            }
+            for i in range(offset, min(offset + page_size, total_records))
+        ],
+    }
+
+
+async def stream_chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class AsyncSamClientTestCase(unittest.TestCase):
+    def setUp(self):
+        request_utils.configure_sam_limits()
+        self.requests = []
+
+    def make_client(self, handler):
+        def record(request):
+            self.requests.append(request)
+            return handler(request)
+
+        client = AsyncSamClient(backoff_factor=0)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+        return client
+
+    def test_retries(self):
+        responses = iter(
+            [
+                httpx.Response(503),
+                httpx.Response(429, headers={"Retry-After": "0"}),
+                httpx.Response(200, json={"totalRecords": 1, "opportunitiesData": [{"solicitationNumber": "SOL1"}]}),
+            ]
+        )
+
+        async def run():
+            async with self.make_client(lambda request: next(responses)) as client:
+                return await client.get_opportunity("SOL1")
+
+        self.assertEqual(asyncio.run(run()), {"solicitationNumber": "SOL1"})
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(request_utils.quota_tracker.used, 3)
+
+    def test_retry_after_too_long(self):
+        async def run():
+            async with self.make_client(lambda request: httpx.Response(429, headers={"Retry-After": "3600"})) as client:
+                return await client.send("GET", "https://api.sam.gov/opportunities/v2/search")
+
+        # the 429 is returned straight away instead of waiting an hour to retry
+        self.assertEqual(asyncio.run(run()).status_code, 429)
+        self.assertEqual(len(self.requests), 1)
+
+    @patch("fbo_scraper.async_sam_client.get_opportunities_search_url", return_value="https://api.sam.gov/search?limit=2")
+    def test_get_window_opps(self, m_search_url):
+        def handler(request):
+            return httpx.Response(200, json=search_page(int(request.url.params["offset"])))
+
+        async def run():
+            async with self.make_client(handler) as client:
+                return await get_window_opps(client, "01/01/2022", "01/01/2022")
+
+        opps = asyncio.run(run())
+        self.assertEqual([o["solicitationNumber"] for o in opps], [f"SOL{i}" for i in range(6)])
+        self.assertEqual(len(self.requests), 3)
+
+    def test_download_attachment(self):
+        out_path = tempfile.mkdtemp()
+
+        def handler(request):
+            return httpx.Response(
+                200,
+                headers={"Content-Disposition": "attachment; filename=Statement+of+Work.txt"},
+                content=b"statement of work",
+            )
+
+        async def run():
+            async with self.make_client(handler) as client:
+                return await client.download_attachment("https://sam.gov/api/prod/opps/v3/opportunities/resources/files/1/download", out_path)
+
+        try:
+            path = asyncio.run(run())
+            self.assertEqual(path, os.path.join(out_path, "Statement of Work.txt"))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"statement of work")
+        finally:
+            shutil.rmtree(out_path)
+
+    def test_download_attachment_skipped(self):
+        out_path = tempfile.mkdtemp()
+        url = "https://sam.gov/api/prod/opps/v3/opportunities/resources/files/1/download"
+        headers = {"Content-Disposition": "attachment; filename=SOW.pdf"}
+        responses = {
+            # too large going by the Content-Length, before anything is read
+            "length": httpx.Response(200, headers=headers, content=b"%PDF-1.4" + b"x" * 2000),
+            # too large going by what is sent, without a Content-Length
+            "streamed": httpx.Response(200, headers=headers, content=stream_chunks(b"%PDF-1.4", b"x" * 2000)),
+            # an executable, sniffed from its first bytes
+            "unsupported": httpx.Response(200, headers=headers, content=stream_chunks(b"MZ\x90\x00")),
+        }
+
+        async def run(response):
+            async with self.make_client(lambda request: response) as client:
+                return await client.download_attachment(url, out_path, max_bytes=1000)
+
+        try:
+            for name, response in responses.items():
+                with self.subTest(name):
+                    self.assertIsNone(asyncio.run(run(response)))
+                    self.assertEqual(os.listdir(out_path), [])
+        finally:
+            shutil.rmtree(out_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fbo_scraper.attachment_cache import AttachmentCache, file_content_hash
+from fbo_scraper.get_doc_text import ExtractionBudget
+from fbo_scraper.get_opps import get_docs
+
+
+class AttachmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.out_path = tempfile.mkdtemp()
+        self.cache = AttachmentCache(os.path.join(self.out_path, "cache", "attachments.sqlite"))
+        self.url = "https://sam.gov/api/prod/opps/v3/opportunities/resources/files/abc/download"
+
+    def tearDown(self):
+        self.cache._conn.close()
+        shutil.rmtree(self.out_path)
+
+    def test_lookup_content_miss_then_hit(self):
+        self.assertIsNone(self.cache.lookup_content(self.url, "hash1", etag='"v1"'))
+        self.cache.store(self.url, "some text", True)
+
+        # same content served from a different url is a hit
+        result = self.cache.lookup_content("https://sam.gov/other", "hash1")
+        self.assertEqual(result, {"text": "some text", "machine_readable": True, "truncated": False, "extraction_error": None})
+        self.assertEqual(self.cache.stats["misses"], 1)
+        self.assertEqual(self.cache.stats["content hits"], 1)
+
+    def test_lookup_url(self):
+        self.cache.lookup_content(self.url, "hash1", etag='"v1"', content_length="10")
+        self.cache.store(self.url, "some text", True)
+
+        self.assertEqual(self.cache.lookup_url(self.url, etag='"v1"')["text"], "some text")
+        self.assertIsNone(self.cache.lookup_url(self.url, etag='"v2"'))
+        # no validators means we can't tell if the file changed
+        self.assertIsNone(self.cache.lookup_url(self.url))
+
+        # without an ETag, both the Last-Modified and the Content-Length have to match
+        last_modified = "Wed, 21 Oct 2015 07:28:00 GMT"
+        self.cache.lookup_content(self.url, "hash2", content_length="12", last_modified=last_modified)
+        self.cache.store(self.url, "other text", False)
+        self.assertIsNone(self.cache.lookup_url(self.url, content_length="12"))
+        self.assertIsNone(self.cache.lookup_url(self.url, content_length="10", last_modified=last_modified))
+        self.assertIsNone(
+            self.cache.lookup_url(self.url, content_length="12", last_modified="Thu, 22 Oct 2015 07:28:00 GMT")
+        )
+        self.assertEqual(
+            self.cache.lookup_url(self.url, content_length="12", last_modified=last_modified),
+            {"text": "other text", "machine_readable": False, "truncated": False, "extraction_error": None},
+        )
+
+    def test_conditional_headers(self):
+        # nothing to send until there is text to fall back on
+        self.cache.lookup_content(self.url, "hash1", etag='"v1"', last_modified="Wed, 21 Oct 2015 07:28:00 GMT", filename="sow.pdf")
+        self.assertEqual(self.cache.conditional_headers(self.url), {})
+
+        self.cache.store(self.url, "some text", True)
+        self.assertEqual(
+            self.cache.conditional_headers(self.url),
+            {"If-None-Match": '"v1"', "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"},
+        )
+        self.assertEqual(
+            self.cache.lookup_not_modified(self.url),
+            {"text": "some text", "machine_readable": True, "truncated": False, "extraction_error": None, "filename": "sow.pdf"},
+        )
+
+    def test_evict(self):
+        for i in range(5):
+            url = f"{self.url}/{i}"
+            self.cache.lookup_content(url, f"hash{i}")
+            self.cache.store(url, "x" * 100, True)
+
+        self.cache.max_bytes = 250
+        self.assertEqual(self.cache.evict(), 3)
+        # least recently used entries go first
+        self.assertIsNone(self.cache.lookup_content("new", "hash0"))
+        self.assertIsNotNone(self.cache.lookup_content("new", "hash4"))
+
+        self.cache.max_age_days = 1
+        with patch("fbo_scraper.attachment_cache.time.time", return_value=time.time() + 2 * 24 * 60 * 60):
+            self.assertEqual(self.cache.evict(), 2)
+
+    def test_budget(self):
+        path = os.path.join(self.out_path, "cache", "attachments.sqlite")
+        self.cache.lookup_content(self.url, "hash1")
+        self.cache.store(self.url, "cut short", True, truncated=True)
+        self.cache.lookup_content(f"{self.url}/2", "hash2")
+        self.cache.store(f"{self.url}/2", "complete", True)
+        self.cache._conn.close()
+
+        # text cut short is only served under the same budget
+        self.cache = AttachmentCache(path, budget=ExtractionBudget(max_pages=10))
+        self.assertIsNone(self.cache.lookup_content("other", "hash1"))
+        self.cache.store("other", "cut short", True, truncated=True)
+        self.assertEqual(
+            self.cache.lookup_content("other", "hash1"),
+            {"text": "cut short", "machine_readable": True, "truncated": True, "extraction_error": None},
+        )
+        # complete text extracted without a budget might not fit in one
+        self.assertIsNone(self.cache.lookup_content("other", "hash2"))
+        self.cache.store("other", "complete", True)
+        self.cache._conn.close()
+
+        # but complete text extracted within a budget fits in a larger one
+        self.cache = AttachmentCache(path, budget=ExtractionBudget(max_pages=20))
+        self.assertIsNone(self.cache.lookup_content("other", "hash1"))
+        self.assertEqual(self.cache.lookup_content("other", "hash2")["text"], "complete")
+        self.cache._conn.close()
+        self.cache = AttachmentCache(path)
+        self.assertEqual(self.cache.lookup_content("other", "hash2")["text"], "complete")
+
+    def test_file_content_hash(self):
+        file_name = os.path.join(self.out_path, "test.txt")
+        with open(file_name, "w") as f:
+            f.write("This is a test")
+        self.assertEqual(
+            file_content_hash(file_name),
+            "c7be1ed902fb8dd4d48997c6452f5d7e509fbcdbe2808b16bcf4edce4c07d14e",
+        )
+
+    @patch("fbo_scraper.get_opps.make_attachment_request")
+    def test_get_docs_cache_hit(self, m_make_attachment_request):
+        response = MagicMock(status=200, headers={"Content-Disposition": "attachment; filename=test.pdf", "ETag": '"v1"'})
+        m_make_attachment_request.return_value = response
+        self.cache.lookup_content(self.url, "hash1", etag='"v1"')
+        self.cache.store(self.url, "cached text", True)
+
+        result = get_docs(dict(resourceLinks=[self.url]), self.out_path, cache=self.cache)
+
+        response.release_conn.assert_called_once()
+        self.assertEqual(result[0]["text"], "cached text")
+        self.assertEqual(result[0]["filename"], "test.pdf")
+        self.assertFalse(os.path.exists(os.path.join(self.out_path, "test.pdf")))
+
+    @patch("fbo_scraper.get_opps.make_attachment_request")
+    def test_get_docs_cache_hit_skipped(self, m_make_attachment_request):
+        m_make_attachment_request.return_value = MagicMock(
+            status=200, headers={"Content-Disposition": "attachment; filename=scan.pdf", "ETag": '"v1"'}
+        )
+        self.cache.lookup_content(self.url, "hash1", etag='"v1"')
+        reason = "scanned document: the first 3 page(s) are images without any text"
+        self.cache.store(self.url, "", False, extraction_error=reason)
+
+        result = get_docs(dict(resourceLinks=[self.url]), self.out_path, cache=self.cache)
+
+        # the reason the scan wasn't extracted comes along with it
+        self.assertFalse(result[0]["machine_readable"])
+        self.assertEqual(result[0]["extraction_error"], reason)
+
+    @patch("fbo_scraper.get_opps.make_attachment_request")
+    def test_get_docs_not_modified(self, m_make_attachment_request):
+        response = MagicMock(status=304, headers={})
+        m_make_attachment_request.return_value = response
+        self.cache.lookup_content(self.url, "hash1", etag='"v1"', filename="sow.pdf")
+        self.cache.store(self.url, "cached text", True)
+
+        result = get_docs(dict(resourceLinks=[self.url]), self.out_path, cache=self.cache)
+
+        self.assertEqual(m_make_attachment_request.call_args.kwargs["headers"], {"If-None-Match": '"v1"'})
+        self.assertEqual(result[0]["text"], "cached text")
+        self.assertEqual(result[0]["filename"], "sow.pdf")
+        self.assertEqual(self.cache.stats["not modified"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
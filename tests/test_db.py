@@ -257,7 +257,7 @@ class DBTestCase(unittest.TestCase):
         with self.dal.Session.begin() as session:
             notices = fetch_solicitations_by_solnbr('test', session)
         result = len(notices)
-        expected = 28 # Amount of keys in dict
+        expected = 31 # Amount of keys in dict
         self.assertEqual(result, expected)
 
     def test_fetch_solicitations_by_solnbr_bogus_solnbr(self):
@@ -7,11 +7,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from tests.mock_opps import mock_schematized_opp_two
 from fbo_scraper.db.db import Notice, NoticeType, Solicitation, Attachment, Model, now_minus_two
 from fbo_scraper.db.db_utils import insert_data_into_solicitations_table, \
-    DataAccessLayer, insert_notice_types, update_solicitation_history, search_for_agency, handle_attachments, apply_predictions_to,create_new_or_exisiting_sol, insert_data_into
+    DataAccessLayer, insert_notice_types, update_solicitation_history, search_for_agency, handle_attachments, apply_predictions_to,create_new_or_exisiting_sol, insert_data_into, \
+    upsert_solicitations_statement, AgencyResolver, SessionCache, fetch_notice_type_id, fetch_notice_type_by_id, \
+    fetch_solicitations_by_solnbr
 
 from fbo_scraper.db.connection import get_db_url
+from fbo_scraper.sam_utils import select_recheck_candidates
 
 
+from copy import deepcopy
 from datetime import datetime, timedelta
 from addict import Addict
 
@@ -21,6 +25,10 @@ from unittest.mock import Mock
 from sqlalchemy.orm.session import close_all_sessions
 from fbo_scraper.db.db_utils import clear_data
 
+# handle_attachments pops the attachments of the opportunities it's given, so the tests
+# copy this one instead of using the shared mock_schematized_opp_two
+pristine_opp = deepcopy(mock_schematized_opp_two)
+
 @pytest.mark.usefixtures("db_class")
 class DBTestCase(unittest.TestCase):
 
@@ -43,9 +51,61 @@ class DBTestCase(unittest.TestCase):
     def test_insert_data_into_solicitations_table(self):
         with self.dal.Session.begin() as session:
             try:
-                insert_data_into_solicitations_table(session, [mock_schematized_opp_two])
+                insert_data_into_solicitations_table(session, [deepcopy(mock_schematized_opp_two)])
             except Exception as e:
                 print (e)
+
+    def test_select_recheck_candidates(self):
+        now = datetime.utcnow()
+
+        def sol(sol_num, **kwargs):
+            return Solicitation(solNum=sol_num, active=True, noticeType="Solicitation", date=now - timedelta(30), **kwargs)
+
+        with self.dal.Session.begin() as session:
+            session.add_all([
+                sol("JUST_CHECKED", last_checked_at=now - timedelta(1)),
+                sol("NEVER_CHECKED"),
+                sol("CLOSING_SOON", last_checked_at=now - timedelta(7),
+                    noticeData={"responseDeadLine": (now + timedelta(2)).isoformat() + "Z"}),
+                sol("QUIET", last_checked_at=now - timedelta(7), recheck_count=10, recheck_changes=0,
+                    noticeData={"responseDeadLine": "soon"}),
+            ])
+
+        # ranked by recheck_priority in the database
+        with self.dal.Session.begin() as session:
+            self.assertEqual(
+                [row.solNum for row in select_recheck_candidates(session, max_tests=2)],
+                ["NEVER_CHECKED", "CLOSING_SOON"],
+            )
+            self.assertEqual(
+                [row.solNum for row in select_recheck_candidates(session)],
+                ["NEVER_CHECKED", "CLOSING_SOON", "QUIET", "JUST_CHECKED"],
+            )
+
+    def test_insert_data_into_solicitations_table_bulk(self):
+        opp = deepcopy(pristine_opp)
+        opp['attachments'].append(dict(opp['attachments'][0], filename="second.pdf"))
+        with self.dal.Session.begin() as session:
+            insert_data_into_solicitations_table(session, [deepcopy(opp)])
+
+        # the second run updates the solicitation and drops the attachment that is no longer listed
+        opp['attachments'] = opp['attachments'][:1]
+        with self.dal.Session.begin() as session:
+            sols = insert_data_into_solicitations_table(session, [deepcopy(opp), deepcopy(pristine_opp) | {"solnbr": "ATC5678"}], bulk=True)
+        assert [s.solNum for s in sols] == ["ATC1234", "ATC5678"]
+
+        with self.dal.Session.begin() as session:
+            sol = session.query(Solicitation).filter(Solicitation.solNum == "ATC1234").one()
+            assert len(sol.action) == 1
+            assert sol.updatedAt is not None
+            assert len(sol.predictions['history']) == 2
+            assert [a.filename for a in sol.attachments] == ["JA Redacted.pdf"]
+
+            new_sol = session.query(Solicitation).filter(Solicitation.solNum == "ATC5678").one()
+            assert new_sol.history == []
+            assert new_sol.action[0]["action"] == "Solicitation Posted"
+            assert new_sol.reviewRec == 'Cannot Evaluate (Review Required)'
+            assert [a.filename for a in new_sol.attachments] == ["JA Redacted.pdf"]
         
 
 def test_update_solicitation_history():
@@ -129,6 +189,136 @@ def test_search_for_agency():
     assert sol.agency == None
 
 
+def test_upsert_solicitations_statement():
+    from sqlalchemy.dialects import postgresql
+    sql = str(upsert_solicitations_statement().compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT ("solNum") DO UPDATE SET' in sql
+    assert '"createdAt"' not in sql.split("DO UPDATE")[1]
+    assert sql.endswith('RETURNING solicitations.id, solicitations."solNum"')
+
+
+def test_bulk_insert_data_into_solicitations_table():
+    existing_sol = Solicitation(
+        id=7,
+        solNum="ATC1234",
+        active=True,
+        na_flag=False,
+        history=[],
+        action=[{"action": "Solicitation Posted"}],
+        predictions={"value": "red", "508": "red", "estar": "red", "history": []},
+    )
+    kept = Attachment(id=70, solicitation_id=7, filename="JA Redacted.pdf", machine_readable=False)
+    removed = Attachment(id=71, solicitation_id=7, filename="old.pdf", machine_readable=True)
+    existing = {"ATC1234": (existing_sol, {"JA Redacted.pdf": kept, "old.pdf": removed})}
+
+    session = Mock()
+    session.execute.side_effect = [[(7, "ATC1234"), (8, "ATC5678")], None, None, None]
+    data = [deepcopy(pristine_opp), deepcopy(pristine_opp) | {"solnbr": "ATC5678"}]
+
+    resolver = AgencyResolver()
+    resolver.aliases = {"DEPT OF DEFENSE": (1, "Department of Defense")}
+
+    with mock.patch("fbo_scraper.db.db_utils.insert_notice_types"), \
+         mock.patch("fbo_scraper.db.db_utils.fetch_notice_type_ids", return_value={"Special Notice": 3}), \
+         mock.patch("fbo_scraper.db.db_utils.preload_solicitations", return_value=existing):
+        sols = insert_data_into_solicitations_table(session, data, bulk=True, agency_resolver=resolver)
+
+    assert [s.id for s in sols] == [7, 8]
+    assert all(s.agency == "Department of Defense" and s.notice_type_id == 3 for s in sols)
+
+    upsert_rows = session.execute.call_args_list[0].args[1]
+    assert upsert_rows[0]["action"] == [{"action": "Solicitation Posted"}]
+    assert upsert_rows[0]["updatedAt"] is not None
+    assert upsert_rows[1]["history"] == []
+    assert upsert_rows[1]["compliant"] == 0
+    assert upsert_rows[1]["action"][0]["action"] == "Solicitation Posted"
+    assert upsert_rows[1]["updatedAt"] is None
+
+    # the existing attachment is kept, its sibling is deleted and the new solicitation's is inserted
+    attachment_rows = session.execute.call_args_list[1].args[1]
+    assert [(a["solicitation_id"], a["filename"]) for a in attachment_rows] == [(8, "JA Redacted.pdf")]
+    assert sols[0].parseStatus[0]["id"] == 70
+    assert session.execute.call_args_list[2].args[0].compile().params["id_1"] == [70]
+    assert session.execute.call_args_list[3].args[0].compile().params["id_1"] == [71]
+
+
+def test_agency_resolver():
+    session = Mock()
+    session.query.return_value.outerjoin.return_value.order_by.return_value = [
+        ("ABC", 1, "ABC Agency"),
+        ("ABC", 2, "Duplicate Alias"),
+        ("DEF", None, None),
+    ]
+    resolver = AgencyResolver(session)
+    assert session.query.call_count == 1
+
+    sol = Solicitation(solNum="123", agency="ABC")
+    search_for_agency("ABC", sol, session, resolver=resolver)
+    assert sol.agency_id == 1
+    assert sol.agency == "ABC Agency"
+
+    # an alias without an agency keeps the agency name from the notice
+    sol = Solicitation(solNum="456", agency="DEF")
+    search_for_agency("DEF", sol, session, resolver=resolver)
+    assert sol.agency_id is None
+    assert sol.agency == "DEF"
+
+    for solNum in ("789", "790"):
+        sol = Solicitation(solNum=solNum, agency="XYZ")
+        search_for_agency("XYZ", sol, session, resolver=resolver)
+        assert sol.agency_id is None
+        assert sol.agency == "XYZ"
+    # no more queries than the one that loaded the aliases
+    assert session.query.call_count == 1
+
+    assert resolver.unmapped == {"XYZ": 2}
+    with mock.patch("fbo_scraper.db.db_utils.logger") as m_logger:
+        resolver.log_unmapped()
+    m_logger.warning.assert_called_once()
+    assert m_logger.warning.call_args.kwargs["extra"] == {"unmapped agencies": {"XYZ": 2}}
+    assert not resolver.unmapped
+
+
+def test_session_cache():
+    session = Mock()
+    session.info = {}
+    session.query.return_value = [NoticeType(id=1, notice_type="Solicitation")]
+
+    # the notice_type table is loaded once per session
+    assert fetch_notice_type_id("Solicitation", session) == 1
+    assert fetch_notice_type_id("RFQ", session) is None
+    assert fetch_notice_type_by_id(1, session).notice_type == "Solicitation"
+    assert session.query.call_count == 1
+
+    # and reloaded after a notice type is inserted
+    insert_notice_types(session, ["RFQ"])
+    session.add.assert_called_once()
+    session.query.return_value = [NoticeType(id=1, notice_type="Solicitation"), NoticeType(id=2, notice_type="RFQ")]
+    assert fetch_notice_type_id("RFQ", session) == 2
+    assert session.query.call_count == 2
+
+    # solicitations that weren't found aren't cached
+    sol = Solicitation(id=3, solNum="ABC")
+    session.query.return_value = Mock()
+    session.query.return_value.filter.return_value.first.side_effect = [None, sol]
+    assert fetch_solicitations_by_solnbr("ABC", session, as_dict=False) is None
+    assert fetch_solicitations_by_solnbr("ABC", session, as_dict=False) is sol
+    assert fetch_solicitations_by_solnbr("ABC", session, as_dict=False) is sol
+    assert session.query.return_value.filter.return_value.first.call_count == 2
+
+    # another session gets its own cache
+    other = Mock()
+    other.info = {}
+    other.query.return_value.filter.return_value.first.return_value = None
+    assert fetch_solicitations_by_solnbr("ABC", other, as_dict=False) is None
+
+    cache = SessionCache(maxsize=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+    assert cache.get("a") is None
+    assert cache.get("c") == "C"
+
+
 def test_handle_attachments():
     # Create a mock Solicitation object
     class MockSolicitation:
@@ -3,15 +3,41 @@ import shutil
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
 import unittest
 from unittest.mock import patch
-from zipfile import ZipFile, BadZipfile
+from zipfile import ZipFile, BadZipfile, ZIP_DEFLATED
 
 from fpdf import FPDF
 from docx import Document
+from docx.oxml import parse_xml
+from PIL import Image
 import textract
 
-from fbo_scraper.get_doc_text import get_doc_text
+from fbo_scraper.get_doc_text import (
+    ExtractionBudget,
+    get_doc_text,
+    sniff_file_type,
+    extract_text,
+    get_doc_text_supervised,
+    get_archive_text,
+    is_archive,
+    iter_archive_members,
+    SCANNED_CHECK_PAGES,
+)
+
+
+def sleep_forever(file_name, rm=False, budget=None):
+    time.sleep(60)
+
+
+def allocate_gigabyte(file_name, rm=False, budget=None):
+    return bytearray(1024**3)
+
+
+def spin(file_name, rm=False, budget=None):
+    while True:
+        pass
 
 
 class GetDocTextTestCase(unittest.TestCase):
@@ -191,5 +217,205 @@ class GetDocTextTestCase(unittest.TestCase):
         self.assertEqual(text, '')
         self.assertTrue(mock_process.called)
 
+    def test_sniff_file_type(self):
+        self.assertEqual(sniff_file_type(b"%PDF-1.7\n"), "pdf")
+        self.assertEqual(sniff_file_type(b"PK\x03\x04\x14\x00"), "zip")
+        self.assertEqual(sniff_file_type(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"), "ole")
+        self.assertEqual(sniff_file_type(b"{\\rtf1\\ansi"), "rtf")
+        self.assertEqual(sniff_file_type(b"\x00\x00\x00\x20ftypisom"), "video")
+        self.assertEqual(sniff_file_type(b"AC1032\x00\x00"), "cad")
+        self.assertEqual(sniff_file_type(b"<!DOCTYPE html>\n<html>"), "html")
+        # a multi-byte character cut off at the end of the sniffed bytes
+        self.assertEqual(sniff_file_type("Statement of Work \u2013".encode("utf-8")[:-1]), "text")
+        self.assertEqual(sniff_file_type(b"\x01\x02\x00\x03"), "unknown")
+
+    def test_extract_text(self):
+        html = os.path.join(self.abs_out_path, "notice.doc")
+        with open(html, "w") as f:
+            f.write("<html><head><style>p {}</style></head><body><p>This is a test</p></body></html>")
+        xlsx = os.path.join(self.abs_out_path, "prices.docx")
+        with ZipFile(xlsx, "w") as z:
+            z.writestr("xl/workbook.xml", "<workbook/>")
+
+        # the extractor is picked by content, not extension
+        self.assertEqual(extract_text(html).strip(), "This is a test")
+        self.assertEqual(extract_text(self.temp_outfile_path_fake_docx).strip(), "This is a test")
+        self.assertEqual(extract_text(self.temp_outfile_path_docx).strip(), "This is a test")
+        self.assertEqual(extract_text(self.temp_outfile_path), "This is a test")
+        # zips that aren't docx, and types without an extractor, are left to textract
+        self.assertIsNone(extract_text(xlsx))
+        self.assertIsNone(extract_text(self.temp_outfile_path_fake_doc))
+
+    def test_extract_text_docx_text_box(self):
+        # Word writes a text box twice, the second time for readers without text box support
+        text_box = (
+            '<w:txbxContent><w:p><w:r><w:t>Boxed</w:t></w:r></w:p></w:txbxContent>'
+        )
+        document = Document()
+        outer = document.add_paragraph("Outer")
+        outer._p.append(parse_xml(
+            '<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+            'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006" '
+            'xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape" '
+            'xmlns:v="urn:schemas-microsoft-com:vml"><mc:AlternateContent>'
+            f'<mc:Choice Requires="wps"><w:drawing><wps:txbx>{text_box}</wps:txbx></w:drawing></mc:Choice>'
+            f'<mc:Fallback><w:pict><v:textbox>{text_box}</v:textbox></w:pict></mc:Fallback>'
+            '</mc:AlternateContent></w:r>'
+        ))
+        document.add_paragraph("After")
+        path = os.path.join(self.abs_out_path, "text_box.docx")
+        document.save(path)
+
+        self.assertEqual(extract_text(path), "Outer\n\nBoxed\n\nAfter")
+
+    @patch('textract.process')
+    def test_get_doc_text_textract_fallback(self, mock_process):
+        mock_process.return_value = b"This is a test"
+
+        self.assertEqual(get_doc_text(self.temp_outfile_path_fake_doc, rm=False), "This is a test")
+        # an rtf saved as a doc goes straight to textract's rtf parser
+        mock_process.assert_called_once_with(
+            self.temp_outfile_path_fake_doc, encoding="utf-8", errors="ignore", extension="rtf"
+        )
+
+        # a pdf the in-process extractor can't read is retried with textract
+        broken_pdf = os.path.join(self.abs_out_path, "broken.pdf")
+        with open(broken_pdf, "wb") as f:
+            f.write(b"%PDF-1.4\nnot really a pdf")
+        self.assertEqual(get_doc_text(broken_pdf), "This is a test")
+        self.assertFalse(os.path.exists(broken_pdf))
+
+    def test_extraction_budget(self):
+        pdf = FPDF()
+        for page in range(5):
+            pdf.add_page()
+            pdf.set_font("arial", "B", 13.0)
+            pdf.cell(ln=0, h=5.0, align="L", w=0, txt=f"Page {page}", border=0)
+        pdf.output(self.temp_outfile_path_pdf, "F")
+
+        budget = ExtractionBudget(max_pages=2)
+        text = get_doc_text(self.temp_outfile_path_pdf, rm=False, budget=budget)
+        self.assertIn("Page 1", text)
+        self.assertNotIn("Page 2", text)
+        self.assertTrue(budget.truncated)
+
+        budget = ExtractionBudget(max_pages=5)
+        get_doc_text(self.temp_outfile_path_pdf, rm=False, budget=budget)
+        self.assertFalse(budget.truncated)
+
+        budget = ExtractionBudget(max_chars=7)
+        self.assertEqual(get_doc_text(self.temp_outfile_path_docx, rm=False, budget=budget), "This is")
+        self.assertTrue(budget.truncated)
+
+        budget = ExtractionBudget(max_bytes=4)
+        self.assertEqual(get_doc_text(self.temp_outfile_path_txt, rm=False, budget=budget), "This")
+        self.assertTrue(budget.truncated)
+
+        # the flag makes it back from a supervised worker
+        budget = ExtractionBudget(max_chars=4)
+        self.assertEqual(
+            get_doc_text_supervised(self.temp_outfile_path_txt, timeout=30, budget=budget), ("This", None)
+        )
+        self.assertTrue(budget.truncated)
+
+    def test_get_doc_text_scanned_pdf(self):
+        image_path = os.path.join(self.abs_out_path, "scan.png")
+        Image.new("L", (200, 260), 255).save(image_path)
+        scanned_path = os.path.join(self.abs_out_path, "scanned.pdf")
+        pdf = FPDF()
+        for _ in range(SCANNED_CHECK_PAGES + 2):
+            pdf.add_page()
+            pdf.image(image_path, x=0, y=0, w=210)
+        pdf.output(scanned_path, "F")
+
+        budget = ExtractionBudget()
+        with patch("fbo_scraper.get_doc_text.PDFPageInterpreter") as mock_interpreter:
+            self.assertEqual(get_doc_text(scanned_path, rm=False, budget=budget), "")
+        # none of the pages were interpreted, and it wasn't given to textract either
+        mock_interpreter.assert_not_called()
+        self.assertIn("scanned document", budget.skip_reason)
+
+        # a scan with some text on its first pages is extracted
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.image(image_path, x=0, y=0, w=210)
+        pdf.add_page()
+        pdf.set_font("arial", "B", 13.0)
+        pdf.cell(ln=0, h=5.0, align="L", w=0, txt="Signed copy", border=0)
+        pdf.output(scanned_path, "F")
+        budget = ExtractionBudget()
+        self.assertEqual(get_doc_text(scanned_path, rm=False, budget=budget), "Signed copy")
+        self.assertIsNone(budget.skip_reason)
+
+        # and so is a PDF with text and no images at all
+        budget = ExtractionBudget()
+        self.assertEqual(get_doc_text(self.temp_outfile_path_pdf, rm=False, budget=budget), "This is a test")
+        self.assertIsNone(budget.skip_reason)
+
+    def test_get_doc_text_supervised(self):
+        self.assertEqual(get_doc_text_supervised(self.temp_outfile_path_txt, timeout=30), ("This is a test", None))
+        self.assertFalse(os.path.exists(self.temp_outfile_path_txt))
+
+        # the worker is started from a fork server, so it runs these instead of a patched get_doc_text
+        with self.subTest("timeout"):
+            started = time.monotonic()
+            text, error = get_doc_text_supervised(self.temp_outfile_path_pdf, timeout=0.5, extract=sleep_forever)
+            self.assertLess(time.monotonic() - started, 10)
+            self.assertEqual((text, error), ("", "extraction timed out after 0.5 seconds"))
+            self.assertFalse(os.path.exists(self.temp_outfile_path_pdf))
+
+        with self.subTest("memory"):
+            text, error = get_doc_text_supervised(
+                self.temp_outfile_path_docx, timeout=30, max_memory_mb=100, extract=allocate_gigabyte
+            )
+            self.assertEqual((text, error), ("", "memory limit of 100 MB exceeded"))
+
+        with self.subTest("cpu"):
+            text, error = get_doc_text_supervised(self.temp_outfile_path, timeout=30, max_cpu_seconds=1, extract=spin)
+            self.assertEqual((text, error), ("", "CPU time limit of 1 seconds exceeded"))
+
+    def test_get_archive_text(self):
+        archive = os.path.join(self.abs_out_path, "solicitation.zip")
+        with open(self.temp_outfile_path_pdf, "rb") as f:
+            pdf = f.read()
+        with ZipFile(archive, "w", compression=ZIP_DEFLATED) as z:
+            z.writestr("docs/", "")
+            z.writestr("docs/SOW.pdf", pdf)
+            z.writestr("notes.txt", "This is a test")
+            z.writestr("walkthrough.mp4", b"\x00\x00\x00\x20ftypisom" + b"\x01" * 100)
+            z.writestr("bomb.txt", b"\x00" * 10 * 1024 * 1024)
+
+        self.assertTrue(is_archive(archive))
+        self.assertFalse(is_archive(self.temp_outfile_path_docx))
+        self.assertFalse(is_archive(self.temp_outfile_path_pdf))
+
+        members = get_archive_text(archive)
+        self.assertEqual(
+            members,
+            [
+                ("docs/SOW.pdf", "This is a test", None, False),
+                ("notes.txt", "This is a test", None, False),
+                ("walkthrough.mp4", "", "unsupported type video", False),
+                ("bomb.txt", "", "compression ratio above 100", False),
+            ],
+        )
+        self.assertFalse(os.path.exists(archive))
+
+    def test_iter_archive_members_limits(self):
+        archive = os.path.join(self.abs_out_path, "solicitation.zip")
+        with ZipFile(archive, "w") as z:
+            for i in range(4):
+                z.writestr(f"{i}.txt", "x" * 100)
+
+        self.assertEqual(
+            [(name, skip_reason) for name, data, skip_reason in iter_archive_members(archive, max_total_bytes=250)],
+            [("0.txt", None), ("1.txt", None), ("2.txt", "archive larger than 250 bytes")],
+        )
+        self.assertEqual(
+            [name for name, data, skip_reason in iter_archive_members(archive, max_members=2)],
+            ["0.txt", "1.txt"],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
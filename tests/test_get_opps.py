@@ -3,18 +3,19 @@ import shutil
 import sys
 import unittest
 
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
 from addict import Addict
 import tempfile
+from io import BytesIO
 import requests
-
-import requests_mock
+from urllib3.response import HTTPResponse
 
 sys.path.append( os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) ) )
 from tests import mock_opps
 from tests.test_utils import get_zip_in_memory
-from fbo_scraper.get_opps import get_opps_for_day, get_docs, get_attachment_data, \
-                           transform_opps, schematize_opp
+from fbo_scraper.get_opps import get_opps_for_day, get_docs, get_attachment_data, extract_attachment, \
+                           add_attachment_data, make_attachment_data, store_attachment_data, transform_opps, schematize_opp, iter_opps_pages, iter_transformed_opps, \
+                           get_opps_for_range, date_windows
 from tests.mock_opps import mock_opp_one
 
 TEST_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -44,7 +45,7 @@ class GetOppsTestCase(unittest.TestCase):
         self.mock_schematized_opp_one
 
     @patch('fbo_scraper.get_opps.get_opportunities_search_url', return_value = 'https://api.sam.gov/prod/opportunity/v1/api/search')
-    @patch('fbo_scraper.get_opps.requests_retry_session')
+    @patch('fbo_scraper.get_opps.get_http_session')
     def test_get_opps_for_day(self, mock_session, mock_search_url):
         mock_search_url.return_value = 'https://api.sam.gov/prod/opportunity/v1/api/search' 
         
@@ -79,7 +80,159 @@ class GetOppsTestCase(unittest.TestCase):
         self.assertEqual(opps[0]['solicitationNumber'], 'ABC123')
 
     @patch('fbo_scraper.get_opps.get_opportunities_search_url', return_value = 'https://api.sam.gov/prod/opportunity/v1/api/search')
-    @patch('fbo_scraper.get_opps.requests_retry_session')
+    @patch('fbo_scraper.get_opps.get_http_session')
+    def test_get_opps_for_day_concurrent_pages(self, mock_session, mock_search_url):
+        # 5 pages of 2 records each, served by offset
+        def mock_get(uri, timeout=None):
+            offset = int(uri.split('offset=')[1])
+            mock_response = MagicMock()
+            mock_response.status_code = 200
+            mock_response.json.return_value = {
+                'totalRecords': 10,
+                'opportunitiesData': [
+                    {
+                        'postedDate': '2022-01-01',
+                        'solicitationNumber': f'SOL{i}',
+                        'title': f'Test Opportunity {i}',
+                        'active': 'Yes'
+                    }
+                    for i in range(offset, offset + 2)
+                ]
+            }
+            return mock_response
+        mock_session.return_value.get.side_effect = mock_get
+
+        opps = get_opps_for_day(max_workers=3)
+        self.assertEqual([o['solicitationNumber'] for o in opps], [f'SOL{i}' for i in range(10)])
+
+        # the filter is applied to every page and the limit to the filtered results
+        opps = get_opps_for_day(
+            max_workers=3,
+            limit=3,
+            opportunity_filter_function=lambda o: int(o['solicitationNumber'][3:]) % 2 == 0,
+        )
+        self.assertEqual([o['solicitationNumber'] for o in opps], ['SOL0', 'SOL2', 'SOL4'])
+
+    @patch('fbo_scraper.get_opps.get_opportunities_search_url', return_value = 'https://api.sam.gov/prod/opportunity/v1/api/search')
+    @patch('fbo_scraper.get_opps.get_http_session')
+    def test_iter_opps_pages(self, mock_session, mock_search_url):
+        requested = []
+        def mock_get(uri, timeout=None):
+            offset = int(uri.split('offset=')[1])
+            requested.append(offset)
+            mock_response = MagicMock()
+            mock_response.status_code = 200
+            mock_response.json.return_value = {
+                'totalRecords': 20,
+                'opportunitiesData': [
+                    {
+                        'postedDate': '2022-01-01',
+                        'solicitationNumber': f'SOL{i}',
+                        'title': f'Test Opportunity {i}',
+                        'active': 'Yes'
+                    }
+                    for i in range(offset, offset + 2)
+                ]
+            }
+            return mock_response
+        mock_session.return_value.get.side_effect = mock_get
+
+        # pages are only requested a little ahead of the one being read
+        pages = iter_opps_pages(max_workers=2)
+        self.assertEqual([o['solicitationNumber'] for o in next(pages)], ['SOL0', 'SOL1'])
+        self.assertEqual([o['solicitationNumber'] for o in next(pages)], ['SOL2', 'SOL3'])
+        pages.close()
+        self.assertLessEqual(len(requested), 4)
+        # the session is shared with the rest of the run, so it stays open
+        mock_session.return_value.close.assert_not_called()
+
+    def test_date_windows(self):
+        import datetime
+
+        def day(d):
+            return datetime.date(2023, 1, d)
+
+        self.assertEqual(
+            date_windows('01/01/2023', '01/05/2023', window_days=2),
+            [(day(1), day(2)), (day(3), day(4)), (day(5), day(5))],
+        )
+
+    @patch('fbo_scraper.get_opps.get_http_session')
+    def test_get_opps_for_range(self, mock_session):
+        import datetime
+        from urllib.parse import urlparse, parse_qs
+        # 3 records a day, plus 5 on the 4th, and SOL-2-0 is posted again on the 3rd
+        records = {
+            day: [f'SOL-{day}-{i}' for i in range(5 if day == 4 else 3)]
+            for day in range(1, 5)
+        }
+        records[3].append('SOL-2-0')
+        searches = []
+
+        def mock_get(uri, timeout=None):
+            query = parse_qs(urlparse(uri).query)
+            first = datetime.datetime.strptime(query['postedFrom'][0], '%m/%d/%Y').day
+            last = datetime.datetime.strptime(query['postedTo'][0], '%m/%d/%Y').day
+            offset = int(query['offset'][0])
+            if offset == 0:
+                searches.append((first, last))
+            sol_nums = [s for day in range(first, last + 1) for s in records[day]]
+            mock_response = MagicMock()
+            mock_response.status_code = 200
+            mock_response.json.return_value = {
+                'totalRecords': len(sol_nums),
+                'opportunitiesData': [
+                    {'postedDate': '2023-01-01', 'solicitationNumber': s, 'title': s, 'active': 'Yes'}
+                    for s in sol_nums[offset:offset + 2]
+                ],
+            }
+            return mock_response
+        mock_session.return_value.get.side_effect = mock_get
+
+        opps = get_opps_for_range(
+            from_date='01/01/2023', to_date='01/04/2023', window_days=4, max_depth=4, max_workers=2
+        )
+        # the 4 day window is split in half and then into single days, the 4th is cut off at the maximum depth
+        self.assertEqual(searches, [(1, 4), (1, 2), (1, 1), (2, 2), (3, 4), (3, 3), (4, 4)])
+        self.assertEqual(
+            [o['solicitationNumber'] for o in opps],
+            records[1] + records[2] + records[3][:3] + records[4][:4],
+        )
+
+        searches.clear()
+        opps = get_opps_for_range(
+            from_date='01/01/2023', to_date='01/03/2023', window_days=1, max_depth=4, max_workers=3
+        )
+        self.assertEqual(sorted(searches), [(1, 1), (2, 2), (3, 3)])
+        self.assertEqual([o['solicitationNumber'] for o in opps], records[1] + records[2] + records[3][:3])
+
+    @patch('fbo_scraper.get_opps.transform_opps')
+    @patch('fbo_scraper.get_opps.iter_opps_pages')
+    def test_iter_transformed_opps(self, m_iter_opps_pages, m_transform_opps):
+        m_iter_opps_pages.return_value = iter([
+            [{'solicitationNumber': 'SOL0'}, {'solicitationNumber': 'SOL1'}],
+            [{'solicitationNumber': 'SOL1'}, {'solicitationNumber': 'SOL2'}],
+            [{'solicitationNumber': 'SOL3'}],
+        ])
+        m_transform_opps.side_effect = lambda opps, out_path, **kwargs: [o['solicitationNumber'] for o in opps]
+
+        chunks = list(iter_transformed_opps(chunk_size=2, skip_attachments=True))
+        # solicitation numbers from earlier chunks are dropped
+        self.assertEqual(chunks, [['SOL0', 'SOL1'], ['SOL2', 'SOL3']])
+
+        # the limit is for the whole range, and no more pages are fetched once it's reached
+        pages = iter([
+            [{'solicitationNumber': 'SOL0'}, {'solicitationNumber': 'SOL1'}],
+            [{'solicitationNumber': 'SOL2'}, {'solicitationNumber': 'SOL3'}],
+            [{'solicitationNumber': 'SOL4'}],
+        ])
+        m_iter_opps_pages.return_value = pages
+        chunks = list(iter_transformed_opps(chunk_size=2, limit=3, skip_attachments=True))
+        self.assertEqual(chunks, [['SOL0', 'SOL1'], ['SOL2']])
+        self.assertEqual(next(pages), [{'solicitationNumber': 'SOL4'}])
+
+    @patch('fbo_scraper.get_opps.get_opportunities_search_url', return_value = 'https://api.sam.gov/prod/opportunity/v1/api/search')
+    @patch('fbo_scraper.get_opps.get_http_session')
     def test_get_opps_for_day_error(self, mock_session, mock_search_url):
         from fbo_scraper.get_opps import SamApiError
         mock_search_url.return_value = 'https://api.sam.gov/prod/opportunity/v1/api/search' 
@@ -103,24 +256,48 @@ class GetOppsTestCase(unittest.TestCase):
         # Check the results
         self.assertTrue('Sam.gov API returned error message' in str(context.exception))
 
-    @patch('fbo_scraper.get_opps.make_attachment_request', return_value = MagicMock(headers={'Content-Disposition': 'attachment; filename=test.pdf'}))
-    @patch('fbo_scraper.get_opps.shutil.copyfileobj')
-    @requests_mock.Mocker()
-    def test_get_docs(self, m_make_attachment_request, m_copy_file, mock_request):
+    def attachment_response(self, body, status=200, headers=None):
+        return HTTPResponse(
+            body=BytesIO(body),
+            headers={'Content-Disposition': 'attachment; filename=test.pdf', **(headers or {})},
+            status=status,
+            preload_content=False,
+        )
+
+    @patch('fbo_scraper.get_opps.make_attachment_request')
+    def test_get_docs(self, m_make_attachment_request):
         opp_id = 'test'
         url = f'https://api.sam.gov/prod/opportunity/v1/api/{opp_id}/resources/download/zip'
-        
         opp = dict(resourceLinks=[url])
+        m_make_attachment_request.return_value = self.attachment_response(b'%PDF-1.4 ' + b'x' * 200000)
 
-        mock_request.register_uri('GET',
-                                  url = url,
-                                  status_code = 200)
-        
-        result = get_docs(opp, self.out_path)
-        m_copy_file.assert_called_once()
+        with self.assertLogs('fbo_scraper.get_opps', level='INFO') as logs:
+            result = get_docs(opp, self.out_path)
 
         expected = [(os.path.join(self.out_path, 'test.pdf'), url)]
         self.assertEqual(result, expected)
+        self.assertEqual(os.path.getsize(expected[0][0]), 200009)
+        record = next(r for r in logs.records if hasattr(r, 'attachment download'))
+        self.assertEqual(getattr(record, 'attachment download')['bytes'], 200009)
+        self.assertEqual(getattr(record, 'attachment download')['type'], 'pdf')
+
+    @patch('fbo_scraper.get_opps.make_attachment_request')
+    def test_get_docs_skipped(self, m_make_attachment_request):
+        url = 'https://api.sam.gov/prod/opportunity/v1/api/test/resources/download/zip'
+        responses = {
+            'too large': self.attachment_response(b'%PDF-1.4', headers={'Content-Length': '2000'}),
+            'too large to stream': self.attachment_response(b'%PDF-1.4 ' + b'x' * 2000),
+            'video': self.attachment_response(b'\x00\x00\x00\x18ftypmp42' + b'x' * 2000),
+            'not found': self.attachment_response(b'', status=404),
+        }
+        for case, response in responses.items():
+            with self.subTest(case):
+                m_make_attachment_request.return_value = response
+                self.assertEqual(get_docs(dict(resourceLinks=[url]), self.out_path, max_bytes=1000), [])
+                self.assertFalse(os.path.exists(os.path.join(self.out_path, 'test.pdf')))
+                self.assertEqual(
+                    [f for f in os.listdir(self.out_path) if len(f) == 40], [], 'partial download left behind'
+                )
 
     @patch('fbo_scraper.get_opps.get_doc_text')
     def test_get_attachment_data(self, mock_get_doc_text):
@@ -129,6 +306,77 @@ class GetOppsTestCase(unittest.TestCase):
         result = get_attachment_data('test.txt', url)
         expected = mock_opps.mock_attachment_data
         self.assertEqual(result, expected)
+
+    def test_extract_attachment_archive(self):
+        import zipfile
+        archive = os.path.join(self.out_path, 'Attachments.zip')
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('Statement of Work.txt', 'statement of work')
+            z.writestr('Drawings/plan.dwg', b'AC1032' + b'\x00' * 10)
+
+        result = extract_attachment(archive, 'https://sam.gov/files/1/download')
+        self.assertEqual(
+            [(a['filename'], a['url'], a['machine_readable'], a.get('extraction_error')) for a in result],
+            [
+                ('Attachments.zip/Statement of Work.txt', 'https://sam.gov/files/1/download#Statement%20of%20Work.txt', True, None),
+                ('Attachments.zip/Drawings/plan.dwg', 'https://sam.gov/files/1/download#Drawings/plan.dwg', False, 'unsupported type cad'),
+            ],
+        )
+        self.assertEqual(result[0]['text'], 'statement of work')
+        self.assertFalse(os.path.exists(archive))
+
+    def test_get_attachment_data_scanned(self):
+        from fpdf import FPDF
+        from PIL import Image
+        image_path = os.path.join(self.out_path, 'scan.png')
+        Image.new('L', (200, 260), 255).save(image_path)
+        file_name = os.path.join(self.out_path, 'scanned.pdf')
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.image(image_path, x=0, y=0, w=210)
+        pdf.output(file_name, 'F')
+
+        for extract_limits in (None, {'timeout': 30}):
+            with self.subTest(extract_limits=extract_limits):
+                shutil.copy(file_name, file_name + '.copy')
+                result = get_attachment_data(file_name + '.copy', 'test', extract_limits=extract_limits)
+                self.assertEqual(result['text'], '')
+                self.assertFalse(result['machine_readable'])
+                self.assertIn('scanned document', result['extraction_error'])
+
+    def test_get_attachment_data_truncated(self):
+        file_name = os.path.join(self.out_path, 'spec.txt')
+        with open(file_name, 'w') as f:
+            f.write('x' * 1000)
+        result = get_attachment_data(file_name, 'test', extract_limits={'max_chars': 100, 'timeout': None})
+        self.assertEqual(result['text'], 'x' * 100)
+        self.assertTrue(result['truncated'])
+
+    @patch('fbo_scraper.get_opps.get_doc_text_supervised')
+    def test_get_attachment_data_supervised(self, m_get_doc_text_supervised):
+        m_get_doc_text_supervised.return_value = ('', 'extraction timed out after 1 seconds')
+        result = get_attachment_data('test.pdf', 'test', extract_limits={'timeout': 1})
+        m_get_doc_text_supervised.assert_called_once_with('test.pdf', budget=ANY, timeout=1)
+        self.assertFalse(result['machine_readable'])
+        self.assertEqual(result['extraction_error'], 'extraction timed out after 1 seconds')
+        self.assertTrue(result['extraction_failed'])
+
+    def test_store_attachment_data(self):
+        cache = MagicMock()
+        attachments = [
+            make_attachment_data('some text', 'url-1', 'sow.pdf', True),
+            make_attachment_data('', 'url-2', 'plans.pdf', False, extraction_error='extraction timed out after 1 seconds', extraction_failed=True),
+            make_attachment_data('', 'url-3', 'scan.pdf', False, extraction_error='scanned document'),
+        ]
+        store_attachment_data(cache, attachments)
+        # the timed out attachment is extracted again next time, the scan is skipped again
+        self.assertEqual(
+            [c.args + tuple(sorted(c.kwargs.items())) for c in cache.store.call_args_list],
+            [
+                ('url-1', 'some text', True, ('extraction_error', None), ('truncated', False)),
+                ('url-3', '', False, ('extraction_error', 'scanned document'), ('truncated', False)),
+            ],
+        )
     
     @patch('fbo_scraper.get_opps.get_attachment_data')
     @patch('fbo_scraper.get_opps.get_doc_text')    
@@ -144,6 +392,49 @@ class GetOppsTestCase(unittest.TestCase):
         expected = [mock_opps.mock_transformed_opp_one]
         self.assertEqual(result, expected)
 
+    @patch('fbo_scraper.get_opps.make_attachment_request')
+    def test_add_attachment_data_same_filename(self, m_make_attachment_request):
+        # two opportunities with an attachment of the same name
+        bodies = {'url-a': b'first statement of work', 'url-b': b'second statement of work'}
+        m_make_attachment_request.side_effect = lambda url, http, headers=None: self.attachment_response(
+            bodies[url], headers={'Content-Disposition': 'attachment; filename=SOW.txt'}
+        )
+        before = sorted(os.listdir(self.out_path))
+
+        for extract_workers in (1, 2):
+            with self.subTest(extract_workers=extract_workers):
+                opps = [dict(resourceLinks=[url], attachments=[]) for url in bodies]
+                add_attachment_data(opps, self.out_path, extract_workers=extract_workers)
+
+                self.assertEqual(
+                    [[(a['filename'], a['text'], a['machine_readable']) for a in opp['attachments']] for opp in opps],
+                    [[('SOW.txt', 'first statement of work', True)], [('SOW.txt', 'second statement of work', True)]],
+                )
+                # nothing is left behind once the attachments are extracted
+                self.assertEqual(sorted(os.listdir(self.out_path)), before)
+
+    @patch('fbo_scraper.get_opps.get_attachment_data')
+    @patch('fbo_scraper.get_opps.get_docs')
+    def test_transform_opps_pipeline_order(self, m_g_docs, m_g_attachment_data):
+        import time
+        opps = [dict(mock_opps.mock_opp_one[0], solicitationNumber=f'SOL{i}') for i in range(4)]
+
+        # later opps finish downloading first
+        def mock_get_docs(opp, out_path, **kwargs):
+            i = int(opp['solnbr'][3:])
+            time.sleep(0.05 * (4 - i))
+            return [(f'{opp["solnbr"]}-{n}.pdf', f'url-{n}') for n in range(2)]
+        m_g_docs.side_effect = mock_get_docs
+        m_g_attachment_data.side_effect = lambda file_name, url, extract_limits=None: {'filename': file_name, 'url': url}
+
+        result = transform_opps(opps, self.out_path, download_workers=4)
+        self.assertEqual([opp['solnbr'] for opp in result], ['SOL0', 'SOL1', 'SOL2', 'SOL3'])
+        for opp in result:
+            self.assertEqual(
+                [a['filename'] for a in opp['attachments']],
+                [f'{opp["solnbr"]}-0.pdf', f'{opp["solnbr"]}-1.pdf'],
+            )
+
     @patch('fbo_scraper.get_opps.schematize_opp')
     def test_transform_opps_duplicates(self, m_schematize_opp):
         m_schematize_opp.return_value = mock_opps.mock_schematized_solnum_constraint_error[0]
@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.mock_sam_server import MockSamServer, SEARCH_PATH, serve
+from fbo_scraper import request_utils
+from fbo_scraper.get_opps import get_docs, get_opps_for_range, get_opp_from_sam
+
+
+class MockSamServerTestCase(unittest.TestCase):
+    def setUp(self):
+        request_utils.configure_sam_limits()
+        self.out_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        request_utils.close_http_clients()
+        shutil.rmtree(self.out_path)
+
+    def test_get_opps_for_range(self):
+        server = MockSamServer(records_per_day=600, error_rate=0.3, seed=1)
+        with serve(server) as base_url:
+            with patch.dict(os.environ, {"SAM_API_URI": base_url + SEARCH_PATH, "SAM_API_KEY": "test"}):
+                opps = get_opps_for_range(from_date="01/02/2023", to_date="01/03/2023", max_workers=4)
+
+        sol_nums = [opp["solicitationNumber"] for opp in opps]
+        self.assertEqual(len(sol_nums), 1200)
+        self.assertEqual(len(set(sol_nums)), 1200)
+        self.assertEqual(sol_nums[0], "MOCK-20230102-00000")
+        # the failed requests were retried
+        self.assertGreater(server.stats["errors"], 0)
+        self.assertEqual(server.stats["searches"], 4)
+
+    def test_deterministic(self):
+        first, second = MockSamServer(seed=3), MockSamServer(seed=3)
+        params = {"postedFrom": "01/02/2023", "postedTo": "01/02/2023", "limit": "10"}
+        self.assertEqual(first.search(params, "http://localhost"), second.search(params, "http://localhost"))
+        self.assertNotEqual(
+            first.search(params, "http://localhost"),
+            MockSamServer(seed=4).search(params, "http://localhost"),
+        )
+
+    def test_get_docs(self):
+        server = MockSamServer(attachments_per_opp=2, attachment_bytes=1000)
+        with serve(server) as base_url:
+            with patch.dict(os.environ, {"SAM_API_URI": base_url + SEARCH_PATH, "SAM_API_KEY": "test"}):
+                opp = get_opp_from_sam("MOCK-20230102-00007")
+                self.assertIsNone(get_opp_from_sam("MOCK-20230102-99999"))
+                files = get_docs(opp, self.out_path)
+
+        self.assertEqual(
+            [os.path.basename(path) for path, url in files],
+            ["MOCK-20230102-00007 Attachment 0.txt", "MOCK-20230102-00007 Attachment 1.txt"],
+        )
+        self.assertEqual(os.path.getsize(files[0][0]), 1000)
+        self.assertEqual(server.stats["attachments"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,72 @@
 import unittest
 import sys
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from unittest.mock import patch
+
+from nltk.stem.porter import PorterStemmer
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from fbo_scraper.predict import Predict
+from fbo_scraper.predict import Predict, STOP_WORDS, shard_by_size
+from tests import mock_opps
 from tests.mock_opps import mock_transformed_opp_one
 
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def legacy_transform_text(doc):
+    """
+    The original implementation of Predict.transform_text, kept to check that the
+    faster one produces the same output.
+    """
+    no_nonsense_re = re.compile(r"^[a-zA-Z^508]+$")
+    if not isinstance(doc, str):
+        return str(doc).lower()
+    doc = doc.lower()
+    doc = doc.split()
+    words = ""
+    for word in doc:
+        m = re.match(no_nonsense_re, word)
+        if m:
+            match = m.group()
+            if match in STOP_WORDS:
+                continue
+            else:
+                match_len = len(match)
+                if match_len <= 17 and match_len >= 3:
+                    porter = PorterStemmer()
+                    stemmed = porter.stem(match)
+                    words += stemmed + " "
+    words = words.strip()
+
+    return words
+
+
+def fixture_texts():
+    """
+    All of the text in the test fixtures: the strings in the mock opportunities
+    and the contents of the files in the tests directory.
+    """
+    def strings_in(obj):
+        if isinstance(obj, str):
+            yield obj
+        elif isinstance(obj, dict):
+            for value in obj.values():
+                yield from strings_in(value)
+        elif isinstance(obj, (list, tuple)):
+            for value in obj:
+                yield from strings_in(value)
+
+    for name in dir(mock_opps):
+        if name.startswith("mock"):
+            yield from strings_in(getattr(mock_opps, name))
+    for file_name in sorted(glob(os.path.join(TEST_DIR, "**", "*"), recursive=True)):
+        if os.path.isfile(file_name) and not file_name.endswith(".pyc"):
+            with open(file_name, encoding="utf-8", errors="ignore") as f:
+                yield f.read()
+
 
 class PredictTestCase(unittest.TestCase):
     def setUp(self):
@@ -32,6 +93,27 @@ class PredictTestCase(unittest.TestCase):
         expected = "123"
         self.assertEqual(result, expected)
 
+    def test_transform_text_matches_legacy(self):
+        texts = list(fixture_texts())
+        texts.append("Section 508 ACCESSIBILITY; a^b ^508^ 5o8 Procurement procurement's proCUREments")
+        for text in texts:
+            self.assertEqual(self.predict.transform_text(text), legacy_transform_text(text))
+
+    def test_shard_by_size(self):
+        texts = ["a" * 100, "b" * 10, "c" * 60, "d" * 50, "e" * 5]
+        shards = shard_by_size(texts, 2)
+        self.assertEqual(sorted(i for shard in shards for i in shard), list(range(5)))
+        self.assertEqual([sum(len(texts[i]) for i in shard) for shard in shards], [115, 110])
+        self.assertEqual(len(shard_by_size(texts[:1], 4)), 1)
+
+    def test_normalize_texts_with_workers(self):
+        texts = list(fixture_texts())
+        predict = Predict(workers=2, min_pool_chars=0)
+        with patch("fbo_scraper.predict.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as m_pool:
+            self.assertEqual(predict.normalize_texts(texts), [legacy_transform_text(t) for t in texts])
+        # the workers aren't forked from this process, which may have threads holding locks
+        self.assertEqual(m_pool.call_args.kwargs["mp_context"].get_start_method(), "forkserver")
+
     def test_insert_predictions_value_types(self):
         data = self.predict.insert_predictions()
         decision_boundary = data[0]["attachments"][0]["decision_boundary"]
@@ -47,6 +129,34 @@ class PredictTestCase(unittest.TestCase):
         compliant_value = opp["compliant"]
         self.assertIsInstance(compliant_value, int)
 
+    def test_insert_predictions_matches_single_predictions(self):
+        texts = [
+            "This solicitation requires Section 508 accessibility compliance.",
+            "Janitorial services for the regional office building.",
+            "The contractor shall provide a VPAT for all software.",
+        ]
+        data = [
+            {
+                "solnbr": f"sol{i}",
+                "agency": "agency",
+                "attachments": [{"text": text} for text in texts[i:]],
+            }
+            for i in range(len(texts))
+        ]
+        self.predict.insert_predictions(data)
+
+        model = self.predict.predict_model
+        for opp in data:
+            for attachment in opp["attachments"]:
+                normalized_text = [self.predict.transform_text(attachment["text"])]
+                self.assertEqual(attachment["prediction"], int(model.predict(normalized_text)[0]))
+                self.assertAlmostEqual(
+                    attachment["decision_boundary"],
+                    float(abs(model.decision_function(normalized_text)[0])),
+                )
+            expected_compliant = int(any(a["prediction"] == 1 for a in opp["attachments"]))
+            self.assertEqual(opp["compliant"], expected_compliant)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,23 @@
+import json
 import os
 import sys
 import unittest
 import re
+import shutil
+import tempfile
 from logging import WARNING
+from unittest.mock import patch, Mock
 sys.path.append( os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) ) )
-from fbo_scraper.request_utils import requests_retry_session
+from fbo_scraper import request_utils
+from fbo_scraper.request_utils import (
+    requests_retry_session,
+    HttpClients,
+    RateLimiter,
+    QuotaTracker,
+    retry_after_seconds,
+    sam_get,
+)
+from fbo_scraper.sam_utils import recheck_budget
 from fbo_scraper.predict import Predict
 from tests.mock_opps import (
     mock_transformed_opp_bad_attachment,
@@ -51,6 +64,116 @@ class RequestUtilsTestCase(unittest.TestCase):
                     msgFound = True
             self.assertFalse(msgFound)
 
+    @patch("fbo_scraper.request_utils.time")
+    def test_rate_limiter(self, m_time):
+        now = [100.0]
+        m_time.monotonic.side_effect = lambda: now[0]
+        m_time.sleep.side_effect = lambda seconds: now.__setitem__(0, now[0] + seconds)
+
+        limiter = RateLimiter(requests_per_second=2, burst=2)
+        for _ in range(4):
+            limiter.acquire()
+        # the burst is spent straight away, then a token every half second
+        self.assertAlmostEqual(now[0], 101.0)
+
+        limiter.throttled(retry_after=5)
+        self.assertEqual(limiter.rate, 1)
+        limiter.acquire()
+        self.assertAlmostEqual(now[0], 106.0)
+
+        limiter.succeeded()
+        self.assertAlmostEqual(limiter.rate, 1.2)
+
+        # a Retry-After longer than max_retry_after isn't waited for
+        self.assertFalse(limiter.throttled(retry_after=3600))
+        limiter.acquire()
+        self.assertAlmostEqual(now[0], 106.0)
+
+    def test_quota_tracker(self):
+        out_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(out_path, "cache", "sam_quota.json")
+            quota = QuotaTracker(path, daily_limit=10)
+            self.assertEqual(quota.remaining(), 10)
+            quota.record()
+            quota.record({})
+            self.assertEqual(quota.remaining(), 8)
+            # the file is only written every save_interval seconds, and when the run ends
+            self.assertFalse(os.path.exists(path))
+            quota.save()
+
+            # the count carries over to the next run on the same day
+            quota = QuotaTracker(path, daily_limit=10)
+            self.assertEqual(quota.remaining(), 8)
+
+            # SAM.gov's own count wins when it is lower
+            quota.record({"X-RateLimit-Remaining": "3"})
+            self.assertEqual(quota.remaining(), 3)
+
+            quota.day = "2000-01-01"
+            self.assertEqual(quota.remaining(), 10)
+            self.assertIsNone(QuotaTracker().remaining())
+
+            # once save_interval has passed, counting a call writes the file
+            quota = QuotaTracker(path, daily_limit=10, save_interval=0)
+            quota.record()
+            with open(path) as f:
+                self.assertEqual(json.load(f)["used"], 3)
+        finally:
+            shutil.rmtree(out_path)
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(retry_after_seconds({"Retry-After": "7"}), 7)
+        self.assertEqual(retry_after_seconds({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}), 0)
+        self.assertIsNone(retry_after_seconds({}))
+
+    @patch("fbo_scraper.request_utils.time")
+    def test_sam_get_throttled(self, m_time):
+        now = [0.0]
+        m_time.monotonic.side_effect = lambda: now[0]
+        m_time.sleep.side_effect = lambda seconds: now.__setitem__(0, now[0] + seconds)
+        limiter, quota = request_utils.configure_sam_limits(daily_quota=100)
+        throttled = Mock(status_code=429, headers={"Retry-After": "2"})
+        ok = Mock(status_code=200, headers={"X-RateLimit-Remaining": "50"})
+        session = Mock()
+        session.get.side_effect = [throttled, ok]
+        try:
+            r = sam_get(session, "https://api.sam.gov/opportunities/v2/search")
+            self.assertIs(r, ok)
+            self.assertEqual(session.get.call_count, 2)
+            m_time.sleep.assert_called_once_with(2)
+            self.assertEqual(quota.used, 2)
+            self.assertEqual(recheck_budget(quota_reserve=10), 40)
+
+            # once the daily quota is spent, the 429 is returned instead of retried
+            quota_spent = Mock(status_code=429, headers={"Retry-After": "86400"})
+            session.get.side_effect = [quota_spent]
+            self.assertIs(sam_get(session, "https://api.sam.gov/opportunities/v2/search"), quota_spent)
+            m_time.sleep.assert_called_once_with(2)
+        finally:
+            request_utils.configure_sam_limits()
+
+    def test_http_clients(self):
+        clients = HttpClients(pool_maxsize=4)
+        self.assertIs(clients.session(), clients.session())
+        self.assertIs(clients.pool_manager(), clients.pool_manager())
+
+        pool = clients.pool_manager().connection_from_url("https://sam.gov/api/prod/opps/v3/opportunities/resources")
+        self.assertEqual(pool.pool.maxsize, 4)
+        pool.num_requests, pool.num_connections = 5, 2
+        session_pool = clients.session().get_adapter("https://api.sam.gov").poolmanager.connection_from_url(
+            "https://api.sam.gov/opportunities/v2/search"
+        )
+        session_pool.num_requests, session_pool.num_connections = 3, 1
+        self.assertEqual(
+            clients.stats(), {"requests": 8, "connections": 3, "pools": 2, "reused": 5}
+        )
+
+        with self.assertLogs(level="INFO") as logs:
+            clients.close()
+        self.assertTrue(any("8 requests over 3 connections" in msg for msg in logs.output))
+        self.assertEqual(clients.stats()["requests"], 0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,166 @@
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from addict import Addict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fbo_scraper.get_opps import days_between
+from fbo_scraper.run_ledger import RunLedger
+
+
+class RunLedgerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.out_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.out_path, "cache", "run_ledger.json")
+        self.day = datetime.date(2023, 10, 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_path)
+
+    def test_days_between(self):
+        self.assertEqual(
+            days_between("09/30/2023", "10-02-2023"),
+            [datetime.date(2023, 9, 30), datetime.date(2023, 10, 1), datetime.date(2023, 10, 2)],
+        )
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        self.assertEqual(days_between("yesterday", "yesterday"), [yesterday])
+
+    def test_resume(self):
+        ledger = RunLedger(self.path, target_sol_types="o,k")
+        ledger.record_chunk(self.day, ["SOL1", "SOL2"], attachments=3)
+        ledger.complete_day(self.day)
+        ledger.record_chunk(self.day + datetime.timedelta(days=1), ["SOL3"], attachments=1)
+
+        resumed = RunLedger(self.path, target_sol_types="o,k", resume=True)
+        self.assertTrue(resumed.is_complete(self.day))
+        self.assertFalse(resumed.is_complete(self.day + datetime.timedelta(days=1)))
+        self.assertEqual(resumed.committed(self.day + datetime.timedelta(days=1)), {"SOL3"})
+        self.assertEqual(resumed.days[self.day.isoformat()]["attachments"], 3)
+
+        # without --resume, or for other notice types, the run starts over
+        self.assertEqual(RunLedger(self.path, target_sol_types="o,k").days, {})
+        self.assertEqual(RunLedger(self.path, target_sol_types="k", resume=True).days, {})
+
+    @patch("fbo_scraper.main.insert_data_into_solicitations_table")
+    @patch("fbo_scraper.main.AgencyResolver")
+    @patch("fbo_scraper.main.get_opps.iter_transformed_opps")
+    def test_stream_opportunities_resume(self, m_iter_transformed_opps, m_agency_resolver, m_insert):
+        from fbo_scraper.main import stream_opportunities
+
+        first_day = self.day - datetime.timedelta(days=1)
+        ledger = RunLedger(self.path, target_sol_types="o,k")
+        ledger.record_chunk(first_day, ["SOL0"])
+        ledger.complete_day(first_day)
+        ledger.record_chunk(self.day, ["SOL1"], attachments=1)
+
+        m_iter_transformed_opps.return_value = [[{"solnbr": "SOL2", "attachments": [{}, {}]}]]
+        m_insert.side_effect = inserted_solicitations
+        predict = MagicMock()
+        predict.insert_predictions.side_effect = same_opps
+        options = Addict(database=Addict(bulk_insert=True, batch_size=10))
+
+        inserted = stream_opportunities(
+            MagicMock(),
+            predict,
+            options,
+            ledger=RunLedger(self.path, target_sol_types="o,k", resume=True),
+            from_date=first_day,
+            to_date=self.day,
+        )
+
+        self.assertEqual(inserted, 1)
+        # the completed day is skipped, and the interrupted one leaves out what was committed
+        m_iter_transformed_opps.assert_called_once_with(
+            from_date=self.day, to_date=self.day, skip_solicitations={"SOL1"}
+        )
+        resumed = RunLedger(self.path, target_sol_types="o,k", resume=True)
+        self.assertTrue(resumed.is_complete(self.day))
+        self.assertEqual(resumed.committed(self.day), {"SOL1", "SOL2"})
+        self.assertEqual(resumed.days[self.day.isoformat()]["attachments"], 3)
+
+    @patch("fbo_scraper.main.insert_data_into_solicitations_table")
+    @patch("fbo_scraper.main.AgencyResolver")
+    @patch("fbo_scraper.main.get_opps.iter_transformed_opps")
+    def test_stream_opportunities_lost(self, m_iter_transformed_opps, m_agency_resolver, m_insert):
+        from fbo_scraper.main import stream_opportunities
+
+        m_iter_transformed_opps.return_value = [
+            [{"solnbr": "SOL1", "attachments": [{}]}, {"solnbr": "SOL2", "attachments": [{}, {}]}]
+        ]
+        # SOL2 fails to insert
+        m_insert.return_value = [MagicMock(solNum="SOL1")]
+        predict = MagicMock()
+        predict.insert_predictions.side_effect = same_opps
+        options = Addict(database=Addict(bulk_insert=False, batch_size=10))
+
+        inserted = stream_opportunities(
+            MagicMock(),
+            predict,
+            options,
+            ledger=RunLedger(self.path, target_sol_types="o,k"),
+            from_date=self.day,
+            to_date=self.day,
+        )
+
+        self.assertEqual(inserted, 1)
+        resumed = RunLedger(self.path, target_sol_types="o,k", resume=True)
+        self.assertFalse(resumed.is_complete(self.day))
+        self.assertEqual(resumed.committed(self.day), {"SOL1"})
+        self.assertEqual(resumed.days[self.day.isoformat()]["attachments"], 1)
+
+        # nothing to insert for a chunk
+        predict.insert_predictions.side_effect = None
+        predict.insert_predictions.return_value = []
+        next_day = self.day + datetime.timedelta(days=1)
+        ledger = RunLedger(self.path, target_sol_types="o,k")
+        stream_opportunities(MagicMock(), predict, options, ledger=ledger, from_date=next_day, to_date=next_day)
+        self.assertFalse(ledger.is_complete(next_day))
+
+    @patch("fbo_scraper.main.insert_data_into_solicitations_table")
+    @patch("fbo_scraper.main.AgencyResolver")
+    @patch("fbo_scraper.main.get_opps.iter_transformed_opps")
+    def test_stream_opportunities_limit(self, m_iter_transformed_opps, m_agency_resolver, m_insert):
+        from fbo_scraper.main import stream_opportunities
+
+        m_iter_transformed_opps.side_effect = [
+            [[{"solnbr": "SOL1"}, {"solnbr": "SOL2"}]],
+            [[{"solnbr": "SOL3"}]],
+        ]
+        m_insert.side_effect = inserted_solicitations
+        predict = MagicMock()
+        predict.insert_predictions.side_effect = same_opps
+        options = Addict(database=Addict(bulk_insert=False, batch_size=10))
+        ledger = RunLedger(self.path, target_sol_types="o,k")
+
+        inserted = stream_opportunities(
+            MagicMock(),
+            predict,
+            options,
+            ledger=ledger,
+            from_date=self.day,
+            to_date=self.day + datetime.timedelta(days=5),
+            limit=3,
+        )
+
+        # the limit is shared by the days, and the days it cut short can be resumed
+        self.assertEqual(inserted, 3)
+        self.assertEqual([c.kwargs["limit"] for c in m_iter_transformed_opps.call_args_list], [3, 1])
+        self.assertFalse(ledger.is_complete(self.day))
+        self.assertEqual(ledger.committed(self.day + datetime.timedelta(days=1)), {"SOL3"})
+
+
+def same_opps(opps):
+    return opps
+
+
+def inserted_solicitations(session, data, **kwargs):
+    return [MagicMock(solNum=opp["solnbr"]) for opp in data]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,8 @@ import os
 import shutil
 import sys
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, Mock, ANY
+from collections import namedtuple
 import copy
 
 
@@ -12,7 +13,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from tests.test_utils import get_zip_in_memory, get_day_side_effect
 from tests import mock_opps
 from fbo_scraper.sam_utils import (write_zip_content, get_notice_data, get_notice_type,
-                            schematize_opp, naics_filter, get_dates_from_opp, find_yesterdays_opps)
+                            schematize_opp, naics_filter, get_dates_from_opp, find_yesterdays_opps,
+                            update_old_solicitations, select_recheck_candidates, RESPONSE_DEADLINE_PATTERN)
 
 
 class SamUtilsTestCase(unittest.TestCase):
@@ -302,6 +304,74 @@ class SamUtilsTestCase(unittest.TestCase):
         expected = ([], False)
         self.assertEqual(result, expected)
 
+    @patch("fbo_scraper.sam_utils.fetch_notice_type_id")
+    @patch("fbo_scraper.sam_utils.get_opp_from_sam")
+    def test_update_old_solicitations(self, m_get_opp_from_sam, m_fetch_notice_type_id):
+        Row = namedtuple(
+            "Row",
+            "id solNum active noticeType notice_type_id date last_checked_at recheck_count recheck_changes responseDeadLine",
+        )
+        posted = dt(2023, 9, 1)
+        candidates = [
+            Row(14, "UNCHANGED", True, "Solicitation", 1, posted, None, 0, 0, None),
+            Row(28, "GONE", True, "Solicitation", 1, posted, None, 0, 0, None),
+            Row(42, "INACTIVE", True, "Solicitation", 1, posted, None, 0, 0, None),
+            Row(56, "RETYPED", True, "Solicitation", 1, posted, dt(2023, 9, 20), 2, 1, None),
+        ]
+        sam_data = {
+            "UNCHANGED": {"solicitationNumber": "UNCHANGED", "active": "Yes", "type": "Solicitation"},
+            "GONE": None,
+            "INACTIVE": {"solicitationNumber": "INACTIVE", "active": "No", "type": "Solicitation"},
+            "RETYPED": {"solicitationNumber": "RETYPED", "active": "Yes", "type": "Combined Synopsis/Solicitation"},
+        }
+        m_get_opp_from_sam.side_effect = lambda sol_num, session: sam_data[sol_num]
+        m_fetch_notice_type_id.return_value = 2
+        session = Mock()
+        session.execute.return_value.all.return_value = candidates
+
+        stats = update_old_solicitations(session, max_tests=10, max_workers=4)
+
+        self.assertEqual(stats, {"examined": 4, "updated": 3, "total": 4})
+        # the candidates are selected in SQL and every check is written in one UPDATE
+        self.assertEqual(session.execute.call_count, 2)
+        updates = session.execute.call_args[0][1]
+        self.assertEqual(
+            sorted(updates, key=lambda values: values["id"]),
+            [
+                {"id": 14, "active": True, "noticeType": "Solicitation", "notice_type_id": 1,
+                 "last_checked_at": ANY, "recheck_count": 1, "recheck_changes": 0},
+                {"id": 28, "active": False, "noticeType": "Solicitation", "notice_type_id": 1,
+                 "last_checked_at": ANY, "recheck_count": 1, "recheck_changes": 1},
+                {"id": 42, "active": False, "noticeType": "Solicitation", "notice_type_id": 1,
+                 "last_checked_at": ANY, "recheck_count": 1, "recheck_changes": 1},
+                {"id": 56, "active": True, "noticeType": "Combined Synopsis/Solicitation", "notice_type_id": 2,
+                 "last_checked_at": ANY, "recheck_count": 3, "recheck_changes": 2},
+            ],
+        )
+
+    def test_select_recheck_candidates(self):
+        from sqlalchemy.dialects import postgresql
+
+        session = Mock()
+        session.execute.return_value.all.return_value = ["row"]
+        self.assertEqual(select_recheck_candidates(session, max_tests=2), ["row"])
+
+        # ranked and limited in the database
+        sql = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+        self.assertIn("ORDER BY", sql)
+        self.assertIn("LIMIT", sql)
+
+        select_recheck_candidates(session)
+        self.assertNotIn("LIMIT", str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect())))
+
+    def test_response_deadline_pattern(self):
+        import re
+
+        for deadline in ("2023-10-03T17:00:00-04:00", "2023-10-03", "2023-10-03T17:00", "2023-10-03T17:00:00.5Z"):
+            self.assertTrue(re.match(RESPONSE_DEADLINE_PATTERN, deadline), deadline)
+        # anything the cast would fail on is left out
+        for deadline in ("soon", "", "2023-02-30", "2023-13-01", "2023-10-03T25:00:00", "2023-10-03 and later"):
+            self.assertFalse(re.match(RESPONSE_DEADLINE_PATTERN, deadline), deadline)
 
 if __name__ == "__main__":
     unittest.main()